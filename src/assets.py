@@ -0,0 +1,95 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from os import path
+import pygame as pg
+from settings import *
+
+
+def get_image_manifest():
+    # every image the first frame needs
+    return [PLAYER_IMG, BULLET_IMG, MOB_IMG, SPLAT, LIGHT_MASK, *MUZZLE_FLASHES] + list(
+        ITEM_IMAGES.values()
+    )
+
+
+def get_sound_manifest():
+    # sounds that can play on the first frame; moans and music are loaded lazily
+    sounds = list(EFFECTS_SOUNDS.values()) + PLAYER_HIT_SOUNDS + ZOMBIE_HIT_SOUNDS
+    for weapon_sounds in WEAPON_SOUNDS.values():
+        sounds += weapon_sounds
+    return sounds
+
+
+class AssetManager:
+    # Loads the files listed in settings.py in the background. Reading and
+    # decoding happens on a thread pool (pygame lets go of the GIL while SDL
+    # decodes), anything that needs the display (convert_alpha) is done on the
+    # main thread in poll(), which the game calls once per frame.
+    def __init__(self, game_folder, workers=ASSET_WORKERS):
+        self.img_folder = path.join(game_folder, "img")
+        self.snd_folder = path.join(game_folder, "snd")
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix="assets")
+        self.images: dict[str, pg.Surface] = {}
+        self.sounds: dict[str, pg.mixer.Sound] = {}
+        self.pending: list[tuple[Future, str, str, object]] = []
+        self.total = 0
+        self.ready = 0
+
+    def load_image(self, filename, on_ready=None):
+        future = self.executor.submit(pg.image.load, path.join(self.img_folder, filename))
+        self.pending.append((future, "image", filename, on_ready))
+        self.total += 1
+
+    def load_sound(self, filename, on_ready=None):
+        future = self.executor.submit(pg.mixer.Sound, path.join(self.snd_folder, filename))
+        self.pending.append((future, "sound", filename, on_ready))
+        self.total += 1
+
+    def load_manifest(self):
+        for filename in get_image_manifest():
+            self.load_image(filename)
+        for filename in get_sound_manifest():
+            self.load_sound(filename)
+
+    def poll(self):
+        # picks up whatever finished decoding since the last call
+        if not self.pending:
+            return
+        still_pending = []
+        for item in self.pending:
+            future, kind, filename, on_ready = item
+            if not future.done():
+                still_pending.append(item)
+                continue
+            asset = future.result()
+            if kind == "image":
+                asset = asset.convert_alpha()
+                self.images[filename] = asset
+            else:
+                self.sounds[filename] = asset
+            self.ready += 1
+            if on_ready is not None:
+                on_ready(asset)
+        self.pending = still_pending
+
+    def wait(self):
+        for future, *_ in self.pending:
+            future.result()
+        self.poll()
+
+    def close(self):
+        # don't hold up quitting for files nobody is going to use
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def is_done(self):
+        return not self.pending
+
+    def get_progress(self):
+        if self.total == 0:
+            return 1.0
+        return self.ready / self.total
+
+    def get_image(self, filename) -> pg.Surface:
+        return self.images[filename]
+
+    def get_sound(self, filename) -> pg.mixer.Sound:
+        return self.sounds[filename]
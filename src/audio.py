@@ -0,0 +1,125 @@
+import math
+import pygame as pg
+from settings import *
+
+
+class Voices:
+    # Every sound effect goes through here instead of Sound.play(). Requests
+    # are collected during the frame and played in update():
+    # - each category (weapons, mobs, ...) owns a fixed set of mixer channels,
+    #   so a horde can't take the channels the player's gun and the UI need
+    # - the same sound requested several times in a frame plays once
+    # - requests are ranked by priority, then by distance to the middle of the
+    #   view; when a category runs out of channels the least important sound
+    #   (playing or requested) is the one left out
+    # - positional sounds too far outside the view are skipped, the others are
+    #   panned and fade with distance
+    def __init__(self, categories=AUDIO_CATEGORIES):
+        pg.mixer.set_num_channels(sum(categories.values()))
+        self.channels: dict[str, list[pg.mixer.Channel]] = {}
+        first = 0
+        for category, count in categories.items():
+            self.channels[category] = [
+                pg.mixer.Channel(i) for i in range(first, first + count)
+            ]
+            first += count
+        # priority of what each channel was last asked to play
+        self.priorities: dict[pg.mixer.Channel, int] = {}
+        self.requests: dict[tuple, tuple] = {}
+        self.played = 0
+        self.merged = 0
+        self.culled = 0
+        self.dropped = 0
+
+    def play(self, sound: pg.mixer.Sound, category, priority=0, pos=None):
+        # pos: world pixels at sf == 1, or None for sounds that aren't anywhere
+        key = (category, sound)
+        request = self.requests.get(key)
+        if request is None:
+            self.requests[key] = (priority, [pos])
+            return
+        # played once, from wherever is closest to the view (see update)
+        self.merged += 1
+        self.requests[key] = (max(priority, request[0]), request[1] + [pos])
+
+    def get_busy_priority(self, channel: pg.mixer.Channel):
+        if not channel.get_busy():
+            return None
+        return self.priorities.get(channel, 0)
+
+    def get_distance(self, pos, view: pg.Rect):
+        if pos is None:
+            return 0.0
+        return math.hypot(pos[0] - view.centerx, pos[1] - view.centery)
+
+    def get_volume(self, pos, view: pg.Rect):
+        # (left, right), or None when the sound is too far away to bother
+        if pos is None:
+            return 1.0, 1.0
+        x, y = pos
+        margin = AUDIO_CULL_MARGIN
+        if not view.inflate(margin * 2, margin * 2).collidepoint(x, y):
+            return None
+        cx, cy = view.center
+        # full volume on screen, fading to AUDIO_MIN_VOLUME at the cull margin
+        outside = math.hypot(
+            max(0, abs(x - cx) - view.width / 2), max(0, abs(y - cy) - view.height / 2)
+        )
+        volume = 1 - (1 - AUDIO_MIN_VOLUME) * min(1.0, outside / margin)
+        pan = max(-1.0, min(1.0, (x - cx) / (view.width / 2 + margin)))
+        left = volume * min(1.0, 1 - pan * AUDIO_PAN)
+        right = volume * min(1.0, 1 + pan * AUDIO_PAN)
+        return left, right
+
+    def update(self, view: pg.Rect):
+        # view: what's on screen, in world pixels at sf == 1
+        if not self.requests:
+            return
+        ranked: dict[str, list] = {}
+        for (category, sound), (priority, positions) in self.requests.items():
+            pos = min(positions, key=lambda pos: self.get_distance(pos, view))
+            distance = self.get_distance(pos, view)
+            volume = self.get_volume(pos, view)
+            if volume is None:
+                self.culled += 1
+                continue
+            ranked.setdefault(category, []).append((-priority, distance, sound, volume))
+        self.requests.clear()
+
+        for category, requests in ranked.items():
+            requests.sort(key=lambda request: request[:2])
+            channels = self.channels[category]
+            for neg_priority, _, sound, (left, right) in requests:
+                priority = -neg_priority
+                channel = self.find_channel(channels, priority)
+                if channel is None:
+                    # the category's channels all play something more important
+                    self.dropped += 1
+                    continue
+                channel.play(sound)
+                channel.set_volume(left, right)
+                self.priorities[channel] = priority
+                self.played += 1
+
+    def find_channel(self, channels, priority):
+        # a free channel, else the one playing the least important sound, if
+        # that's less important than this one
+        lowest = None
+        lowest_priority = None
+        for channel in channels:
+            busy = self.get_busy_priority(channel)
+            if busy is None:
+                return channel
+            if lowest_priority is None or busy < lowest_priority:
+                lowest, lowest_priority = channel, busy
+        if lowest_priority is not None and lowest_priority < priority:
+            return lowest
+        return None
+
+    def get_stats(self):
+        return {
+            "played": self.played,
+            "merged": self.merged,
+            "culled": self.culled,
+            "dropped": self.dropped,
+        }
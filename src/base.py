@@ -1,5 +1,9 @@
+import math
 import pygame as pg
 from typing import Tuple, TypeVar, List, Iterable
+from settings import *
+from imagecache import transform_cache
+from spatial import SpatialGroup, groupcollide
 
 vec = pg.math.Vector2
 Coordinate = Tuple[int, int]
@@ -9,16 +13,32 @@ T = TypeVar("T")
 
 
 def sprite_collision(sprite, group: Iterable[T], dokill, collided=None) -> List[T]:
+    if isinstance(group, SpatialGroup):
+        return group.spritecollide(sprite, dokill, collided)
     result = pg.sprite.spritecollide(sprite, group, dokill, collided=collided)  # type: ignore
     return result
 
 
+def sprite_collision_any(sprite, group: Iterable[T], collided=None) -> T | None:
+    if isinstance(group, SpatialGroup):
+        return group.spritecollideany(sprite, collided)
+    return pg.sprite.spritecollideany(sprite, group, collided)  # type: ignore
+
+
+def group_collision(groupa, groupb, dokilla, dokillb, collided=None) -> dict:
+    return groupcollide(groupa, groupb, dokilla, dokillb, collided)
+
+
 class Zoom:
     def __init__(self):
         self.base_scale = 64
         self.zoom_factor = 0
         self.max_zoom_in = 2  # cap to 2x zoom in
         self.max_zoom_out = -4  # cap to 4x zoom out
+        # zoom_factor eases towards target_factor (see update), sf follows it, so
+        # it's usually not a power of two while zooming
+        self.target_factor = 0
+        self.anchor = (0, 0)  # screen point that stays put while zooming
         self.calculate_sf()
 
     def calculate_sf(self):
@@ -39,17 +59,34 @@ class Zoom:
         elif self.zoom_factor < self.max_zoom_out:
             self.zoom_factor = self.max_zoom_out
 
-        self.sf: int = 2**self.zoom_factor
+        self.sf: float = 2**self.zoom_factor
 
-    def reset(self):
-        self.zoom_factor = 0
+    def set_target(self, factor, x, y):
+        self.target_factor = min(self.max_zoom_in, max(self.max_zoom_out, factor))
+        self.anchor = (x, y)
+
+    def reset(self, x=0, y=0):
+        self.set_target(0, x, y)
 
     def zoom_in(self, x, y):
-        self.zoom_factor += 1
-        self.calculate_sf()
+        self.set_target(self.target_factor + ZOOM_STEP, x, y)
 
     def zoom_out(self, x, y):
-        self.zoom_factor -= 1
+        self.set_target(self.target_factor - ZOOM_STEP, x, y)
+
+    def is_settled(self):
+        return self.zoom_factor == self.target_factor
+
+    def get_image_sf(self):
+        # the scale sprite images are made at: sf once the zoom has settled,
+        # the nearest mip level while it's moving (scaled the rest of the way
+        # when blitted), so the transform cache doesn't fill up with scales
+        # that are only on screen for one frame
+        return self.sf if self.is_settled() else self.get_level()
+
+    def set_zoom_factor(self, factor):
+        # jump straight there, no transition
+        self.zoom_factor = self.target_factor = factor
         self.calculate_sf()
 
     def scale_image(self, img: pg.Surface):
@@ -58,11 +95,32 @@ class Zoom:
         h *= self.sf
         return pg.transform.scale(img, (w, h))
 
-    def update(self, *args, **kwargs) -> None:
-        pass
+    def update(self, dt) -> bool:
+        # eases zoom_factor towards the target, returns True if sf changed
+        if self.zoom_factor == self.target_factor:
+            return False
+        diff = self.target_factor - self.zoom_factor
+        if ZOOM_SMOOTHING <= 0 or abs(diff) < 0.01:
+            self.zoom_factor = self.target_factor
+        else:
+            self.zoom_factor += diff * (1 - math.exp(-dt / ZOOM_SMOOTHING))
+        self.calculate_sf()
+        return True
+
+    def get_level(self, sf=None):
+        # the mip level (power of two scale) sf gets drawn from. Zoomed out it's
+        # the closest one in log space, so the residual scale stays within
+        # 1/sqrt(2) .. sqrt(2); zoomed in it's the one below, scaled up nearest
+        # neighbour like the tiles themselves, which looks the same and keeps the
+        # big zoomed in chunks out of the transition
+        if sf is None:
+            sf = self.sf
+        log = math.log2(sf)
+        level = math.floor(log + 1e-9) if log > 0 else round(log)
+        return 2 ** min(self.max_zoom_in, max(self.max_zoom_out, level))
 
     def get_tile_size(self):
-        return int(self.base_scale * self.sf)
+        return self.base_scale * self.sf
 
     def get_linear_update(self, base_value, inverse=False):
         # return base_value
@@ -98,8 +156,13 @@ class Zoom:
 
 
 class Shape(pg.sprite.Sprite):
+    # False while the shape is off-screen (Game.update_visibility): it keeps
+    # simulating, but doesn't have to look right
+    visible = True
+
     def __init__(self, *args, **kwargs) -> None:
         # super().__init__(*args, **kwargs)
+        pg.sprite.Sprite.__init__(self)  # groups are joined by the subclasses
 
         self.game = kwargs["game"]
         self.zoom: Zoom = kwargs["zoom"]
@@ -115,37 +178,59 @@ class Shape(pg.sprite.Sprite):
     def vec_to_center(self, vec):
         x, y = vec
         self.rect.center = (int(x), int(y))
+        self.moved()
+
+    def moved(self):
+        # keep the spatial index of every group this shape is in up to date
+        for group in self.groups():
+            if isinstance(group, SpatialGroup):
+                group.move(self)
 
     def get_scaled_2tuple(self, attr):
         return (
             self.zoom.get_new_val_from_scale(
                 getattr(self, attr)[0],
                 self.zoom.base_scale,
-                int(self.zoom.base_scale * self.zoom.sf),
+                self.zoom.get_tile_size(),
             ),
             self.zoom.get_new_val_from_scale(
                 getattr(self, attr)[1],
                 self.zoom.base_scale,
-                int(self.zoom.base_scale * self.zoom.sf),
+                self.zoom.get_tile_size(),
             ),
         )
 
     def get_pos(self, offset=False):
         current_tile_size = self.zoom.get_tile_size()
-        return (
-            vec(*self.get_scaled_2tuple("start_grid"))
-            * (current_tile_size * (1 / self.zoom.sf))
-        ) + (
+        return vec(self.start_grid) * current_tile_size + (
             vec(current_tile_size // 2, current_tile_size // 2) if offset else vec(0, 0)
         )
 
+    def get_world_center(self):
+        # center of the shape's tile in world pixels at sf == 1 (where decals,
+        # lights and sounds live)
+        x, y = self.start_grid
+        return (x + 0.5) * TILESIZE, (y + 0.5) * TILESIZE
+
+    def get_tile(self):
+        # grid tile the shape's center is on (start_grid can be fractional while moving)
+        x, y = self.start_grid
+        return math.floor(x + 0.5), math.floor(y + 0.5)
+
     # TODO: add a method that makes sure that the shape is centered in its respective grid tile when not moving
 
     def update(self):
         ...
 
+    def rescale(self, ratio):
+        # the zoom changed by ratio (new sf / old sf): refresh whatever depends on
+        # it without moving the shape through the world
+        ...
+
 
 class Entity(Shape):
+    image_key = None  # (source image, sf) self.image was made for
+
     def __init__(self, *args, **kwargs) -> None:
         super().__init__(*args, **kwargs)
 
@@ -162,26 +247,73 @@ class Entity(Shape):
         self.entity_update(kwargs.get("relative", False))
 
     def get_image(self):
-        (w, h) = self.zoom.get_new_size_from_scale(
-            self.base_image,
-            self.zoom.base_scale,
-            int(self.zoom.base_scale * self.zoom.sf),
-        )
-        return pg.transform.scale(self.base_image.copy(), (w, h))
+        # shared with every other entity using the same base image: don't draw on it
+        return transform_cache.get(self.base_image, self.zoom.get_image_sf(), self.rot)
+
+    def get_rect(self):
+        # the size of the image at sf and the current angle, worked out rather
+        # than read off self.image, which can be from another angle (off-screen)
+        # or zoom level (mid-zoom)
+        size = transform_cache.get_size(self.base_image, self.zoom.sf, self.rot)
+        return pg.Rect((0, 0), size)
+
+    def get_blit_image(self, rect: pg.Rect):
+        # mid-zoom the image is from the nearest mip level (see
+        # Zoom.get_image_sf), it's scaled to the rect here instead of cached
+        if self.image.get_size() == rect.size:
+            return self.image
+        return pg.transform.scale(self.image, rect.size)
 
     def entity_update(self, relative: bool = False) -> None:
-        self.image = pg.transform.rotate(self.get_image(), self.rot)
+        # off-screen, only a new source image or zoom needs a new image, turning
+        # to a new angle can wait; the rect (and the collision box) is always
+        # for the current angle, see get_rect
+        image_key = (self.base_image, self.zoom.get_image_sf())
+        if self.visible or image_key != self.image_key:
+            self.image = self.get_image()
+            self.image_key = image_key
 
         x, y = self.get_pos(offset=True)
 
-        self.rect = self.image.get_rect()
+        self.rect = self.get_rect()
         self.rect.center = (int(x), int(y))
         self.hit_rect = self.rect
         # self.hit_rect.center = self.rect.center
+        self.moved()
 
     def update(self) -> None:
         self.entity_update()
 
+    def rescale(self, ratio):
+        self.entity_update()
+
+    def respawn(self):
+        # this is a copy of an entity from a level snapshot (snapshot.py):
+        # redo whatever the constructor picks per instance
+        ...
+
+    def rescale_center(self, ratio):
+        # for entities placed in zoomed pixels rather than on the grid
+        center = vec(self.rect.center) * ratio
+        self.image = self.get_image()
+        self.image_key = (self.base_image, self.zoom.get_image_sf())
+        self.rect = self.get_rect()
+        self.hit_rect = self.rect
+        self.vec_to_center(center)
+
+    def draw(self, surface: pg.Surface, rect: pg.Rect) -> None:
+        surface.blit(self.get_blit_image(rect), rect)
+        self.draw_overlay(surface, rect)
+
+    def draw_overlay(self, surface: pg.Surface, rect: pg.Rect) -> None:
+        # anything specific to this entity (health bar, ...) goes on top of the
+        # shared image here instead of being painted into it
+        ...
+
+    def get_draw_state(self):
+        # changes whenever the drawn pixels change without the rect moving
+        return self.image
+
 
 class MotionEntity(Entity):
     def __init__(self, *args, **kwargs) -> None:
@@ -202,8 +334,35 @@ class MotionEntity(Entity):
     # ex: 0,0 to 3,4 ->| 0,0 > 1,1 > 2,2 > 3,3 > 3,4
     # perform the movements in that order. Recalculate every few moves to see if the terrain has changed
 
-    def move_to(self, target):
-        ...
+    # v0.2 motion:
+    # pathfinding is shared through the game's flow field (see flowfield.py): one search
+    # from the target's tile, recomputed only when the target changes tile or the walls
+    # change, and every entity just looks up which neighbouring tile to head for
+
+    def move_to(self, target, speed):
+        flow = self.game.flow_field
+        tx, ty = self.get_tile()
+        if flow.target != target.get_tile():
+            # the field leads somewhere else, head straight for the target
+            direction = target.start_grid - self.start_grid
+        elif flow.distance_at(tx, ty) == 0:
+            direction = target.start_grid - self.start_grid
+        elif flow.distance_at(tx, ty) == math.inf:
+            # no way to get there
+            direction = vec(0, 0)
+        else:
+            dx, dy = flow.direction_at(tx, ty)
+            # aim for the center of the next tile along the field
+            direction = vec(tx + dx, ty + dy) - self.start_grid
+        if direction.length_squared() > 0:
+            self.vel = direction.normalize() * speed
+            self.rot = self.vel.angle_to(vec(1, 0))
+        else:
+            self.vel = vec(0, 0)
+
+    def move(self, dt):
+        # vel is in pixels per second at sf == 1, start_grid is in tiles
+        self.start_grid += self.vel * dt / self.zoom.base_scale
 
     def displace(self, displacement_vector: vec):
         # move along vector (direct control)
@@ -227,6 +386,10 @@ class Block(Shape):
         _x, _y = self.get_pos()
         self.rect: pg.rect.Rect = pg.Rect(_x, _y, *self.get_size())
         self.hit_rect: pg.rect.Rect = self.rect
+        self.moved()
 
     def update(self) -> None:
         self.block_update()
+
+    def rescale(self, ratio):
+        self.block_update()
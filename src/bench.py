@@ -0,0 +1,236 @@
+# Headless benchmark: runs the game without a window (SDL dummy drivers),
+# replays a scripted input timeline and reports how long events / update /
+# draw took per frame.
+#
+#   python src/bench.py --map level1.tmx --frames 600 --script fight.json
+#
+# --record writes the run's input and seed to an input log (replay.py),
+# --replay plays one back (recorded here or in the game), so the same fight can
+# be timed on different builds; the checksum printed at the end tells whether
+# the replay ended up where the recording did.
+import argparse
+import json
+import os
+import sys
+import time
+from os import path
+
+DEFAULT_SCRIPT = [
+    {"frame": 0, "hold": ["space"]},
+    {"frame": 30, "hold": ["d"]},
+    {"frame": 60, "wheel": "out", "pos": [512, 384]},
+    {"frame": 90, "release": ["d"], "hold": ["s"]},
+    {"frame": 120, "wheel": "out", "pos": [512, 384]},
+    {"frame": 150, "release": ["s"]},
+    {"frame": 180, "wheel": "in", "pos": [300, 200]},
+    {"frame": 240, "wheel": "in", "pos": [300, 200]},
+    {"frame": 270, "wheel": "in", "pos": [700, 500]},
+    {"frame": 330, "wheel": "out", "pos": [700, 500]},
+]
+PHASES = ["events", "update", "draw"]
+PERCENTILES = [50, 90, 95, 99]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the game headless and time it")
+    parser.add_argument("--map", default="level1.tmx", help="map file in src/maps")
+    parser.add_argument("--frames", type=int, default=600)
+    parser.add_argument("--warmup", type=int, default=30, help="frames left out of the stats")
+    parser.add_argument("--script", help="JSON input timeline (see inputs.ScriptedInput)")
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--trace", help="record profiler spans and write a Chrome trace here")
+    parser.add_argument("--night", action="store_true", help="play with night mode on")
+    parser.add_argument(
+        "--lamps", type=int, default=0, help="scatter this many extra lamps (with --night)"
+    )
+    parser.add_argument("--mobs", type=int, default=0, help="scatter this many extra mobs")
+    parser.add_argument(
+        "--parallel", action="store_true", help="run the mob AI in worker processes"
+    )
+    parser.add_argument("--record", help="write the input log of this run here")
+    parser.add_argument(
+        "--replay", help="play this input log back (map, options and frames come from it)"
+    )
+    parser.add_argument("--seed", type=int, default=0, help="random seed (with --record)")
+    parser.add_argument("--list-maps", action="store_true")
+    return parser.parse_args(argv)
+
+
+def summarize(samples):
+    import numpy as np
+
+    ms = np.asarray(samples) * 1000
+    if len(ms) == 0:
+        return {}
+    stats = {"mean": float(ms.mean()), "max": float(ms.max())}
+    for p in PERCENTILES:
+        stats["p{}".format(p)] = float(np.percentile(ms, p))
+    return stats
+
+
+def setup_night(g, args):
+    # lamps go on random open tiles, the same ones every run
+    import numpy as np
+    from settings import LAMP_LIGHT_COLOR, LAMP_LIGHT_RADIUS, TILESIZE
+
+    g.night = args.night
+    rng = np.random.default_rng(0)
+    rows, cols = np.nonzero(~g.wall_grid.solid)
+    for i in rng.choice(len(rows), min(args.lamps, len(rows)), replace=False):
+        x, y = (cols[i] + 0.5) * TILESIZE, (rows[i] + 0.5) * TILESIZE
+        g.lighting.add(x, y, LAMP_LIGHT_RADIUS, LAMP_LIGHT_COLOR)
+
+
+def add_mobs(g, args):
+    # extra mobs on random open tiles, the same ones every run
+    import numpy as np
+    from sprites import Mob, vec
+
+    rng = np.random.default_rng(1)
+    rows, cols = np.nonzero(~g.wall_grid.solid)
+    for i in rng.choice(len(rows), min(args.mobs, len(rows)), replace=True):
+        Mob(g, vec(int(cols[i]), int(rows[i])), g.zoom)
+
+
+def run(args):
+    # the dummy drivers have to be picked before pygame is initialised
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    from main import Game
+    from inputs import ScriptedInput
+    from replay import InputLog, RecordingInput, ReplayInput, get_checksum, start
+    from settings import TICK_RATE
+
+    script = DEFAULT_SCRIPT
+    if args.script:
+        with open(args.script) as f:
+            script = json.load(f)
+
+    g = Game()
+    if args.parallel:
+        from parallel import ParallelMobAI
+
+        g.mob_ai = ParallelMobAI()
+    g.input = ScriptedInput(script)
+    # one simulation tick per frame, so every frame does the same amount of work
+    g.fixed_timestep = False
+    g.dt = 1 / TICK_RATE
+    if args.replay:
+        log = InputLog.load(args.replay)
+        # the log knows what it was recorded with
+        for option, value in log.meta.items():
+            setattr(args, option, value)
+        args.frames = len(log.frames) - args.warmup
+        g.input = ReplayInput(log)
+        g.fixed_timestep = log.fixed_timestep
+        start(g, log.seed)
+    elif args.record:
+        options = {
+            "map": args.map,
+            "night": args.night,
+            "lamps": args.lamps,
+            "mobs": args.mobs,
+        }
+        log = InputLog(args.seed, g.dt, g.fixed_timestep, options)
+        g.input = RecordingInput(g.input, log)
+        start(g, args.seed)
+    g.new(args.map)
+    g.playing = True
+    setup_night(g, args)
+    add_mobs(g, args)
+    if args.trace:
+        g.profiler.toggle()
+
+    timings = {phase: [] for phase in PHASES}
+    restarts = 0
+    started = time.perf_counter()
+    for frame in range(args.frames + args.warmup):
+        t0 = time.perf_counter()
+        frame_time = g.input.get_frame_time(1 / TICK_RATE)
+        g.assets.poll()
+        g.events()
+        g.update_zoom(frame_time)
+        t1 = time.perf_counter()
+        if g.fixed_timestep:
+            g.step(frame_time)
+        else:
+            g.dt = frame_time
+            if not g.paused:
+                g.update()
+        t2 = time.perf_counter()
+        g.draw()
+        t3 = time.perf_counter()
+        if frame >= args.warmup:
+            timings["events"].append(t1 - t0)
+            timings["update"].append(t2 - t1)
+            timings["draw"].append(t3 - t2)
+        g.input.advance()
+        if not g.playing:
+            # game over: start the level again and keep going
+            restarts += 1
+            g.new(args.map)
+            g.playing = True
+            setup_night(g, args)
+            add_mobs(g, args)
+    elapsed = time.perf_counter() - started
+    if args.record:
+        print("input log written to", log.save(args.record))
+    if g.mob_ai is not None:
+        g.mob_ai.close()
+    if args.trace:
+        g.profiler.export_chrome_trace(args.trace)
+
+    frame_times = [sum(parts) for parts in zip(*timings.values())]
+    return {
+        "map": args.map,
+        "frames": args.frames,
+        "restarts": restarts,
+        "fps": (args.frames + args.warmup) / elapsed,
+        "phases": {phase: summarize(timings[phase]) for phase in PHASES},
+        "frame": summarize(frame_times),
+        "checksum": get_checksum(g),
+        # of the last level, new() starts the pools over
+        "pools": g.get_pool_stats(),
+    }
+
+
+def print_report(result):
+    columns = ["mean"] + ["p{}".format(p) for p in PERCENTILES] + ["max"]
+    print(
+        "map: {map}  frames: {frames}  restarts: {restarts}  fps: {fps:.1f}".format(
+            **result
+        )
+    )
+    print("checksum: {}".format(result["checksum"]))
+    for name, stats in result["pools"].items():
+        print(
+            "{} pool: in use {in_use}  free {free}  high water {high_water}  "
+            "created {created}  reused {reused}".format(name, **stats)
+        )
+    print("{:<8}".format("ms") + "".join("{:>9}".format(c) for c in columns))
+    rows = list(result["phases"].items()) + [("frame", result["frame"])]
+    for name, stats in rows:
+        print(
+            "{:<8}".format(name)
+            + "".join("{:>9.3f}".format(stats.get(c, 0)) for c in columns)
+        )
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.list_maps:
+        maps_folder = path.join(path.dirname(__file__), "maps")
+        for name in sorted(os.listdir(maps_folder)):
+            if name.endswith(".tmx"):
+                print(name)
+        return 0
+    result = run(args)
+    print_report(result)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,300 @@
+import math
+from abc import ABC, abstractmethod
+import pygame as pg
+import numpy as np
+from collections import OrderedDict
+from settings import *
+from base import Zoom
+
+
+class ChunkCache(ABC):
+    # The world is split into square chunks that are roughly CHUNK_SIZE screen
+    # pixels wide at every zoom level (so zooming out means fewer, bigger chunks
+    # in world space). Chunks are only rendered once they come into view, and
+    # each zoom level keeps its own bounded LRU of rendered chunks. Levels are
+    # powers of two (Zoom.get_level); zooms in between are scaled from the
+    # nearest level when drawn, unless exact_levels is set and the zoom isn't
+    # moving.
+    exact_levels = False  # one level per sf, for line art that can't be resampled
+    colorkey = None  # transparent color of the chunks, if they're colorkeyed
+
+    def __init__(
+        self, width, height, zoom: Zoom, max_chunks=CHUNK_CACHE_SIZE, max_levels=None
+    ):
+        # width / height are in world pixels at sf == 1
+        self.width = width
+        self.height = height
+        self.zoom = zoom
+        self.max_chunks = max_chunks
+        self.max_levels = max_levels
+        self.levels: OrderedDict[float, OrderedDict] = OrderedDict()
+        self.scratch: pg.Surface | None = None
+
+    def get_chunk_span(self, sf):
+        # world pixels (at sf == 1) covered by one side of a chunk
+        tiles = max(1, int(CHUNK_SIZE / (TILESIZE * sf)))
+        return tiles * TILESIZE
+
+    def get_grid_size(self, sf):
+        span = self.get_chunk_span(sf)
+        return math.ceil(self.width / span), math.ceil(self.height / span)
+
+    def get_chunk_rect(self, sf, cx, cy):
+        # screen-space (zoomed world) rect of a chunk, edges are rounded
+        # independently so neighbouring chunks never leave a gap
+        span = self.get_chunk_span(sf)
+        x0 = round(cx * span * sf)
+        y0 = round(cy * span * sf)
+        x1 = round(min((cx + 1) * span, self.width) * sf)
+        y1 = round(min((cy + 1) * span, self.height) * sf)
+        return pg.Rect(x0, y0, max(1, x1 - x0), max(1, y1 - y0))
+
+    def get_world_rect(self, sf, cx, cy):
+        # world rect (sf == 1) of a chunk
+        span = self.get_chunk_span(sf)
+        x, y = cx * span, cy * span
+        return pg.Rect(x, y, min(span, self.width - x), min(span, self.height - y))
+
+    def get_visible_chunks(self, view: pg.Rect, sf):
+        # view is the visible part of the zoomed world
+        span = self.get_chunk_span(sf) * sf
+        cols, rows = self.get_grid_size(sf)
+        first_x = max(0, int(view.left // span))
+        first_y = max(0, int(view.top // span))
+        last_x = min(cols - 1, int((view.right - 1) // span))
+        last_y = min(rows - 1, int((view.bottom - 1) // span))
+        return [
+            (cx, cy)
+            for cy in range(first_y, last_y + 1)
+            for cx in range(first_x, last_x + 1)
+        ]
+
+    def get_level(self, sf):
+        level = self.levels.get(sf)
+        if level is None:
+            level = self.levels[sf] = OrderedDict()
+            if self.max_levels is not None:
+                while len(self.levels) > self.max_levels:
+                    self.levels.popitem(last=False)
+        else:
+            self.levels.move_to_end(sf)
+        return level
+
+    def get_chunk(self, sf, cx, cy, capacity=None):
+        level = self.get_level(sf)
+        chunk = level.get((cx, cy))
+        if chunk is not None:
+            level.move_to_end((cx, cy))
+            return chunk
+        chunk = self.render_chunk(sf, cx, cy)
+        level[(cx, cy)] = chunk
+        capacity = max(self.max_chunks, capacity or 0)
+        while len(level) > capacity:
+            level.popitem(last=False)
+        return chunk
+
+    @abstractmethod
+    def render_chunk(self, sf, cx, cy) -> pg.Surface:
+        # a new surface with what's in chunk (cx, cy) at sf, get_chunk_rect sized
+        ...
+
+    def invalidate(self, world_rect: pg.Rect | None = None):
+        # drop rendered chunks (all of them, or only the ones touching world_rect)
+        if world_rect is None:
+            self.levels.clear()
+            return
+        for sf, level in self.levels.items():
+            for key in list(level):
+                if self.get_world_rect(sf, *key).colliderect(world_rect):
+                    del level[key]
+
+    def get_view(self, surface: pg.Surface, camera):
+        x, y = camera.camera.topleft
+        return pg.Rect(-x, -y, surface.get_width(), surface.get_height())
+
+    def get_scratch(self, size):
+        # one surface for composing fractional zoom frames, grown when needed
+        w, h = size
+        if self.scratch is None or w > self.scratch.get_width() or h > self.scratch.get_height():
+            self.scratch = pg.Surface((w, h))
+        scratch = self.scratch.subsurface((0, 0, w, h))
+        scratch.fill(self.colorkey or BLACK)
+        return scratch
+
+    def draw_level(self, surface: pg.Surface, sf, view: pg.Rect, offset):
+        ox, oy = offset
+        visible = self.get_visible_chunks(view, sf)
+        blits = []
+        for cx, cy in visible:
+            chunk = self.get_chunk(sf, cx, cy, capacity=len(visible))
+            rect = self.get_chunk_rect(sf, cx, cy)
+            blits.append((chunk, (rect.x + ox, rect.y + oy)))
+        surface.blits(blits, doreturn=False)
+
+    def draw(self, surface: pg.Surface, camera):
+        sf = self.zoom.sf
+        # exact levels only for the zoom it settles on, mid-zoom they'd render a
+        # whole new level every frame
+        exact = self.exact_levels and self.zoom.is_settled()
+        level = sf if exact else self.zoom.get_level()
+        view = self.get_view(surface, camera)
+        if sf == level:
+            self.draw_level(surface, sf, view, camera.camera.topleft)
+            return
+        # in between two levels (fractional zoom): compose the view from the
+        # chunks of the closest level, then scale it the rest of the way at once
+        r = sf / level
+        level_view = pg.Rect(
+            math.floor(view.x / r),
+            math.floor(view.y / r),
+            math.ceil(view.width / r) + 1,
+            math.ceil(view.height / r) + 1,
+        )
+        scratch = self.get_scratch(level_view.size)
+        self.draw_level(scratch, level, level_view, (-level_view.x, -level_view.y))
+        size = (round(level_view.width * r), round(level_view.height * r))
+        dest = (round(level_view.x * r) - view.x, round(level_view.y * r) - view.y)
+        scaled = pg.transform.scale(scratch, size)
+        if self.colorkey is not None:
+            scaled.set_colorkey(self.colorkey)
+        surface.blit(scaled, dest)
+
+
+class MapChunks(ChunkCache):
+    # chunked replacement for TiledMap.make_map: tiles are scaled once per zoom
+    # level and blitted straight into the chunk that needs them. Below sf == 1
+    # the tiles form a mip pyramid, each level smoothscaled from the one above
+    # it, so zoomed out maps are filtered instead of sampled.
+    def __init__(self, tiled_map, zoom: Zoom, max_chunks=CHUNK_CACHE_SIZE):
+        super().__init__(tiled_map.width, tiled_map.height, zoom, max_chunks)
+        self.map = tiled_map
+        self.tmxdata = tiled_map.tmxdata
+        self.scaled_tiles: dict[float, dict[int, pg.Surface]] = {}
+        self.decals = None  # set by decals.Decals
+        # (sf, cx, cy) of the cached chunks that have decals painted in
+        self.painted: set[tuple] = set()
+        self.build_pyramid()
+
+    def build_pyramid(self):
+        # the zoomed out levels are small, so they're all made up front
+        for level in range(-1, self.zoom.max_zoom_out - 1, -1):
+            for gid in range(1, len(self.tmxdata.tiles)):
+                self.get_tile(gid, 2**level)
+
+    def get_tile(self, gid, sf):
+        tiles = self.scaled_tiles.setdefault(sf, {})
+        tile = tiles.get(gid)
+        if tile is None:
+            tile = self.tmxdata.get_tile_image_by_gid(gid)
+            if tile is not None and sf != 1:
+                w, h = tile.get_size()
+                size = (math.ceil(w * sf), math.ceil(h * sf))
+                if sf < 1:
+                    tile = pg.transform.smoothscale(self.get_tile(gid, sf * 2), size)
+                else:
+                    tile = pg.transform.scale(tile, size)
+            tiles[gid] = tile
+        return tile
+
+    def render_chunk(self, sf, cx, cy):
+        rect = self.get_chunk_rect(sf, cx, cy)
+        world = self.get_world_rect(sf, cx, cy)
+        surface = pg.Surface(rect.size)
+        tw, th = self.tmxdata.tilewidth, self.tmxdata.tileheight
+        tx0, ty0 = world.x // tw, world.y // th
+        tx1, ty1 = math.ceil(world.right / tw), math.ceil(world.bottom / th)
+        blits = []
+        for layer in self.tmxdata.layers[:, ty0:ty1, tx0:tx1]:
+            rows, cols = np.nonzero(layer)
+            for ty, tx, gid in zip(
+                (rows + ty0).tolist(), (cols + tx0).tolist(), layer[rows, cols].tolist()
+            ):
+                blits.append(
+                    (
+                        self.get_tile(gid, sf),
+                        (round(tx * tw * sf) - rect.x, round(ty * th * sf) - rect.y),
+                    )
+                )
+        surface.blits(blits, doreturn=False)
+        if self.decals is not None and self.decals.paint(surface, sf, rect, world):
+            self.painted.add((sf, cx, cy))
+        return surface
+
+    def remove_decals(self):
+        # back to the bare map: only the chunks decals were painted into have
+        # to be rendered again
+        for sf, cx, cy in self.painted:
+            level = self.levels.get(sf)
+            if level is not None:
+                level.pop((cx, cy), None)
+        self.painted.clear()
+
+
+class DebugChunks(ChunkCache):
+    # the debug view's tile grid and wall outlines, drawn once per zoom into
+    # colorkeyed chunks (sparse, so RLE blits skip the empty pixels) instead of
+    # line by line every frame. Walls are re-read when the wall grid changes.
+    exact_levels = True
+    colorkey = (255, 0, 255)
+
+    def __init__(self, width, height, zoom: Zoom, walls, wall_grid):
+        super().__init__(
+            width,
+            height,
+            zoom,
+            max_chunks=DEBUG_CHUNK_CACHE_SIZE,
+            max_levels=DEBUG_CHUNK_LEVELS,
+        )
+        self.walls = walls
+        self.wall_grid = wall_grid
+        self.version = None
+        self.wall_rects: list[tuple] = []
+
+    def refresh_walls(self):
+        # (world rect at sf == 1, grid position, size) of every wall
+        self.wall_rects = [
+            (
+                pg.Rect(
+                    wall.start_grid[0] * TILESIZE,
+                    wall.start_grid[1] * TILESIZE,
+                    *wall.base_size,
+                ),
+                vec(wall.start_grid),
+                wall.base_size,
+            )
+            for wall in self.walls
+        ]
+        self.version = self.wall_grid.version
+        self.invalidate()
+
+    def get_wall_rect(self, grid, size, sf):
+        # same arithmetic as Block.block_update, so outlines match the walls' rects
+        tile_size = self.zoom.base_scale * sf
+        x, y = grid * tile_size
+        w, h = size
+        return pg.Rect(x, y, w * tile_size / TILESIZE, h * tile_size / TILESIZE)
+
+    def render_chunk(self, sf, cx, cy):
+        rect = self.get_chunk_rect(sf, cx, cy)
+        world = self.get_world_rect(sf, cx, cy)
+        surface = pg.Surface(rect.size)
+        surface.fill(self.colorkey)
+        surface.set_colorkey(self.colorkey, pg.RLEACCEL)
+        tile_size = self.zoom.base_scale * sf
+        max_x, max_y = int(self.width * sf), int(self.height * sf)
+        for i in range(math.ceil(rect.left / tile_size), math.ceil(min(rect.right, max_x) / tile_size)):
+            x = round(i * tile_size) - rect.x
+            pg.draw.line(surface, LIGHTGREY, (x, -rect.y), (x, max_y - rect.y))
+        for i in range(math.ceil(rect.top / tile_size), math.ceil(min(rect.bottom, max_y) / tile_size)):
+            y = round(i * tile_size) - rect.y
+            pg.draw.line(surface, LIGHTGREY, (-rect.x, y), (max_x - rect.x, y))
+        for world_rect, grid, size in self.wall_rects:
+            if world_rect.inflate(2, 2).colliderect(world):
+                wall = self.get_wall_rect(grid, size, sf)
+                pg.draw.rect(surface, CYAN, wall.move(-rect.x, -rect.y), 1)
+        return surface
+
+    def draw(self, surface: pg.Surface, camera):
+        if self.version != self.wall_grid.version:
+            self.refresh_walls()
+        super().draw(surface, camera)
@@ -0,0 +1,71 @@
+import numpy as np
+import pygame as pg
+from settings import *
+from base import Zoom
+
+vec = pg.math.Vector2
+
+
+class Crowd:
+    # Batched crowd steering for all mobs. Once per frame the mob positions are
+    # gathered into an array, every mob's separation from the mobs within
+    # AVOID_RADIUS is computed in one vectorized neighbour query, and the
+    # result is written back to each mob's acc.
+    def __init__(self, zoom: Zoom):
+        self.zoom = zoom
+        self.mobs: list = []
+        self.positions = np.zeros((0, 2))
+        self.accelerations = np.zeros((0, 2))
+
+    def update(self, mobs):
+        self.mobs = mobs.sprites()
+        if not self.mobs:
+            return
+        # positions in zoomed pixels, like the radius below
+        tile_size = self.zoom.get_tile_size()
+        self.positions = np.array([mob.start_grid for mob in self.mobs]) * tile_size
+        radius = self.zoom.get_linear_update(AVOID_RADIUS)
+        self.accelerations = separation(self.positions, radius)
+        for mob, (ax, ay) in zip(self.mobs, self.accelerations.tolist()):
+            mob.acc = vec(ax, ay)
+
+
+def separation(positions: np.ndarray, radius):
+    # For every point, the sum of unit vectors pointing away from each other
+    # point closer than radius. Points are bucketed into radius-sized cells and
+    # only pairs from neighbouring cells are ever looked at.
+    n = len(positions)
+    acc = np.zeros((n, 2))
+    if n < 2 or radius <= 0:
+        return acc
+    cells = np.floor(positions / radius).astype(np.int64)
+    cells -= cells.min(axis=0) - 1  # keep one empty cell of margin around everything
+    width = cells[:, 0].max() + 2
+    keys = cells[:, 1] * width + cells[:, 0]
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    r2 = radius * radius
+
+    for oy in (-1, 0, 1):
+        for ox in (-1, 0, 1):
+            neighbour_keys = keys + oy * width + ox
+            lo = np.searchsorted(sorted_keys, neighbour_keys, side="left")
+            hi = np.searchsorted(sorted_keys, neighbour_keys, side="right")
+            counts = hi - lo
+            total = counts.sum()
+            if total == 0:
+                continue
+            # expand into (i, j) pairs: i repeated once per candidate in its cell
+            i = np.repeat(np.arange(n), counts)
+            starts = np.repeat(lo - (np.cumsum(counts) - counts), counts)
+            j = order[starts + np.arange(total)]
+            delta = positions[i] - positions[j]
+            dist2 = np.einsum("ij,ij->i", delta, delta)
+            close = (dist2 > 0) & (dist2 < r2)
+            if not close.any():
+                continue
+            i = i[close]
+            push = delta[close] / np.sqrt(dist2[close])[:, None]
+            acc[:, 0] += np.bincount(i, weights=push[:, 0], minlength=n)
+            acc[:, 1] += np.bincount(i, weights=push[:, 1], minlength=n)
+    return acc
@@ -0,0 +1,142 @@
+import math
+from collections import OrderedDict
+from itertools import count
+import pygame as pg
+from settings import *
+from imagecache import transform_cache
+
+
+class Decal:
+    __slots__ = ("image", "x", "y", "angle", "cell", "serial")
+
+    def __init__(self, image, x, y, angle, cell, serial):
+        self.image = image
+        self.x = x
+        self.y = y
+        self.angle = angle
+        self.cell = cell
+        self.serial = serial
+
+
+class Decals:
+    # Permanent marks on the map (splats, ...), centered on world pixels at
+    # sf == 1. A new decal is painted straight into the map chunks that are
+    # already rendered, at every zoom level that has them; chunks rendered later
+    # paint the decals overlapping them (MapChunks.render_chunk). Nothing else
+    # is redrawn, so the cost of a decal doesn't depend on how many came before.
+    #
+    # To keep re-rendering a chunk cheap the decals are bounded: a decal landing
+    # right on top of an identical one is dropped, every cell keeps only its
+    # newest DECAL_CELL_LIMIT and the whole map its newest DECAL_LIMIT. Evicted
+    # decals stay painted in cached chunks until those get rendered again.
+    def __init__(self, map_chunks, cell_size=DECAL_CELL_SIZE):
+        self.map_chunks = map_chunks
+        map_chunks.decals = self
+        self.cell_size = cell_size
+        self.decals: OrderedDict[int, Decal] = OrderedDict()
+        self.cells: dict[tuple[int, int], list[Decal]] = {}
+        self.serial = count()
+        self.max_radius = 0
+        self.added = 0
+        self.merged = 0
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self.decals)
+
+    def get_cell(self, x, y):
+        return int(x // self.cell_size), int(y // self.cell_size)
+
+    def add(self, image: pg.Surface, x, y, angle=0):
+        cell = self.get_cell(x, y)
+        bucket = self.cells.setdefault(cell, [])
+        for other in bucket:
+            if (
+                other.image is image
+                and (other.x - x) ** 2 + (other.y - y) ** 2 < DECAL_MERGE_DIST**2
+            ):
+                # would look (almost) the same as what's already there
+                self.merged += 1
+                return None
+        if len(bucket) >= DECAL_CELL_LIMIT:
+            self.remove(bucket[0])
+        decal = Decal(image, x, y, angle, cell, next(self.serial))
+        self.cells.setdefault(cell, []).append(decal)
+        self.decals[decal.serial] = decal
+        self.max_radius = max(self.max_radius, math.hypot(*image.get_size()) / 2)
+        self.added += 1
+        while len(self.decals) > DECAL_LIMIT:
+            self.remove(next(iter(self.decals.values())))
+        self.paint_cached(decal)
+        return decal
+
+    def remove(self, decal: Decal):
+        del self.decals[decal.serial]
+        bucket = self.cells[decal.cell]
+        bucket.remove(decal)
+        if not bucket:
+            del self.cells[decal.cell]
+        self.evicted += 1
+
+    def clear(self):
+        self.decals.clear()
+        self.cells.clear()
+
+    def query(self, world_rect: pg.Rect) -> list[Decal]:
+        # decals that may overlap world_rect (sf == 1), oldest first
+        r = self.max_radius
+        x0, y0 = self.get_cell(world_rect.left - r, world_rect.top - r)
+        x1, y1 = self.get_cell(world_rect.right + r, world_rect.bottom + r)
+        found = []
+        for cy in range(y0, y1 + 1):
+            for cx in range(x0, x1 + 1):
+                found.extend(self.cells.get((cx, cy), ()))
+        found.sort(key=lambda decal: decal.serial)
+        return found
+
+    def get_blit(self, decal: Decal, sf, origin):
+        # the decal's image at sf, and where it goes on a surface whose top left
+        # is at origin (zoomed world pixels)
+        image = transform_cache.get(decal.image, sf, decal.angle)
+        w, h = image.get_size()
+        x = round(decal.x * sf) - w // 2 - origin[0]
+        y = round(decal.y * sf) - h // 2 - origin[1]
+        return image, (x, y)
+
+    def paint(self, surface: pg.Surface, sf, chunk_rect: pg.Rect, world_rect: pg.Rect):
+        # paints every decal overlapping a freshly rendered chunk, returns whether
+        # there were any
+        decals = self.query(world_rect)
+        if decals:
+            origin = chunk_rect.topleft
+            surface.blits(
+                [self.get_blit(decal, sf, origin) for decal in decals], doreturn=False
+            )
+        return bool(decals)
+
+    def paint_cached(self, decal: Decal):
+        chunks = self.map_chunks
+        for sf, level in chunks.levels.items():
+            if not level:
+                continue
+            image, (x, y) = self.get_blit(decal, sf, (0, 0))
+            rect = pg.Rect(x, y, *image.get_size())
+            span = chunks.get_chunk_span(sf) * sf
+            # one chunk of margin, chunk edges are rounded
+            for cy in range(int((rect.top - 1) // span), int(rect.bottom // span) + 1):
+                for cx in range(int((rect.left - 1) // span), int(rect.right // span) + 1):
+                    chunk = level.get((cx, cy))
+                    if chunk is None:
+                        continue
+                    chunk_rect = chunks.get_chunk_rect(sf, cx, cy)
+                    if chunk_rect.colliderect(rect):
+                        chunk.blit(image, (x - chunk_rect.x, y - chunk_rect.y))
+                        chunks.painted.add((sf, cx, cy))
+
+    def get_stats(self):
+        return {
+            "decals": len(self.decals),
+            "added": self.added,
+            "merged": self.merged,
+            "evicted": self.evicted,
+        }
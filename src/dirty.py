@@ -0,0 +1,78 @@
+import pygame as pg
+
+
+class DirtyRects:
+    # Keeps track of what was drawn where on the previous frame, so a frame in
+    # which the view did not change only has to restore and redraw the regions
+    # that actually changed (see Game.draw_dirty).
+    #
+    # pg.sprite.LayeredDirty can't be used directly: our sprite rects live in
+    # zoomed world space and only get moved into screen space by the camera at
+    # blit time, so the bookkeeping is done on the camera-applied rects here.
+    def __init__(self):
+        self.background: pg.Surface | None = None
+        self.view_key = None
+        self.drawn: dict = {}
+        self.current: dict = {}
+
+    def invalidate(self):
+        self.background = None
+
+    def is_stale(self, view_key):
+        return self.background is None or view_key != self.view_key
+
+    def reset(self, background: pg.Surface, view_key):
+        # background: everything that only changes with the view (map, debug grid)
+        self.background = background.copy()
+        self.view_key = view_key
+        self.drawn = {}
+        self.current = {}
+
+    def begin(self):
+        self.current = {}
+
+    def track(self, key, rect: pg.Rect, state=None):
+        # state is anything that changes the pixels without moving the rect
+        # (the image object, a HUD value, ...)
+        self.current[key] = (pg.Rect(rect), state)
+
+    def end(self):
+        # returns the merged regions that need to be restored and redrawn
+        rects = []
+        for key, (rect, state) in self.current.items():
+            prev = self.drawn.get(key)
+            if prev is None:
+                rects.append(rect)
+            elif prev[0] != rect or prev[1] != state:
+                rects.append(rect)
+                rects.append(prev[0])
+        for key, (rect, _) in self.drawn.items():
+            if key not in self.current:
+                rects.append(rect)
+        self.drawn = self.current
+        self.current = {}
+        return merge_rects(rects)
+
+    def commit(self):
+        # everything tracked since begin() is now on screen (after a full redraw)
+        self.drawn = self.current
+        self.current = {}
+
+    def restore(self, surface: pg.Surface, rect: pg.Rect):
+        if self.background is not None:
+            surface.blit(self.background, rect, rect)
+
+
+def merge_rects(rects):
+    # union overlapping rects so no pixel is restored/redrawn twice
+    merged: list[pg.Rect] = []
+    for rect in rects:
+        if rect.width <= 0 or rect.height <= 0:
+            continue
+        rect = pg.Rect(rect)
+        i = rect.collidelist(merged)
+        while i != -1:
+            rect.union_ip(merged.pop(i))
+            i = rect.collidelist(merged)
+        merged.append(rect)
+    return merged
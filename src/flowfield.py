@@ -0,0 +1,87 @@
+import numpy as np
+from raycast import WallGrid
+
+# (dx, dy) of the 8 neighbouring tiles, orthogonal ones first
+NEIGHBOURS = [(1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (1, -1), (-1, 1), (-1, -1)]
+
+
+class FlowField:
+    # Shared pathfinding towards a single target (the player): one BFS from the
+    # target tile over the wall grid gives every open tile its distance to the
+    # target, and from that a direction towards the neighbouring tile that is
+    # closest to it. Any number of mobs can then look up where to go in O(1).
+    #
+    # The field is only recomputed when the target changes tile or the walls
+    # change (WallGrid.version).
+    def __init__(self, grid: WallGrid):
+        self.grid = grid
+        self.target: tuple[int, int] | None = None
+        self.version = None
+        self.distance = np.full(grid.solid.shape, np.inf)
+        self.direction = np.zeros(grid.solid.shape + (2,), dtype=np.int8)
+
+    def update(self, target_tile):
+        target_tile = (int(target_tile[0]), int(target_tile[1]))
+        if target_tile == self.target and self.version == self.grid.version:
+            return False
+        self.target = target_tile
+        self.version = self.grid.version
+        self.distance = self.get_distances()
+        self.direction = self.get_directions()
+        return True
+
+    def get_distances(self):
+        # breadth first search, one whole wavefront per numpy step
+        solid = self.grid.solid
+        distance = np.full(solid.shape, np.inf)
+        tx, ty = self.target
+        if self.grid.is_solid(tx, ty):
+            return distance
+        frontier = np.zeros(solid.shape, dtype=bool)
+        frontier[ty, tx] = True
+        distance[ty, tx] = 0
+        steps = 0
+        while frontier.any():
+            steps += 1
+            grown = np.zeros_like(frontier)
+            grown[1:, :] |= frontier[:-1, :]
+            grown[:-1, :] |= frontier[1:, :]
+            grown[:, 1:] |= frontier[:, :-1]
+            grown[:, :-1] |= frontier[:, 1:]
+            frontier = grown & ~solid & np.isinf(distance)
+            distance[frontier] = steps
+        return distance
+
+    def get_directions(self):
+        rows, cols = self.distance.shape
+        padded = np.pad(self.distance, 1, constant_values=np.inf)
+
+        def shifted(dx, dy):
+            return padded[1 + dy : 1 + dy + rows, 1 + dx : 1 + dx + cols]
+
+        best = self.distance.copy()
+        direction = np.zeros((rows, cols, 2), dtype=np.int8)
+        for dx, dy in NEIGHBOURS:
+            neighbour = shifted(dx, dy)
+            if dx and dy:
+                # no cutting corners: both orthogonal neighbours have to be open
+                neighbour = np.where(
+                    np.isinf(shifted(dx, 0)) | np.isinf(shifted(0, dy)),
+                    np.inf,
+                    neighbour,
+                )
+            closer = neighbour < best
+            best = np.where(closer, neighbour, best)
+            direction[closer] = (dx, dy)
+        return direction
+
+    def direction_at(self, tx, ty) -> tuple[int, int]:
+        if 0 <= tx < self.grid.cols and 0 <= ty < self.grid.rows:
+            dx, dy = self.direction[ty, tx]
+            return int(dx), int(dy)
+        return 0, 0
+
+    def distance_at(self, tx, ty) -> float:
+        if 0 <= tx < self.grid.cols and 0 <= ty < self.grid.rows:
+            return float(self.distance[ty, tx])
+        return float("inf")
@@ -0,0 +1,81 @@
+import math
+import pygame as pg
+from collections import OrderedDict
+from settings import *
+
+
+class TransformCache:
+    # Process-wide cache of scaled / rotated images, keyed by
+    # (source image, scale factor, quantized angle). Sprites sharing a source
+    # image (a horde of zombies) end up sharing the transformed surfaces too, so
+    # the returned images must be treated as read-only: anything drawn on top of
+    # a sprite (health bars, damage flashes) is an overlay at blit time.
+    def __init__(self, max_bytes=TRANSFORM_CACHE_BYTES, angle_step=ROTATION_STEP):
+        self.max_bytes = max_bytes
+        self.angle_step = angle_step
+        self.entries: OrderedDict = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def quantize(self, angle):
+        return round(angle / self.angle_step) * self.angle_step % 360
+
+    def get_size(self, image: pg.Surface, sf, angle=0) -> tuple[int, int]:
+        # the size get() returns for these arguments, without making the image
+        w, h = image.get_size()
+        if sf != 1:
+            w, h = int(w * sf), int(h * sf)
+        return get_rotated_size(w, h, self.quantize(angle))
+
+    def get(self, image: pg.Surface, sf, angle=0) -> pg.Surface:
+        angle = self.quantize(angle)
+        # the source is kept alive by its entry, so its id can't be reused
+        key = (id(image), sf, angle)
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        if angle:
+            result = pg.transform.rotate(self.get(image, sf), angle)
+        elif sf != 1:
+            w, h = image.get_size()
+            result = pg.transform.scale(image, (int(w * sf), int(h * sf)))
+        else:
+            result = image
+        self.entries[key] = (image, result)
+        self.bytes += get_surface_bytes(result)
+        self.evict()
+        return result
+
+    def evict(self):
+        # always keep the newest entry, even if it's over budget on its own
+        while self.bytes > self.max_bytes and len(self.entries) > 1:
+            _, (_, result) = self.entries.popitem(last=False)
+            self.bytes -= get_surface_bytes(result)
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+
+
+def get_rotated_size(w, h, angle):
+    # size of pg.transform.rotate's result, same arithmetic as pygame's
+    if angle % 90 == 0:
+        return (w, h) if angle // 90 % 2 == 0 else (h, w)
+    radians = angle * 0.01745329251994329
+    cx, cy = math.cos(radians) * w, math.cos(radians) * h
+    sx, sy = math.sin(radians) * w, math.sin(radians) * h
+    return (
+        int(max(abs(cx + sy), abs(cx - sy), abs(-cx + sy), abs(-cx - sy))),
+        int(max(abs(sx + cy), abs(sx - cy), abs(-sx + cy), abs(-sx - cy))),
+    )
+
+
+def get_surface_bytes(surface: pg.Surface):
+    return surface.get_width() * surface.get_height() * surface.get_bytesize()
+
+
+transform_cache = TransformCache()
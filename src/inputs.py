@@ -0,0 +1,87 @@
+import pygame as pg
+
+
+class LiveInput:
+    # where the game reads its input from: the real event queue and keyboard
+    def get_frame_time(self, frame_time):
+        # how long the frame took (a replay hands back the recorded one)
+        return frame_time
+
+    def get_events(self):
+        return pg.event.get()
+
+    def get_pressed(self):
+        return pg.key.get_pressed()
+
+    def advance(self):
+        ...
+
+    def close(self):
+        ...
+
+
+class KeyState:
+    # stands in for pg.key.get_pressed(): keys[pg.K_SPACE] -> bool
+    def __init__(self, held=()):
+        self.held = set(held)
+
+    def __getitem__(self, key):
+        return key in self.held
+
+
+class ScriptedInput:
+    # Replays a scripted input timeline, one step per frame (or tick). The
+    # timeline is a list of entries like
+    #   {"frame": 10, "hold": ["space", "d"]}
+    #   {"frame": 40, "release": ["d"]}
+    #   {"frame": 60, "wheel": "in", "pos": [512, 384]}
+    #   {"frame": 90, "key": "h"}
+    # key names are the ones pg.key.key_code understands.
+    def __init__(self, timeline):
+        self.frame = 0
+        self.held: set[int] = set()
+        self.timeline: dict[int, list] = {}
+        for entry in timeline:
+            self.timeline.setdefault(int(entry["frame"]), []).append(entry)
+        self.pending: list[pg.event.Event] = []
+        self.apply(self.timeline.get(0, []))
+
+    def get_frame_time(self, frame_time):
+        return frame_time
+
+    def apply(self, entries):
+        for entry in entries:
+            for name in entry.get("hold", []):
+                self.held.add(pg.key.key_code(name))
+            for name in entry.get("release", []):
+                self.held.discard(pg.key.key_code(name))
+            pos = tuple(entry.get("pos", (0, 0)))
+            if "wheel" in entry:
+                button = 4 if entry["wheel"] == "in" else 5
+                self.pending.append(
+                    pg.event.Event(pg.MOUSEBUTTONDOWN, button=button, pos=pos)
+                )
+            if "click" in entry:
+                self.pending.append(
+                    pg.event.Event(pg.MOUSEBUTTONDOWN, button=int(entry["click"]), pos=pos)
+                )
+            if "key" in entry:
+                key = pg.key.key_code(entry["key"])
+                self.pending.append(pg.event.Event(pg.KEYDOWN, key=key))
+                self.pending.append(pg.event.Event(pg.KEYUP, key=key))
+
+    def get_events(self):
+        # the real queue still has to be pumped, but nothing in it is used
+        pg.event.pump()
+        events, self.pending = self.pending, []
+        return events
+
+    def get_pressed(self):
+        return KeyState(self.held)
+
+    def advance(self):
+        self.frame += 1
+        self.apply(self.timeline.get(self.frame, []))
+
+    def close(self):
+        ...
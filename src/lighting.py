@@ -0,0 +1,232 @@
+import math
+import numpy as np
+import pygame as pg
+from settings import *
+from base import Zoom
+from raycast import WallGrid, raycast
+
+
+class Light:
+    __slots__ = (
+        "x",
+        "y",
+        "radius",
+        "color",
+        "expires",
+        "polygon",
+        "polygon_key",
+        "image",
+        "image_key",
+    )
+
+    def __init__(self, x, y, radius, color=WHITE, expires=None):
+        # x, y, radius: world pixels at sf == 1
+        self.x = x
+        self.y = y
+        self.radius = radius
+        self.color = tuple(color)
+        self.expires = expires
+        self.polygon = None
+        self.polygon_key = None
+        self.image: pg.Surface | None = None
+        self.image_key = None
+
+    def move(self, x, y):
+        self.x = x
+        self.y = y
+
+    def get_world_rect(self):
+        r = self.radius
+        size = math.ceil(2 * r) + 1
+        return pg.Rect(math.floor(self.x - r), math.floor(self.y - r), size, size)
+
+
+class Lighting:
+    # Night mode: the screen is multiplied by a fog surface that starts out as
+    # NIGHT_COLOR and gets every light added onto it. Each light is the soft
+    # mask (pre-scaled once per radius and zoom level) cut down to what the light
+    # can see: its visibility polygon comes from rays cast over the WallGrid, all
+    # lights that moved (or whose walls changed) in one batched raycast. Like the
+    # map chunks, the fog is composed at the nearest zoom level and only for the
+    # part of the world in view, then scaled the rest of the way in one go.
+    def __init__(self, zoom: Zoom, wall_grid: WallGrid, mask_image: pg.Surface):
+        self.zoom = zoom
+        self.wall_grid = wall_grid
+        # the mask is white with a soft alpha edge; lights are added, so bake
+        # it into an opaque intensity image once
+        self.mask = pg.Surface(mask_image.get_size())
+        self.mask.fill(BLACK)
+        self.mask.blit(mask_image, (0, 0))
+        self.masks: dict[tuple, pg.Surface] = {}
+        self.lights: list[Light] = []
+        self.fog: pg.Surface | None = None
+        self.now = 0.0  # game time (ms) of the last update
+        self.rebuilt = 0
+
+    def add(self, x, y, radius=LIGHT_RADIUS, color=WHITE, duration=None):
+        expires = None if duration is None else self.now + duration
+        light = Light(x, y, radius, color, expires)
+        self.lights.append(light)
+        return light
+
+    def remove(self, light: Light):
+        if light in self.lights:
+            self.lights.remove(light)
+
+    def clear(self):
+        self.lights.clear()
+
+    def update(self, now):
+        # short-lived lights (muzzle flashes) go away on their own
+        self.now = now
+        self.lights = [
+            light
+            for light in self.lights
+            if light.expires is None or light.expires > now
+        ]
+
+    def get_mask(self, radius, level, color):
+        key = (radius, level, color)
+        mask = self.masks.get(key)
+        if mask is None:
+            size = max(1, math.ceil(2 * radius * level))
+            mask = pg.transform.smoothscale(self.mask, (size, size))
+            if color != WHITE:
+                mask.fill(color, special_flags=pg.BLEND_MULT)
+            if len(self.masks) >= LIGHT_MASK_CACHE_SIZE:
+                self.masks.pop(next(iter(self.masks)))
+            self.masks[key] = mask
+        return mask
+
+    def update_polygons(self, lights: list[Light]):
+        # visibility polygons (relative to the light, world pixels) of the lights
+        # that moved since last time, one raycast for all of them
+        version = self.wall_grid.version
+        stale = []
+        for light in lights:
+            key = (light.x, light.y, light.radius, version)
+            if light.polygon_key != key:
+                light.polygon_key = key
+                stale.append(light)
+        if not stale:
+            return
+        tile = TILESIZE
+        grid = self.wall_grid
+        base_angles = np.linspace(-math.pi, math.pi, LIGHT_RAYS, endpoint=False)
+        starts, ends, angles, counts, casting = [], [], [], [], []
+        for light in stale:
+            cx, cy = light.x / tile, light.y / tile
+            r = light.radius / tile
+            if grid.is_solid(int(cx), int(cy)):
+                # stuck in a wall: no shadows rather than no light
+                light.polygon = None
+                continue
+            # besides the evenly spread rays, a pair of rays just past each wall
+            # corner in range, so shadow edges line up with the walls
+            x0, y0 = max(0, int(cx - r)), max(0, int(cy - r))
+            x1, y1 = min(grid.cols, int(cx + r) + 1), min(grid.rows, int(cy + r) + 1)
+            rows, cols = np.nonzero(grid.solid[y0:y1, x0:x1])
+            a = base_angles
+            if len(rows):
+                cells = np.stack([cols + x0, rows + y0], axis=1)
+                corners = np.unique(
+                    np.concatenate([cells, cells + (1, 0), cells + (0, 1), cells + 1]),
+                    axis=0,
+                )
+                dx, dy = corners[:, 0] - cx, corners[:, 1] - cy
+                near = dx * dx + dy * dy < r * r
+                corner_angles = np.arctan2(dy[near], dx[near])
+                a = np.concatenate([a, corner_angles - 1e-4, corner_angles + 1e-4])
+            a = np.sort(a)
+            direction = np.stack([np.cos(a), np.sin(a)], axis=1)
+            starts.append(np.broadcast_to((cx, cy), direction.shape))
+            ends.append((cx, cy) + direction * r)
+            angles.append(direction)
+            counts.append(len(a))
+            casting.append(light)
+        if not casting:
+            return
+        _, t = raycast(grid, np.concatenate(starts), np.concatenate(ends))
+        t = np.minimum(t, 1.0)
+        first = 0
+        for light, direction, n in zip(casting, angles, counts):
+            points = direction * (t[first : first + n, None] * light.radius)
+            light.polygon = points
+            first += n
+
+    def get_image(self, light: Light, level):
+        # the light's mask at level, with everything it can't see blacked out
+        key = (level, light.polygon_key, light.color)
+        if light.image_key == key:
+            return light.image
+        mask = self.get_mask(light.radius, level, light.color)
+        if light.polygon is None:
+            image = mask
+        else:
+            # what the light sees in white, times the mask; a moving light keeps
+            # drawing into the same surface
+            image = light.image
+            if image is None or image is mask or image.get_size() != mask.get_size():
+                image = pg.Surface(mask.get_size())
+            image.fill(BLACK)
+            points = light.polygon * level + mask.get_width() / 2
+            pg.draw.polygon(image, WHITE, points.tolist())
+            image.blit(mask, (0, 0), special_flags=pg.BLEND_MULT)
+            self.rebuilt += 1
+        light.image = image
+        light.image_key = key
+        return image
+
+    def get_fog(self, size):
+        w, h = size
+        if self.fog is None or w > self.fog.get_width() or h > self.fog.get_height():
+            self.fog = pg.Surface((w, h))
+        fog = self.fog.subsurface((0, 0, w, h))
+        fog.fill(NIGHT_COLOR)
+        return fog
+
+    def get_visible_lights(self, view: pg.Rect):
+        # view: world rect (sf == 1)
+        lights = self.lights
+        rects = [light.get_world_rect() for light in lights]
+        return [lights[i] for i in view.collidelistall(rects)]
+
+    def get_view(self, surface: pg.Surface, camera, sf):
+        # the part of the world in view, scaled by sf
+        x, y = camera.camera.topleft
+        r = sf / self.zoom.sf
+        w, h = surface.get_size()
+        return pg.Rect(
+            math.floor(-x * r),
+            math.floor(-y * r),
+            math.ceil(w * r) + 1,
+            math.ceil(h * r) + 1,
+        )
+
+    def draw(self, surface: pg.Surface, camera):
+        lights = self.get_visible_lights(self.get_view(surface, camera, 1))
+        self.update_polygons(lights)
+
+        # the fog covers the view and nothing else, at the power of two just
+        # below sf (and at most LIGHT_MAX_LEVEL): it's soft enough to always be
+        # scaled up, which is cheaper than composing it bigger than the screen
+        level = min(2.0 ** math.floor(math.log2(self.zoom.sf)), LIGHT_MAX_LEVEL)
+        view = self.get_view(surface, camera, level)
+        fog = self.get_fog(view.size)
+        blits = []
+        for light in lights:
+            image = self.get_image(light, level)
+            w, h = image.get_size()
+            x = round(light.x * level) - w // 2 - view.x
+            y = round(light.y * level) - h // 2 - view.y
+            # overlapping lights add up
+            blits.append((image, (x, y), None, pg.BLEND_ADD))
+        fog.blits(blits, doreturn=False)
+
+        ox, oy = camera.camera.topleft
+        r = self.zoom.sf / level
+        if r != 1:
+            size = (round(view.width * r), round(view.height * r))
+            fog = pg.transform.scale(fog, size)
+        dest = (round(view.x * r) + ox, round(view.y * r) + oy)
+        surface.blit(fog, dest, special_flags=pg.BLEND_MULT)
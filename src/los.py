@@ -0,0 +1,69 @@
+import numpy as np
+from settings import *
+from raycast import WallGrid, raycast
+
+
+class LineOfSight:
+    # Batched line of sight over the wall grid, from tile center to tile center.
+    # Every query the cache can't answer goes into a single raycast call, and the
+    # answers are kept per (from tile, to tile) until the target (the player)
+    # moves to another tile or the walls change (WallGrid.version).
+    def __init__(self, grid: WallGrid):
+        self.grid = grid
+        self.target: tuple[int, int] | None = None
+        self.version = None
+        self.cache: dict[tuple[int, int, int, int], bool] = {}
+        self.queries = 0
+        self.casts = 0
+
+    def set_target(self, target_tile):
+        target_tile = (int(target_tile[0]), int(target_tile[1]))
+        if target_tile != self.target or self.version != self.grid.version:
+            self.target = target_tile
+            self.version = self.grid.version
+            self.cache.clear()
+
+    def query(self, starts, ends) -> np.ndarray:
+        # starts / ends: (N, 2) tiles; whether each pair sees the other
+        starts = np.asarray(starts, dtype=np.int64).reshape(-1, 2)
+        ends = np.asarray(ends, dtype=np.int64).reshape(-1, 2)
+        keys = [tuple(pair) for pair in np.hstack([starts, ends]).tolist()]
+        self.queries += len(keys)
+        visible = np.zeros(len(keys), dtype=bool)
+        missing = []
+        for i, key in enumerate(keys):
+            cached = self.cache.get(key)
+            if cached is None:
+                missing.append(i)
+            else:
+                visible[i] = cached
+        if missing:
+            missing = np.array(missing)
+            hit, _ = raycast(self.grid, starts[missing] + 0.5, ends[missing] + 0.5)
+            visible[missing] = ~hit
+            for i, seen in zip(missing.tolist(), (~hit).tolist()):
+                self.cache[keys[i]] = seen
+            self.casts += len(missing)
+        return visible
+
+    def update(self, mobs, target, radius=DETECT_RADIUS):
+        # sets mob.detected: a mob notices the target when it's within radius
+        # (world pixels at sf == 1) and in plain sight, and keeps track of it
+        # until it's out of range again (the flow field leads it around walls)
+        mobs = mobs.sprites()
+        self.set_target(target.get_tile())
+        if not mobs:
+            return
+        positions = np.array([mob.start_grid for mob in mobs])
+        delta = positions - np.array(target.start_grid)
+        r = radius / TILESIZE
+        in_range = np.einsum("ij,ij->i", delta, delta) < r * r
+        detected = np.array([mob.detected for mob in mobs]) & in_range
+        # the radius check is cheap, only the mobs that pass it cast rays
+        looking = np.flatnonzero(in_range & ~detected)
+        if len(looking):
+            tiles = np.array([mobs[i].get_tile() for i in looking])
+            targets = np.broadcast_to(self.target, tiles.shape)
+            detected[looking] = self.query(tiles, targets)
+        for mob, seen in zip(mobs, detected.tolist()):
+            mob.detected = seen
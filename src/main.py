@@ -7,7 +7,27 @@ from os import path
 from settings import *
 from sprites import *
 from tilemap import *
-from base import Zoom, sprite_collision
+from chunks import MapChunks, DebugChunks
+from dirty import DirtyRects
+from imagecache import transform_cache
+from base import Zoom, sprite_collision, group_collision
+from spatial import SpatialGroup
+from raycast import WallGrid, raycast
+from flowfield import FlowField
+from los import LineOfSight
+from parallel import ParallelMobAI
+from crowd import Crowd
+from projectiles import BulletEngine
+from pool import Pool
+from inputs import LiveInput
+from profiler import Profiler
+from assets import AssetManager
+from decals import Decals
+from text import TextRenderer
+from audio import Voices
+from lighting import Lighting
+from snapshot import WorldSnapshot
+import numpy as np
 from typing import List
 
 vec = pg.math.Vector2
@@ -34,105 +54,179 @@ def draw_player_health(surf, x, y, pct):
 
 class Game:
     def __init__(self):
-        pg.mixer.pre_init(44100, -16, 4, 2048)
+        pg.mixer.pre_init(44100, -16, 2, 2048)
         pg.init()
+        self.voices = Voices()
         # flags = pg.OPENGL | pg.RESIZABLE
         flags = pg.RESIZABLE
-        self.screen = pg.display.set_mode((WIDTH, HEIGHT), flags)
+        if VSYNC:
+            # vsync needs a renderer, which pygame only sets up for SCALED windows
+            try:
+                self.screen = pg.display.set_mode(
+                    (WIDTH, HEIGHT), flags | pg.SCALED, vsync=1
+                )
+            except pg.error:
+                self.screen = pg.display.set_mode((WIDTH, HEIGHT), flags)
+        else:
+            self.screen = pg.display.set_mode((WIDTH, HEIGHT), flags)
         self.rect = self.screen.get_rect()
         self.zoom = Zoom()
         pg.display.set_caption(TITLE)
         self.clock = pg.time.Clock()
+        self.fixed_timestep = FIXED_TIMESTEP
+        self.dt = 1 / TICK_RATE
+        self.accumulator = 0.0
+        self.alpha = 1.0
+        self.prev_centers = {}
+        self.prev_centers_sf = None
+        self.input = LiveInput()
+        self.dirty_rendering = DIRTY_RENDERING
+        self.dirty = DirtyRects()
+        self.profiler = Profiler()
+        self.text = TextRenderer()
+        self.mob_ai = ParallelMobAI() if PARALLEL_AI else None
+        self.snapshot: WorldSnapshot | None = None
         self.load_data()
 
-    def draw_text(self, text, font_name, size, color, x, y, align="topleft"):
-        font = pg.font.Font(font_name, size)
-        text_surface = font.render(text, True, color)
+    def render_text(self, text, font_name, size, color, x, y, align="topleft"):
+        text_surface = self.text.render(text, font_name, size, color)
         text_rect = text_surface.get_rect(**{align: (x, y)})
-        self.screen.blit(text_surface, text_rect)
+        return text_surface, text_rect
+
+    def draw_text(self, text, font_name, size, color, x, y, align="topleft"):
+        self.screen.blit(*self.render_text(text, font_name, size, color, x, y, align))
 
     def load_data(self):
         game_folder = path.dirname(__file__)
         img_folder = path.join(game_folder, "img")
-        snd_folder = path.join(game_folder, "snd")
-        music_folder = path.join(game_folder, "music")
+        self.music_folder = path.join(game_folder, "music")
         self.map_folder = path.join(game_folder, "maps")
         self.title_font = path.join(img_folder, "ZOMBIE.TTF")
         self.hud_font = path.join(img_folder, "Impacted2.0.ttf")
         self.dim_screen = pg.Surface(self.screen.get_size()).convert_alpha()
         self.dim_screen.fill((0, 0, 0, 180))
-        self.player_img = pg.image.load(
-            path.join(img_folder, PLAYER_IMG)
-        ).convert_alpha()
+        # images and sounds are decoded in the background, see finish_loading
+        self.assets = AssetManager(game_folder)
+        self.assets.load_manifest()
+        self.loaded = False
+        self.music_loaded = False
+        self.zombie_moan_sounds = []
+
+    def finish_loading(self):
+        # waits for the assets the game needs and builds everything derived from them
+        if self.loaded:
+            return
+        self.assets.wait()
+        image = self.assets.get_image
+        sound = self.assets.get_sound
+        self.player_img = image(PLAYER_IMG)
         self.bullet_images = {}
-        self.bullet_images["lg"] = pg.image.load(
-            path.join(img_folder, BULLET_IMG)
-        ).convert_alpha()
+        self.bullet_images["lg"] = image(BULLET_IMG)
         self.bullet_images["sm"] = pg.transform.scale(
             self.bullet_images["lg"], (10, 10)
         )
-        self.mob_img = pg.image.load(path.join(img_folder, MOB_IMG)).convert_alpha()
-        self.splat = pg.image.load(path.join(img_folder, SPLAT)).convert_alpha()
-        self.splat = pg.transform.scale(self.splat, (64, 64))
-        self.gun_flashes = []
-        for img in MUZZLE_FLASHES:
-            self.gun_flashes.append(
-                pg.image.load(path.join(img_folder, img)).convert_alpha()
-            )
+        self.mob_img = image(MOB_IMG)
+        self.splat = pg.transform.scale(image(SPLAT), (64, 64))
+        self.gun_flashes = [image(img) for img in MUZZLE_FLASHES]
+        # every muzzle flash size, so firing never has to scale an image
+        self.gun_flash_sizes = {}
+        for size in range(20, 51):
+            self.gun_flash_sizes[size] = [
+                pg.transform.scale(img, (size, size)) for img in self.gun_flashes
+            ]
         self.item_images = {}
         for item in ITEM_IMAGES:
-            self.item_images[item] = pg.image.load(
-                path.join(img_folder, ITEM_IMAGES[item])
-            ).convert_alpha()
-        # lighting effect
-        self.fog = pg.Surface((WIDTH, HEIGHT))
-        self.fog.fill(NIGHT_COLOR)
-        self.light_mask = pg.image.load(
-            path.join(img_folder, LIGHT_MASK)
-        ).convert_alpha()
-        self.light_mask = pg.transform.scale(self.light_mask, LIGHT_RADIUS)
-        self.light_rect = self.light_mask.get_rect()
+            self.item_images[item] = image(ITEM_IMAGES[item])
+        # lighting effect (night mode, see lighting.py)
+        self.light_mask = image(LIGHT_MASK)
         # Sound loading
-        pg.mixer.music.load(path.join(music_folder, BG_MUSIC))
         self.effects_sounds = {}
         for type in EFFECTS_SOUNDS:
-            self.effects_sounds[type] = pg.mixer.Sound(
-                path.join(snd_folder, EFFECTS_SOUNDS[type])
-            )
+            self.effects_sounds[type] = sound(EFFECTS_SOUNDS[type])
         self.weapon_sounds = {}
         for weapon in WEAPON_SOUNDS:
             self.weapon_sounds[weapon] = []
             for snd in WEAPON_SOUNDS[weapon]:
-                s = pg.mixer.Sound(path.join(snd_folder, snd))
+                s = sound(snd)
                 s.set_volume(0.3)
                 self.weapon_sounds[weapon].append(s)
-        self.zombie_moan_sounds = []
+        self.player_hit_sounds = [sound(snd) for snd in PLAYER_HIT_SOUNDS]
+        self.zombie_hit_sounds = [sound(snd) for snd in ZOMBIE_HIT_SOUNDS]
+        # not needed for the first frame: mobs start moaning once these are in
         for snd in ZOMBIE_MOAN_SOUNDS:
-            s = pg.mixer.Sound(path.join(snd_folder, snd))
-            s.set_volume(0.2)
-            self.zombie_moan_sounds.append(s)
-        self.player_hit_sounds = []
-        for snd in PLAYER_HIT_SOUNDS:
-            self.player_hit_sounds.append(pg.mixer.Sound(path.join(snd_folder, snd)))
-        self.zombie_hit_sounds = []
-        for snd in ZOMBIE_HIT_SOUNDS:
-            self.zombie_hit_sounds.append(pg.mixer.Sound(path.join(snd_folder, snd)))
-
-    def new(self):
+            self.assets.load_sound(snd, self.add_moan_sound)
+        self.loaded = True
+
+    def add_moan_sound(self, sound):
+        sound.set_volume(0.2)
+        # in manifest order whatever order they finish loading in, so a seeded
+        # choice() picks the same moan every run
+        self.zombie_moan_sounds = [
+            self.assets.get_sound(snd)
+            for snd in ZOMBIE_MOAN_SOUNDS
+            if snd in self.assets.sounds
+        ]
+
+    def play_music(self):
+        if not self.music_loaded:
+            pg.mixer.music.load(path.join(self.music_folder, BG_MUSIC))
+            self.music_loaded = True
+        pg.mixer.music.play(loops=-1)
+
+    def new(self, map_name="level1.tmx"):
         # initialize all variables and do all the setup for a new game
+        self.finish_loading()
         self.all_sprites = pg.sprite.LayeredUpdates()
-        self.walls = pg.sprite.Group()
-        self.mobs: pg.sprite.Group[Mob] = pg.sprite.Group()  # type: ignore (can't fix without using private types)
-        self.bullets: pg.sprite.Group[Bullet] = pg.sprite.Group()  # type: ignore (can't fix without using private types)
-        self.items: pg.sprite.Group[Item] = pg.sprite.Group()  # type: ignore (can't fix without using private types)
-        self.map = TiledMap(path.join(self.map_folder, "level1.tmx"))
-        self.map_img = self.map.make_map()
-        self.base_map_img = self.map_img.copy()
-        self.map.rect = self.map_img.get_rect()
-        self.map_wh = (
-            self.base_map_img.get_width(),
-            self.base_map_img.get_height(),
+        # collision groups keep a spatial hash of their sprites' hit_rects
+        self.mobs: pg.sprite.Group[Mob] = SpatialGroup(self.zoom)  # type: ignore (can't fix without using private types)
+        self.bullets: pg.sprite.Group[Bullet] = SpatialGroup(self.zoom)  # type: ignore (can't fix without using private types)
+        self.items: pg.sprite.Group[Item] = SpatialGroup(self.zoom)  # type: ignore (can't fix without using private types)
+        if self.snapshot is not None and self.snapshot.map_name == map_name:
+            # restarting: no map loading, walls or per-object setup
+            self.snapshot.restore(self)
+        else:
+            self.load_level(map_name)
+            self.snapshot = WorldSnapshot(self, map_name) if WORLD_SNAPSHOT else None
+        self.player_light = self.lighting.add(0, 0, LIGHT_RADIUS)
+        # simulation time in ms, advanced by update(): everything timed in the
+        # game (fire rate, bullet lifetime, flashes) goes by it rather than the
+        # wall clock, so a replay (replay.py) times it all the same way
+        self.time = 0.0
+        self.flow_field = FlowField(self.wall_grid)
+        self.los = LineOfSight(self.wall_grid)
+        self.crowd = Crowd(self.zoom)
+        # short-lived sprites are recycled instead of allocated for every shot
+        self.bullet_pool = Pool(Bullet)
+        self.flash_pool = Pool(MuzzleFlash)
+        self.bullet_engine = (
+            BulletEngine(self.zoom, self.wall_grid, self.bullet_images)
+            if BULLET_ENGINE
+            else None
+        )
+        self.camera = Camera(
+            self.map.width,
+            self.map.height,
+            *self.map_wh,
+            self.zoom,
         )
+        self.draw_debug = True
+        self.skip_drawing_map = False
+        self.paused = False
+        self.night = False
+        self.dirty.invalidate()
+        self.voices.play(self.effects_sounds["level_start"], "ui", priority=2)
+
+    def load_level(self, map_name):
+        # the map, the walls and everything the map's objects spawn
+        self.walls = SpatialGroup(self.zoom)
+        self.map = TiledMap(path.join(self.map_folder, map_name))
+        self.map_chunks = MapChunks(self.map, self.zoom)
+        self.decals = Decals(self.map_chunks)
+        self.map.rect = pg.Rect(0, 0, self.map.width, self.map.height)
+        self.map_wh = (self.map.width, self.map.height)
+        self.wall_grid = WallGrid(self.map.tmxdata.width, self.map.tmxdata.height)
+        self.lighting = Lighting(self.zoom, self.wall_grid, self.light_mask)
+        self.player = None
         for tile_object in self.map.tmxdata.objects:
             obj_center = vec(tile_object.x, tile_object.y)
             if tile_object.name == "player":
@@ -140,6 +234,13 @@ class Game:
             if tile_object.name == "zombie":
                 Mob(self, obj_center, self.zoom)
             if tile_object.name == "wall":
+                self.wall_grid.add_wall(
+                    tile_object.x,
+                    tile_object.y,
+                    tile_object.width,
+                    tile_object.height,
+                    self.map.tmxdata.tilewidth,
+                )
                 Obstacle(
                     self,
                     obj_center,
@@ -149,130 +250,258 @@ class Game:
                 )
             if tile_object.name in ["health", "shotgun"]:
                 Item(self, obj_center, tile_object.name, self.zoom)
-        self.camera = Camera(
-            self.map.width,
-            self.map.height,
-            *self.map_wh,
-            self.zoom,
-            self.base_map_img,
+            if tile_object.name == "lamp":
+                tile = self.map.tmxdata.tilewidth
+                self.lighting.add(
+                    tile_object.x * tile + tile_object.width / 2,
+                    tile_object.y * tile + tile_object.height / 2,
+                    tile_object.properties.get("radius", LAMP_LIGHT_RADIUS),
+                    LAMP_LIGHT_COLOR,
+                )
+        if self.player is None:
+            # maps without a player object: start in the middle of the map
+            center = vec(self.map.tmxdata.width // 2, self.map.tmxdata.height // 2)
+            self.player = Player(self, center, self.zoom)
+        self.debug_chunks = DebugChunks(
+            self.map.width, self.map.height, self.zoom, self.walls, self.wall_grid
         )
-        self.draw_debug = True
-        self.skip_drawing_map = False
-        self.paused = False
-        self.night = False
-        self.effects_sounds["level_start"].play()
 
     def run(self):
         # game loop - set self.playing = False to end the game
         self.playing = True
-        pg.mixer.music.play(loops=-1)
+        self.play_music()
+        self.accumulator = 0.0
         while self.playing:
-            self.dt = self.clock.tick() / 1000.0  # fix for Python 2.x
+            frame_time = self.clock.tick(FPS_CAP) / 1000.0  # fix for Python 2.x
+            frame_time = self.input.get_frame_time(frame_time)
+            self.assets.poll()
             self.events()
+            self.update_zoom(frame_time)
             # self.screen.fill('black')
             # self.screen.unlock()
             # self.area.unlock()
 
             # self.screen.lock()
-            if not self.paused:
-                self.update()
+            if self.fixed_timestep:
+                self.step(frame_time)
+            else:
+                self.dt = frame_time
+                self.alpha = 1.0
+                if not self.paused:
+                    self.update()
             self.draw()
+            self.input.advance()
+
+    def step(self, frame_time):
+        # fixed timestep: the simulation always advances in ticks of 1 / TICK_RATE,
+        # however long the frame took; whatever is left over carries into the next
+        # frame and is used to interpolate the drawn positions between two ticks
+        self.dt = 1 / TICK_RATE
+        if self.paused:
+            self.accumulator = 0.0
+            self.alpha = 1.0
+            return
+        self.accumulator += frame_time
+        ticks = int(self.accumulator / self.dt)
+        if ticks > MAX_CATCHUP_STEPS:
+            # too far behind to catch up, drop the backlog instead of spiralling
+            ticks = MAX_CATCHUP_STEPS
+            self.accumulator = ticks * self.dt
+        for tick in range(ticks):
+            if tick == ticks - 1:
+                self.save_prev_centers()
+            self.update()
+            self.accumulator -= self.dt
+            if not self.playing:
+                break
+        self.alpha = min(1.0, self.accumulator / self.dt)
+
+    def save_prev_centers(self):
+        # where every sprite was drawn before the latest tick, for interpolation
+        self.prev_centers = {sprite: sprite.rect.center for sprite in self.all_sprites}
+        self.prev_centers_sf = self.zoom.sf
+
+    def get_render_rect(self, sprite):
+        rect = self.camera.apply(sprite)
+        if not self.fixed_timestep or self.prev_centers_sf != self.zoom.sf:
+            return rect
+        prev = self.prev_centers.get(sprite)
+        if prev is None:
+            return rect
+        # the latest tick is alpha ticks behind "now": draw between the last two ticks
+        t = self.alpha - 1
+        x, y = sprite.rect.center
+        return rect.move(round((x - prev[0]) * t), round((y - prev[1]) * t))
+
+    def update_zoom(self, dt):
+        # the zoom eases towards its target every frame (paused or not); the camera
+        # keeps the point under the mouse in place and sprites follow the new scale
+        old_sf = self.zoom.sf
+        if not self.zoom.update(dt):
+            return
+        ratio = self.zoom.sf / old_sf
+        self.set_camera_view()
+        display_rect = pg.display.get_surface().get_rect()
+        self.camera.zoom_by_factor(vec(self.zoom.anchor), display_rect, ratio)
+        for sprite in self.all_sprites.sprites():
+            sprite.rescale(ratio)
+        # walls aren't in all_sprites, they only move when the zoom changes
+        self.walls.update()
+
+    def get_visible_sprites(self, margin=0):
+        # sprites overlapping the view, in drawing order
+        x, y = self.camera.camera.topleft
+        view = pg.Rect(-x, -y, *self.screen.get_size()).inflate(margin * 2, margin * 2)
+        sprites = self.all_sprites.sprites()
+        return [sprites[i] for i in view.collidelistall([s.rect for s in sprites])]
+
+    def get_world_view(self):
+        # what's on screen, in world pixels at sf == 1
+        x, y = self.camera.camera.topleft
+        sf = self.zoom.sf
+        w, h = self.screen.get_size()
+        return pg.Rect(round(-x / sf), round(-y / sf), round(w / sf), round(h / sf))
+
+    def update_visibility(self):
+        # off-screen sprites skip image updates (see Entity.entity_update); the
+        # margin has them ready before they scroll into view
+        visible = set(self.get_visible_sprites(CULL_MARGIN))
+        for sprite in self.all_sprites:
+            sprite.visible = sprite in visible
 
     def quit(self):
+        if self.mob_ai is not None:
+            self.mob_ai.close()
+        self.input.close()
+        self.assets.close()
         pg.quit()
         sys.exit()
 
     def update(self):
         # update portion of the game loop
-
-        self.all_sprites.update()
+        self.time += self.dt * 1000
+        # muzzle flash lights expire whether night mode is on or not
+        self.lighting.update(self.time)
+
+        with self.profiler.span("pathing"):
+            # mobs path towards the player through the shared flow field
+            self.flow_field.update(self.player.get_tile())
+            # separation between mobs, for all of them in one batch
+            self.crowd.update(self.mobs)
+            if self.mob_ai is not None:
+                # detection, path following and steering for the whole horde,
+                # in worker processes; Mob.update only does the rest
+                self.mob_ai.update(self.mobs, self.player, self.flow_field, self.dt)
+            else:
+                # which mobs notice the player, all line of sight checks in one batch
+                self.los.update(self.mobs, self.player)
+        with self.profiler.span("sprite update"):
+            self.update_visibility()
+            self.all_sprites.update()
 
         # self.camera.update(self.player) # camera follows the player
 
-        self.camera.update()
-
-        # game over?
-        if len(self.mobs) == 0:
-            self.playing = False
-        # player hits items
-        hits = sprite_collision(self.player, self.items, False)
-        for hit in hits:
-            if hit.type == "health" and self.player.health < PLAYER_HEALTH:
-                hit.kill()
-                self.effects_sounds["health_up"].play()
-                self.player.add_health(HEALTH_PACK_AMOUNT)
-            if hit.type == "shotgun":
-                hit.kill()
-                self.effects_sounds["gun_pickup"].play()
-                self.player.weapon = "shotgun"
-        # mobs hit player
-        hits = sprite_collision(self.player, self.mobs, False, collide_hit_rect)
-        for hit in hits:
-            if random() < 0.7:
-                choice(self.player_hit_sounds).play()
-            self.player.health -= MOB_DAMAGE
-            hit.vel = vec(0, 0)
-            if self.player.health <= 0:
+        self.camera.update(self.input.get_pressed())
+
+        with self.profiler.span("collisions"):
+            # game over?
+            if len(self.mobs) == 0:
                 self.playing = False
-        if hits:
-            self.player.hit()
-            # TODO: rethink hit logic
-            # self.player.pos += vec(MOB_KNOCKBACK, 0).rotate(-hits[0].rot)
-
-        # bullets hit mobs
-        hits = pg.sprite.groupcollide(self.mobs, self.bullets, False, True)  # type: ignore (I'm not sure how to improve)
-        for mob in hits:
-            # hit.health -= WEAPONS[self.player.weapon]['damage'] * len(hits[hit])
-            for bullet in hits[mob]:
-                mob.health -= bullet.damage
-            mob.vel = vec(0, 0)
-
-    def draw_grid(self):
-        camera_top_left_x, camera_top_left_y = self.camera.camera.topleft
-        max_possible_x, max_possible_y = self.camera.get_map_boundary()
-        for x in range(0, max_possible_x, self.zoom.get_tile_size()):
-            pg.draw.line(
-                self.screen,
-                LIGHTGREY,
-                (x + camera_top_left_x, 0),
-                (x + camera_top_left_x, max_possible_y),
-            )
-        for y in range(0, max_possible_y, self.zoom.get_tile_size()):
-            pg.draw.line(
-                self.screen,
-                LIGHTGREY,
-                (0, y + camera_top_left_y),
-                (max_possible_x, y + camera_top_left_y),
-            )
+            # player hits items
+            hits = sprite_collision(self.player, self.items, False)
+            for hit in hits:
+                if hit.type == "health" and self.player.health < PLAYER_HEALTH:
+                    hit.kill()
+                    self.voices.play(self.effects_sounds["health_up"], "ui")
+                    self.player.add_health(HEALTH_PACK_AMOUNT)
+                if hit.type == "shotgun":
+                    hit.kill()
+                    self.voices.play(self.effects_sounds["gun_pickup"], "ui")
+                    self.player.weapon = "shotgun"
+            # mobs hit player
+            hits = sprite_collision(self.player, self.mobs, False, collide_hit_rect)
+            for hit in hits:
+                if random() < 0.7:
+                    sound = choice(self.player_hit_sounds)
+                    self.voices.play(sound, "player", priority=1)
+                self.player.health -= MOB_DAMAGE
+                hit.vel = vec(0, 0)
+                if self.player.health <= 0:
+                    self.playing = False
+            if hits:
+                self.player.hit()
+                # TODO: rethink hit logic
+                # self.player.pos += vec(MOB_KNOCKBACK, 0).rotate(-hits[0].rot)
+
+            # bullets hit mobs
+            if self.bullet_engine is not None:
+                # moves every bullet and tests its whole path against walls and mobs
+                hits = self.bullet_engine.update(self.dt, self.time, self.mobs)
+            else:
+                # bullets hit walls: every bullet's path for this frame is traced through
+                # the wall grid at once, so fast bullets can't skip over thin walls
+                self.bullets_hit_walls()
+                hits = {
+                    mob: [bullet.damage for bullet in bullets]
+                    for mob, bullets in group_collision(
+                        self.mobs, self.bullets, False, True
+                    ).items()
+                }
+            for mob in hits:
+                # hit.health -= WEAPONS[self.player.weapon]['damage'] * len(hits[hit])
+                for damage in hits[mob]:
+                    mob.health -= damage
+                mob.vel = vec(0, 0)
+
+        # everything that asked for a sound this frame, at once
+        self.voices.update(self.get_world_view())
+
+    def add_decal(self, image, x, y, angle=0):
+        # x, y: world pixels at sf == 1
+        if self.decals.add(image, x, y, angle) is not None:
+            # the map under the dirty rects just changed
+            self.dirty.invalidate()
+
+    def get_pools(self):
+        # the pools actually in use: with the bullet engine on (the default)
+        # bullets aren't sprites and never go through bullet_pool
+        pools = {"flash": self.flash_pool}
+        if self.bullet_engine is None:
+            pools["bullet"] = self.bullet_pool
+        return pools
+
+    def get_pool_stats(self):
+        return {name: pool.get_stats() for name, pool in self.get_pools().items()}
+
+    def bullets_hit_walls(self):
+        bullets = self.bullets.sprites()
+        if not bullets:
+            return
+        tile_size = self.zoom.get_tile_size()
+        start = np.array([bullet.prev_center for bullet in bullets]) / tile_size
+        end = np.array([bullet.rect.center for bullet in bullets]) / tile_size
+        hit, _ = raycast(self.wall_grid, start, end)
+        for i in np.flatnonzero(hit):
+            bullets[i].kill()
+
+    def add_flash_light(self, pos):
+        # pos: zoomed world pixels, like the muzzle flash itself
+        sf = self.zoom.sf
+        self.lighting.add(
+            pos[0] / sf,
+            pos[1] / sf,
+            FLASH_LIGHT_RADIUS,
+            FLASH_LIGHT_COLOR,
+            FLASH_DURATION,
+        )
 
-    # def render_fog(self):
-    #     # draw the light mask (gradient) onto fog image
-    #     self.fog.fill(NIGHT_COLOR)
-    #     self.light_rect.center = self.camera.apply(self.player).center
-    #     self.fog.blit(self.light_mask, self.light_rect)
-    #     self.screen.blit(self.fog, (0, 0), special_flags=pg.BLEND_MULT)
-
-    def get_map_img(self, display_rect=None):
-        if not display_rect:
-            display_rect = pg.display.get_surface().get_rect()
-
-        if display_rect.width < self.map_wh[0] and display_rect.height < self.map_wh[1]:
-            # zoomed in to the point where the view box is smaller than entire map
-
-            max_x = self.map_wh[0] - display_rect.width
-            max_y = self.map_wh[1] - display_rect.height
-            x, y = self.camera.camera.topleft
-            inv_sf = 1 / self.zoom.sf
-            x = abs(x) * inv_sf
-            y = abs(y) * inv_sf
-            sub = pg.Rect(
-                min(x, max_x), min(y, max_y), display_rect.width, display_rect.height
-            )
-            sub_surface = self.base_map_img.subsurface(sub)
-            return self.zoom.scale_image(sub_surface)
-        else:
-            # zoomed out and can see entire map
-            return self.zoom.scale_image(self.base_map_img)
+    def render_fog(self):
+        # the player's light follows the player as drawn (interpolated)
+        x, y = self.get_render_rect(self.player).center
+        cx, cy = self.camera.camera.topleft
+        sf = self.zoom.sf
+        self.player_light.move((x - cx) / sf, (y - cy) / sf)
+        self.lighting.draw(self.screen, self.camera)
 
     def draw_map(self, just_black=False):
         self.screen.fill(BLACK)
@@ -281,68 +510,51 @@ class Game:
             # self.screen.blit(self.map_img, self.camera.apply(self.map)) # original
             # self.screen.blit(self.map_img, self.camera.camera)
 
-            display_rect = pg.display.get_surface().get_rect()
-            scale_factor = 1 / self.zoom.sf
-            w = display_rect.width
-            h = display_rect.height
-            w *= scale_factor
-            h *= scale_factor
-            scaled_rect = pg.Rect(display_rect.x, display_rect.y, w, h)
-            # self.camera.set_scaled_rect(scaled_rect)
-
-            self.map_img = self.get_map_img(display_rect=scaled_rect)
-            self.camera.set_scaled_rect(scaled_rect)
-            # print(f"display rectangle: {display_rect} | scaled_rect: {scaled_rect}")
-            self.screen.blit(
-                self.map_img,
-                scaled_rect,
-            )
-
-    def draw(self):
-        pg.display.set_caption("{:.2f}".format(self.clock.get_fps()))
-
-        # self.screen.fill(BGCOLOR)
-
-        # render the map:
-        # TODO: only update/scale map when something changes (the scale, or the camera movement)
-        self.draw_map(self.skip_drawing_map)
-        # render a black background (featureless map, practically no performance hit)
-        # self.screen.fill(BLACK)
-
-        # pg.display.flip()
-
-        for sprite in self.all_sprites:
-            # self.zoom.update(sprite, self.screen)
-            if isinstance(sprite, Mob):
-                sprite.draw_health()
-            self.screen.blit(sprite.image, self.camera.apply(sprite))
-            if self.draw_debug:
-                pg.draw.rect(
-                    self.screen, CYAN, self.camera.apply_rect(sprite.hit_rect), 1
-                )
+            self.set_camera_view()
+            # only the chunks overlapping the camera are drawn (and rendered on demand)
+            self.map_chunks.draw(self.screen, self.camera)
+
+    def set_camera_view(self):
+        display_rect = pg.display.get_surface().get_rect()
+        scale_factor = 1 / self.zoom.sf
+        w = display_rect.width
+        h = display_rect.height
+        w *= scale_factor
+        h *= scale_factor
+        scaled_rect = pg.Rect(display_rect.x, display_rect.y, w, h)
+        self.camera.set_scaled_rect(scaled_rect)
+        # print(f"display rectangle: {display_rect} | scaled_rect: {scaled_rect}")
+
+    def draw_background(self):
+        # everything that only changes together with the view (camera / zoom)
+        with self.profiler.span("map draw"):
+            self.draw_map(self.skip_drawing_map)
         if self.draw_debug:
-            self.draw_grid()
-            for wall in self.walls:
-                # self.zoom.update(wall, self.screen)
-                wall.update()
-                pg.draw.rect(self.screen, CYAN, self.camera.apply_rect(wall.rect), 1)
-
-        # pg.draw.rect(self.screen, WHITE, self.player.hit_rect, 2)
-        # if self.night:
-        #     self.render_fog()
+            with self.profiler.span("debug grid"):
+                # grid and wall outlines, cached per zoom like the map
+                self.debug_chunks.draw(self.screen, self.camera)
+
+    def get_drawn_sprites(self):
+        # interpolation can move a sprite a little, so one tile of margin
+        sprites = self.get_visible_sprites(TILESIZE)
+        self.profiler.count("visible", len(sprites))
+        self.profiler.count("culled", len(self.all_sprites) - len(sprites))
+        return sprites
+
+    def draw_sprite(self, sprite, rect):
+        sprite.draw(self.screen, rect)
+        if self.draw_debug:
+            pg.draw.rect(self.screen, CYAN, self.camera.apply_rect(sprite.hit_rect), 1)
 
-        # HUD functions
-        draw_player_health(self.screen, 10, 10, self.player.health / PLAYER_HEALTH)
-        self.draw_text(
-            "Zombies: {}".format(len(self.mobs)),
-            self.hud_font,
-            30,
-            WHITE,
-            WIDTH - 10,
-            10,
-            align="topright",
+    def render_zombie_counter(self):
+        text_surface = self.text.render_number(
+            "Zombies: ", len(self.mobs), self.hud_font, 30, WHITE
         )
+        return text_surface, text_surface.get_rect(topright=(WIDTH - 10, 10))
 
+    def draw_hud(self, zombie_counter):
+        draw_player_health(self.screen, 10, 10, self.player.health / PLAYER_HEALTH)
+        self.screen.blit(*zombie_counter)
         if self.paused:
             self.screen.blit(self.dim_screen, (0, 0))
             self.draw_text(
@@ -355,31 +567,163 @@ class Game:
                 align="center",
             )
 
-        # temp_surface = pg.Surface(self.screen.get_size())
-        # temp_surface.blit(self.area, (0,0))
-        # self.screen.blit(temp_surface, (0,0))
+    def count_stats(self):
+        # cache and pool counters for the profiler overlay
+        if not self.profiler.enabled:
+            return
+        self.profiler.count("image hits", transform_cache.hits)
+        self.profiler.count("image misses", transform_cache.misses)
+        for name, pool in self.get_pools().items():
+            self.profiler.count(name + " peak", pool.high_water)
+            self.profiler.count(name + " new", pool.created)
+        decals = self.decals.get_stats()
+        self.profiler.count("decals", decals["decals"])
+        self.profiler.count("decals added", decals["added"])
+        self.profiler.count("decals merged", decals["merged"])
+        self.profiler.count("decals evicted", decals["evicted"])
+        self.profiler.count("lights rebuilt", self.lighting.rebuilt)
+        self.profiler.count("los queries", self.los.queries)
+        self.profiler.count("los casts", self.los.casts)
+        voices = self.voices.get_stats()
+        self.profiler.count("sounds played", voices["played"])
+        self.profiler.count("sounds merged", voices["merged"])
+        self.profiler.count("sounds culled", voices["culled"])
+        self.profiler.count("sounds dropped", voices["dropped"])
 
-        pg.display.flip()
+    def draw(self):
+        pg.display.set_caption("{:.2f}".format(self.clock.get_fps()))
+        self.count_stats()
+
+        if self.dirty_rendering and not self.night:
+            # at night the light moves with the player, i.e. the whole view changes
+            self.draw_dirty()
+            return
+
+        # render the map:
+        self.draw_background()
+        # render a black background (featureless map, practically no performance hit)
+        # self.screen.fill(BLACK)
+
+        with self.profiler.span("sprite blits"):
+            # off-screen sprites are never blitted
+            for sprite in self.get_drawn_sprites():
+                # self.zoom.update(sprite, self.screen)
+                self.draw_sprite(sprite, self.get_render_rect(sprite))
+            if self.bullet_engine is not None:
+                self.bullet_engine.draw(self.screen, self.camera, self.alpha)
+
+        # pg.draw.rect(self.screen, WHITE, self.player.hit_rect, 2)
+        if self.night:
+            with self.profiler.span("lighting"):
+                self.render_fog()
+
+        # HUD functions
+        with self.profiler.span("hud"):
+            self.draw_hud(self.render_zombie_counter())
+        self.profiler.draw(self.screen)
+
+        with self.profiler.span("flip"):
+            pg.display.flip()
+        self.profiler.end_frame()
+
+    def draw_dirty(self):
+        # only redraw (and push to the display) the regions that changed since the
+        # last frame; any change of the view itself falls back to a full redraw
+        view_key = (
+            self.camera.camera.topleft,
+            self.zoom.sf,
+            self.screen.get_size(),
+            self.skip_drawing_map,
+            self.draw_debug,
+            self.paused,
+        )
+        full_redraw = self.dirty.is_stale(view_key)
+        if full_redraw:
+            self.draw_background()
+            self.dirty.reset(self.screen, view_key)
+
+        zombie_counter = self.render_zombie_counter()
+        sprites = []
+        sprite_rects = []
+        self.dirty.begin()
+        for sprite in self.get_drawn_sprites():
+            rect = self.get_render_rect(sprite)
+            sprites.append((sprite, rect))
+            state = sprite.get_draw_state()
+            if self.draw_debug:
+                # the hit_rect outline is drawn where the last tick left the
+                # sprite, not where it's interpolated to
+                hit_rect = self.camera.apply_rect(sprite.hit_rect)
+                state = (state, tuple(hit_rect))
+                rect = rect.union(hit_rect)
+            sprite_rects.append(rect)
+            self.dirty.track(sprite, rect, state)
+        bullets = []
+        if self.bullet_engine is not None:
+            # bullets are tracked together, they all move every frame anyway
+            bullets = self.bullet_engine.get_blits(self.camera, self.alpha)
+            for i, (image, dest) in enumerate(bullets):
+                self.dirty.track(("bullet", i), pg.Rect(dest, image.get_size()))
+        health_bar = pg.Rect(10, 10, 100, 20)  # see draw_player_health
+        self.dirty.track("health", health_bar, self.player.health)
+        self.dirty.track("zombies", zombie_counter[1], len(self.mobs))
+        if self.profiler.show_overlay:
+            profiler_rect = self.profiler.get_overlay_rect(self.screen)
+            self.dirty.track(
+                "profiler", profiler_rect, (self.profiler.frame, self.profiler.message)
+            )
+        else:
+            profiler_rect = pg.Rect(0, 0, 0, 0)
+
+        if full_redraw:
+            with self.profiler.span("sprite blits"):
+                for sprite, rect in sprites:
+                    self.draw_sprite(sprite, rect)
+                self.screen.blits(bullets, doreturn=False)
+            with self.profiler.span("hud"):
+                self.draw_hud(zombie_counter)
+            self.profiler.draw(self.screen)
+            self.dirty.commit()
+            with self.profiler.span("flip"):
+                pg.display.flip()
+            self.profiler.end_frame()
+            return
+
+        dirty_rects = self.dirty.end()
+        hud_rects = [health_bar, zombie_counter[1]]
+        # each bullet is only blitted in the dirty rects it overlaps
+        dirty_bullets = [[] for _ in dirty_rects]
+        for image, dest in bullets:
+            for i in pg.Rect(dest, image.get_size()).collidelistall(dirty_rects):
+                dirty_bullets[i].append((image, dest))
+        with self.profiler.span("sprite blits"):
+            for dirty_rect, bullet_blits in zip(dirty_rects, dirty_bullets):
+                self.screen.set_clip(dirty_rect)
+                self.dirty.restore(self.screen, dirty_rect)
+                for i in dirty_rect.collidelistall(sprite_rects):
+                    self.draw_sprite(*sprites[i])
+                self.screen.blits(bullet_blits, doreturn=False)
+                if self.paused or dirty_rect.collidelist(hud_rects) != -1:
+                    self.draw_hud(zombie_counter)
+                if dirty_rect.colliderect(profiler_rect):
+                    self.profiler.draw(self.screen)
+            self.screen.set_clip(None)
+        with self.profiler.span("flip"):
+            pg.display.update(dirty_rects)
+        self.profiler.end_frame()
 
     def events(self):
         # catch all events here
-        for event in pg.event.get():
+        for event in self.input.get_events():
             if event.type == pg.MOUSEBUTTONDOWN:
-                print(event.__dict__)
-                x, y = pg.mouse.get_pos()
-                mouse_vec = vec(x, y)
-                display_rect = pg.display.get_surface().get_rect()
-                print(f"Clicked at ({x}, {y})")
+                # only sets where the zoom is heading, see update_zoom
+                x, y = event.pos
                 if event.button == 4:
-                    self.area = self.zoom.zoom_in(x, y)
-                    self.draw_map(self.skip_drawing_map)
-                    self.camera.zoom_in(mouse_vec, display_rect)
+                    self.zoom.zoom_in(x, y)
                 elif event.button == 5:
-                    self.area = self.zoom.zoom_out(x, y)
-                    self.draw_map(self.skip_drawing_map)
-                    self.camera.zoom_out(mouse_vec, display_rect)
+                    self.zoom.zoom_out(x, y)
                 elif event.button == 1:
-                    self.area = self.zoom.reset()
+                    self.zoom.reset(x, y)
             if event.type == pg.QUIT:
                 self.quit()
             if event.type == pg.KEYDOWN:
@@ -393,12 +737,47 @@ class Game:
                     self.paused = not self.paused
                 if event.key == pg.K_n:
                     self.night = not self.night
+                    self.dirty.invalidate()
+                if event.key == pg.K_r:
+                    self.dirty_rendering = not self.dirty_rendering
+                    self.dirty.invalidate()
+                if event.key == pg.K_F3:
+                    self.profiler.toggle()
+                if event.key == pg.K_F4:
+                    # the overlay says where it went
+                    self.profiler.export_chrome_trace(
+                        "trace-{}.json".format(pg.time.get_ticks())
+                    )
             # if event.type == pg.MOUSEWHEEL:
             #     print(event.x, event.y)
             #     self.camera.handle_mousewheel(event.x, event.y, self.screen)
 
     def show_start_screen(self):
-        pass
+        # the window is up right away; show how far the assets got while they load
+        bar = pg.Rect(0, 0, WIDTH / 2, 30)
+        bar.center = (WIDTH / 2, HEIGHT * 2 / 3)
+        while not self.assets.is_done():
+            for event in pg.event.get():
+                if event.type == pg.QUIT:
+                    self.quit()
+            self.assets.poll()
+            self.screen.fill(BLACK)
+            self.draw_text(
+                TITLE,
+                self.title_font,
+                100,
+                RED,
+                WIDTH / 2,
+                HEIGHT / 3,
+                align="center",
+            )
+            fill = bar.copy()
+            fill.width = bar.width * self.assets.get_progress()
+            pg.draw.rect(self.screen, GREEN, fill)
+            pg.draw.rect(self.screen, WHITE, bar, 2)
+            pg.display.flip()
+            self.clock.tick(60)
+        self.finish_loading()
 
     def show_go_screen(self):
         self.screen.fill(BLACK)
@@ -420,7 +799,7 @@ class Game:
             HEIGHT * 3 / 4,
             align="center",
         )
-        self.zoom.sf = 1
+        self.zoom.set_zoom_factor(0)
         pg.display.flip()
         self.wait_for_key()
 
@@ -437,10 +816,36 @@ class Game:
                     waiting = False
 
 
-# create the game object
-g = Game()
-g.show_start_screen()
-while True:
-    g.new()
-    g.run()
-    g.show_go_screen()
+if __name__ == "__main__":
+    import argparse
+    import random
+    from replay import InputLog, RecordingInput, ReplayInput, start
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--record", help="write every frame's input to this file")
+    parser.add_argument("--replay", help="play an input log back (see replay.py)")
+    args = parser.parse_args()
+
+    # create the game object
+    g = Game()
+    g.show_start_screen()
+    map_name = "level1.tmx"
+    if args.replay:
+        log = InputLog.load(args.replay)
+        map_name = log.meta.get("map", map_name)
+        g.fixed_timestep = log.fixed_timestep
+        g.input = ReplayInput(log)
+        start(g, log.seed)
+    elif args.record:
+        seed = random.randrange(2**32)
+        log = InputLog(seed, 1 / TICK_RATE, g.fixed_timestep, {"map": map_name})
+        g.input = RecordingInput(g.input, log, args.record)
+        start(g, seed)
+    while True:
+        g.new(map_name)
+        g.run()
+        if args.replay:
+            # no waiting for a key, the restart is in the log
+            g.zoom.set_zoom_factor(0)
+        else:
+            g.show_go_screen()
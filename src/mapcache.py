@@ -0,0 +1,258 @@
+# Compiles Tiled maps (.tmx) into a cache that loads without pytmx:
+#
+#   <cache folder>/<map name>/meta.json    size, tile size, objects, source key
+#   <cache folder>/<map name>/layers.npy   visible tile layers, (layers, rows, cols),
+#                                          0 = empty, n = tile n of the atlas
+#   <cache folder>/<map name>/atlas.npy    RGBA pixels of every tile the map uses,
+#                                          one cell of the largest tile size each
+#
+# The arrays are memory-mapped on load. A cache entry is valid while the .tmx
+# has the same mtime, or, if only the mtime changed, the same sha1.
+#
+#   python src/mapcache.py src/maps/*.tmx     (compile ahead of time, e.g. for a build)
+import hashlib
+import json
+import os
+import sys
+from os import path
+import numpy as np
+import pygame as pg
+from settings import *
+
+CACHE_VERSION = 1
+
+
+class MapObject:
+    def __init__(self, name, type, x, y, width, height, properties=None):
+        self.name = name
+        self.type = type
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+        self.properties = properties or {}
+
+    def to_json(self):
+        return vars(self)
+
+
+class CompiledMap:
+    # what the game needs from a map, without the XML: the same width / height /
+    # tilewidth / tileheight / objects / get_tile_image_by_gid as pytmx's
+    # TiledMap, and the tile layers as one array
+    def __init__(self, width, height, tilewidth, tileheight, layers, tiles, objects):
+        self.width = width
+        self.height = height
+        self.tilewidth = tilewidth
+        self.tileheight = tileheight
+        self.layers: np.ndarray = layers
+        # tiles[0] is None so layer values index straight into it
+        self.tiles: list[pg.Surface | None] = tiles
+        self.objects: list[MapObject] = objects
+
+    def get_tile_image_by_gid(self, gid):
+        return self.tiles[gid]
+
+
+def has_alpha(surface: pg.Surface):
+    return bool(surface.get_flags() & pg.SRCALPHA)
+
+
+def get_source_key(filename, sha1=True):
+    stat = os.stat(filename)
+    key = {"mtime": stat.st_mtime_ns, "size": stat.st_size}
+    if sha1:
+        with open(filename, "rb") as f:
+            key["sha1"] = hashlib.sha1(f.read()).hexdigest()
+    return key
+
+
+def get_cache_folder(filename):
+    name = path.splitext(path.basename(filename))[0]
+    return path.join(path.dirname(filename), MAP_CACHE_FOLDER, name)
+
+
+def compile_tmx(filename) -> tuple[CompiledMap, np.ndarray]:
+    # parses the .tmx with pytmx; returns the map and the atlas pixels
+    import pytmx  # only needed to compile, loading a cached map skips it
+
+    tm = pytmx.load_pygame(filename, pixelalpha=True)
+    tile_layers = [
+        layer for layer in tm.visible_layers if isinstance(layer, pytmx.TiledTileLayer)
+    ]
+    gids = np.array([layer.data for layer in tile_layers], dtype=np.int64).reshape(
+        -1, tm.height, tm.width
+    )
+    # only the tiles the map actually uses end up in the atlas
+    used = [
+        gid for gid in np.unique(gids).tolist() if gid and tm.get_tile_image_by_gid(gid)
+    ]
+    index = np.zeros(max(used, default=0) + 1, dtype=np.int64)
+    index[used] = np.arange(1, len(used) + 1)
+    layers = index[np.where(gids < len(index), gids, 0)]
+    layers = layers.astype(np.uint16 if len(used) < 2**16 else np.uint32)
+
+    tiles = [None] + [tm.get_tile_image_by_gid(gid) for gid in used]
+    sizes = [tile.get_size() for tile in tiles[1:]] or [(tm.tilewidth, tm.tileheight)]
+    cell_w, cell_h = max(w for w, _ in sizes), max(h for _, h in sizes)
+    atlas = np.zeros((max(1, len(used)), cell_h, cell_w, 4), dtype=np.uint8)
+    for i, tile in enumerate(tiles[1:]):
+        w, h = tile.get_size()
+        pixels = np.frombuffer(pg.image.tobytes(tile, "RGBA"), dtype=np.uint8)
+        atlas[i, :h, :w] = pixels.reshape(h, w, 4)
+        if not has_alpha(tile):
+            # pytmx converts tiles without transparent pixels to opaque surfaces,
+            # whose alpha bytes are meaningless
+            atlas[i, :h, :w, 3] = 255
+
+    objects = [
+        MapObject(
+            obj.name,
+            obj.type,
+            obj.x,
+            obj.y,
+            obj.width,
+            obj.height,
+            {k: v for k, v in obj.properties.items() if isinstance(v, (str, int, float, bool))},
+        )
+        for obj in tm.objects
+    ]
+    compiled = CompiledMap(
+        tm.width, tm.height, tm.tilewidth, tm.tileheight, layers, tiles, objects
+    )
+    return compiled, atlas
+
+
+def write_cache(folder, compiled: CompiledMap, atlas, source_key):
+    os.makedirs(folder, exist_ok=True)
+    np.save(path.join(folder, "layers.npy"), compiled.layers)
+    np.save(path.join(folder, "atlas.npy"), atlas)
+    meta = {
+        "version": CACHE_VERSION,
+        "source": source_key,
+        "width": compiled.width,
+        "height": compiled.height,
+        "tilewidth": compiled.tilewidth,
+        "tileheight": compiled.tileheight,
+        "tile_sizes": [tile.get_size() for tile in compiled.tiles[1:]],
+        "tile_alpha": [has_alpha(tile) for tile in compiled.tiles[1:]],
+        "objects": [obj.to_json() for obj in compiled.objects],
+    }
+    # meta.json goes last: a cache without it is ignored
+    with open(path.join(folder, "meta.json"), "w") as f:
+        json.dump(meta, f)
+
+
+def read_meta(folder):
+    try:
+        with open(path.join(folder, "meta.json")) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get("version") != CACHE_VERSION:
+        return None
+    return meta
+
+
+def load_cache(folder, meta=None) -> CompiledMap:
+    # loads a compiled map folder (without checking it against its .tmx)
+    if meta is None:
+        meta = read_meta(folder)
+    if meta is None:
+        raise ValueError(
+            "{} has no map cache this version can read (cache version {}), "
+            "compile the .tmx again".format(folder, CACHE_VERSION)
+        )
+    layers = np.load(path.join(folder, "layers.npy"), mmap_mode="r")
+    atlas = np.load(path.join(folder, "atlas.npy"), mmap_mode="r")
+    tiles: list[pg.Surface | None] = [None]
+    converted = pg.display.get_surface() is not None
+    for i, ((w, h), alpha) in enumerate(zip(meta["tile_sizes"], meta["tile_alpha"])):
+        tile = pg.image.frombuffer(atlas[i, :h, :w].tobytes(), (w, h), "RGBA")
+        if not converted:
+            tile = tile.copy()
+        elif alpha:
+            tile = tile.convert_alpha()
+        else:
+            tile = tile.convert()
+        tiles.append(tile)
+    objects = [MapObject(**obj) for obj in meta["objects"]]
+    return CompiledMap(
+        meta["width"],
+        meta["height"],
+        meta["tilewidth"],
+        meta["tileheight"],
+        layers,
+        tiles,
+        objects,
+    )
+
+
+def is_fresh(meta, filename):
+    # same mtime: fresh; touched but identical content: fresh as well
+    if meta is None:
+        return False
+    source = meta["source"]
+    key = get_source_key(filename, sha1=False)
+    if key["mtime"] == source["mtime"] and key["size"] == source["size"]:
+        return True
+    return key["size"] == source["size"] and get_source_key(filename)["sha1"] == source["sha1"]
+
+
+def update_mtime(folder, meta, mtime):
+    # the .tmx was touched but not changed, so next time the mtime matches again
+    meta["source"]["mtime"] = mtime
+    try:
+        with open(path.join(folder, "meta.json"), "w") as f:
+            json.dump(meta, f)
+    except OSError:
+        pass
+
+
+def compile_map(filename, folder=None):
+    # (re)builds the cache for a .tmx file, returns the compiled map
+    folder = folder or get_cache_folder(filename)
+    source_key = get_source_key(filename)
+    compiled, atlas = compile_tmx(filename)
+    try:
+        write_cache(folder, compiled, atlas, source_key)
+    except OSError:
+        # read-only install: keep going with the map we just parsed
+        pass
+    return compiled
+
+
+# maps already loaded in this process, {filename: (mtime, CompiledMap)}
+loaded_maps: dict[str, tuple[int, CompiledMap]] = {}
+
+
+def load_map(filename, use_cache=True) -> CompiledMap:
+    # a .tmx file (compiled on first use) or a compiled cache folder
+    filename = path.abspath(filename)
+    if path.isdir(filename):
+        return load_cache(filename)
+    if not use_cache:
+        # straight from the .tmx, and not kept for the cached loads either
+        compiled, _ = compile_tmx(filename)
+        return compiled
+    mtime = os.stat(filename).st_mtime_ns
+    entry = loaded_maps.get(filename)
+    if entry is not None and entry[0] == mtime:
+        return entry[1]
+    folder = get_cache_folder(filename)
+    meta = read_meta(folder)
+    if is_fresh(meta, filename):
+        compiled = load_cache(folder, meta)
+        if meta["source"]["mtime"] != mtime:
+            update_mtime(folder, meta, mtime)
+    else:
+        compiled = compile_map(filename, folder)
+    loaded_maps[filename] = (mtime, compiled)
+    return compiled
+
+
+if __name__ == "__main__":
+    pg.display.init()
+    for tmx in sys.argv[1:]:
+        compile_map(tmx)
+        print("compiled", tmx, "->", get_cache_folder(tmx))
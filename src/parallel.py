@@ -0,0 +1,251 @@
+import atexit
+import math
+import multiprocessing as mp
+import os
+from multiprocessing import shared_memory
+import numpy as np
+from settings import *
+from raycast import WallGrid
+from los import LineOfSight
+
+# columns of the shared mob array
+X, Y, VX, VY, AX, AY, SPEED, DETECTED, ROT = range(9)
+MOB_FIELDS = 9
+# channels of the shared map array
+DISTANCE, DX, DY, SOLID = range(4)
+MAP_FIELDS = 4
+
+# worker side: shared memory blocks attached so far, {name: SharedMemory}, and
+# the line of sight service per wall grid, {(name, version): LineOfSight}
+attached: dict[str, shared_memory.SharedMemory] = {}
+sight: dict[tuple, object] = {}
+
+
+def attach(name, shape):
+    block = attached.get(name)
+    if block is None:
+        block = attached[name] = shared_memory.SharedMemory(name=name)
+    return np.ndarray(shape, dtype=np.float64, buffer=block.buf)
+
+
+def get_line_of_sight(name, version, solid):
+    key = (name, version)
+    los = sight.get(key)
+    if los is None:
+        sight.clear()
+        grid = WallGrid(solid.shape[1], solid.shape[0])
+        grid.solid = solid > 0
+        grid.version = version
+        los = sight[key] = LineOfSight(grid)
+    return los
+
+
+def get_length(vectors):
+    # (N, 1) lengths of (N, 2) vectors, the way Vector2.normalize works them out
+    x, y = vectors[:, 0], vectors[:, 1]
+    return np.sqrt(x * x + y * y)[:, None]
+
+
+def step_mobs(mobs: np.ndarray, world: np.ndarray, los, tick):
+    # one tick of AI for the rows of mobs, in place: detection (radius check,
+    # then line of sight), path following along the flow field, steering away
+    # from neighbours and moving. Same rules as Mob.update / MotionEntity.move_to,
+    # for a whole batch of mobs at once, and the same arithmetic: the mobs end up
+    # exactly where Mob.update would put them (tests/test_parallel.py)
+    if not len(mobs):
+        return
+    pos = mobs[:, X : Y + 1]
+    target = np.array(tick["target"])
+    tx, ty = tick["target_tile"]
+    los.set_target((tx, ty))
+
+    delta = pos - target
+    r = tick["radius"]
+    in_range = np.einsum("ij,ij->i", delta, delta) < r * r
+    detected = (mobs[:, DETECTED] > 0) & in_range
+    tiles = np.floor(pos + 0.5).astype(np.int64)
+    looking = np.flatnonzero(in_range & ~detected)
+    if len(looking):
+        targets = np.broadcast_to((tx, ty), (len(looking), 2))
+        detected[looking] = los.query(tiles[looking], targets)
+    mobs[:, DETECTED] = detected
+    active = np.flatnonzero(detected)
+    if not len(active):
+        return
+
+    # path following
+    pos = pos[active]
+    tiles = tiles[active]
+    rows, cols = world.shape[:2]
+    inside = (tiles >= 0).all(axis=1) & (tiles[:, 0] < cols) & (tiles[:, 1] < rows)
+    cx = np.clip(tiles[:, 0], 0, cols - 1)
+    cy = np.clip(tiles[:, 1], 0, rows - 1)
+    distance = np.where(inside, world[cy, cx, DISTANCE], np.inf)
+    step = np.where(inside[:, None], world[cy, cx, DX : DY + 1], 0)
+    direction = tiles + step - pos
+    if tuple(tick["flow_target"]) != (tx, ty):
+        # the field leads somewhere else, head straight for the target
+        direction = target - pos
+    else:
+        direction = np.where((distance == 0)[:, None], target - pos, direction)
+        direction = np.where(np.isinf(distance)[:, None], 0.0, direction)
+    speed = mobs[active, SPEED][:, None]
+    length = get_length(direction)
+    moving = length[:, 0] > 0
+    vel = np.where(length > 0, direction / np.where(length > 0, length, 1) * speed, 0.0)
+    angle = -np.degrees(np.arctan2(vel[:, 1], vel[:, 0]))
+    rot = np.where(moving, angle, mobs[active, ROT])
+
+    # steering away from the neighbours (acc comes from Crowd)
+    acc = mobs[active, AX : AY + 1]
+    steer = moving & (np.einsum("ij,ij->i", acc, acc) > 0)
+    # vel / speed would be the same direction, but not to the last bit, and when
+    # acc all but cancels it out those bits decide which way the mob goes
+    vel_length = get_length(vel)
+    desired = vel / np.where(vel_length > 0, vel_length, 1) + acc
+    desired_length = get_length(desired)[:, 0]
+    steer &= desired_length > 0
+    safe = np.where(steer, desired_length, 1)[:, None]
+    vel = np.where(steer[:, None], desired / safe * speed, vel)
+
+    mobs[active, VX : VY + 1] = vel
+    mobs[active, ROT] = rot
+    mobs[active, X : Y + 1] = pos + vel * tick["dt"] / tick["base_scale"]
+
+
+def run_partition(task):
+    # worker entry point: one slice of the shared mob array
+    mobs_name, capacity, world_name, world_shape, version, lo, hi, tick = task
+    mobs = attach(mobs_name, (capacity, MOB_FIELDS))
+    world = attach(world_name, world_shape)
+    los = get_line_of_sight(world_name, version, world[:, :, SOLID])
+    step_mobs(mobs[lo:hi], world, los, tick)
+    return hi - lo
+
+
+class ParallelMobAI:
+    # Optional (PARALLEL_AI) replacement for the per-mob AI in Mob.update. Mob
+    # state lives in a shared memory array, the flow field and the walls in
+    # another one; every tick the mobs are split into one partition per worker
+    # process, the workers update their rows in place and the results are
+    # copied back onto the sprites before collisions. Small hordes (fewer than
+    # PARALLEL_AI_MIN_MOBS) skip the round trip and run the same code inline.
+    def __init__(self, workers=PARALLEL_AI_WORKERS, min_mobs=PARALLEL_AI_MIN_MOBS):
+        self.workers = workers or os.cpu_count() or 1
+        self.min_mobs = min_mobs
+        self.pool = None
+        self.mobs_block: shared_memory.SharedMemory | None = None
+        self.world_block: shared_memory.SharedMemory | None = None
+        self.capacity = 0
+        self.world_shape = None
+        self.world_key = None
+        self.version = 0
+        atexit.register(self.close)
+
+    def get_pool(self):
+        if self.pool is None:
+            # not forked from the game: a fork would copy pygame's state (SDL's
+            # threads and signal handlers) into the workers, and can hang them
+            # or the shutdown. Forkserver workers are forked from a clean process
+            # that only imported this module
+            methods = mp.get_all_start_methods()
+            ctx = mp.get_context("forkserver" if "forkserver" in methods else "spawn")
+            if ctx.get_start_method() == "forkserver":
+                ctx.set_forkserver_preload([__name__])
+            self.pool = ctx.Pool(self.workers)
+        return self.pool
+
+    def get_mobs_array(self, count):
+        if count > self.capacity:
+            self.release(self.mobs_block)
+            self.capacity = max(64, 2 ** math.ceil(math.log2(count)))
+            size = self.capacity * MOB_FIELDS * 8
+            self.mobs_block = shared_memory.SharedMemory(create=True, size=size)
+        shape = (self.capacity, MOB_FIELDS)
+        return np.ndarray(shape, dtype=np.float64, buffer=self.mobs_block.buf)
+
+    def get_world_array(self, flow_field):
+        # flow field and walls, copied in whenever either changes
+        grid = flow_field.grid
+        shape = grid.solid.shape + (MAP_FIELDS,)
+        if shape != self.world_shape:
+            self.release(self.world_block)
+            size = int(np.prod(shape)) * 8
+            self.world_block = shared_memory.SharedMemory(create=True, size=size)
+            self.world_shape = shape
+            self.world_key = None
+        world = np.ndarray(shape, dtype=np.float64, buffer=self.world_block.buf)
+        key = (id(grid), grid.version, flow_field.target)
+        if key != self.world_key:
+            world[:, :, DISTANCE] = flow_field.distance
+            world[:, :, DX : DY + 1] = flow_field.direction
+            world[:, :, SOLID] = grid.solid
+            self.world_key = key
+            self.version += 1
+        return world
+
+    def update(self, mobs, target, flow_field, dt, radius=DETECT_RADIUS):
+        mobs = mobs.sprites()
+        if not mobs:
+            return
+        array = self.get_mobs_array(len(mobs))
+        n = len(mobs)
+        # one row per mob, in column order
+        array[:n] = [
+            (*mob.start_grid, *mob.vel, *mob.acc, mob.speed, mob.detected, mob.rot)
+            for mob in mobs
+        ]
+        world = self.get_world_array(flow_field)
+        tick = {
+            "target": tuple(target.start_grid),
+            "target_tile": target.get_tile(),
+            "flow_target": flow_field.target,
+            "radius": radius / TILESIZE,
+            "dt": dt,
+            "base_scale": target.zoom.base_scale,
+        }
+
+        if n < self.min_mobs:
+            solid = world[:, :, SOLID]
+            los = get_line_of_sight(self.world_block.name, self.version, solid)
+            step_mobs(array[:n], world, los, tick)
+        else:
+            bounds = np.linspace(0, n, min(self.workers, n) + 1).astype(int)
+            tasks = [
+                (
+                    self.mobs_block.name,
+                    self.capacity,
+                    self.world_block.name,
+                    self.world_shape,
+                    self.version,
+                    lo,
+                    hi,
+                    tick,
+                )
+                for lo, hi in zip(bounds[:-1], bounds[1:])
+            ]
+            self.get_pool().map(run_partition, tasks)
+
+        values = array[:n].tolist()
+        for mob, row in zip(mobs, values):
+            mob.start_grid = vec(row[X], row[Y])
+            mob.vel = vec(row[VX], row[VY])
+            mob.rot = row[ROT]
+            mob.detected = row[DETECTED] > 0
+
+    def release(self, block):
+        if block is not None:
+            block.close()
+            block.unlink()
+
+    def close(self):
+        if self.pool is not None:
+            # let the workers finish and exit on their own rather than kill them
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+        self.release(self.mobs_block)
+        self.release(self.world_block)
+        self.mobs_block = self.world_block = None
+        self.capacity = 0
+        self.world_shape = None
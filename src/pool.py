@@ -0,0 +1,53 @@
+class Pool:
+    # Recycles instances of a short-lived sprite type (bullets, muzzle flashes).
+    # A pooled sprite returns itself through release() when it's killed; the
+    # next acquire() resets it with the new arguments and puts it back into the
+    # groups it was in, instead of building a new one from scratch.
+    def __init__(self, factory):
+        self.factory = factory
+        self.free: list = []
+        self.in_use = 0
+        self.high_water = 0
+        self.created = 0
+        self.reused = 0
+
+    def acquire(self, *args, **kwargs):
+        # factory(*args, **kwargs) and obj.reset(*args, **kwargs) take the same arguments
+        if self.free:
+            obj, groups = self.free.pop()
+            obj.reset(*args, **kwargs)
+            obj.add(*groups)
+            self.reused += 1
+        else:
+            # nothing to recycle, allocate a new one
+            obj = self.factory(*args, **kwargs)
+            obj.pool = self
+            self.created += 1
+        self.in_use += 1
+        self.high_water = max(self.high_water, self.in_use)
+        return obj
+
+    def release(self, obj, groups):
+        self.in_use -= 1
+        self.free.append((obj, groups))
+
+    def get_stats(self):
+        return {
+            "in_use": self.in_use,
+            "free": len(self.free),
+            "high_water": self.high_water,
+            "created": self.created,
+            "reused": self.reused,
+        }
+
+
+class PooledSprite:
+    # mixin for sprites handed out by a Pool
+    pool: Pool | None = None
+
+    def kill(self):
+        groups = self.groups()
+        super().kill()
+        # only release once, killing an already dead sprite is a no-op
+        if self.pool is not None and groups:
+            self.pool.release(self, groups)
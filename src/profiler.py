@@ -0,0 +1,174 @@
+import json
+import time
+from collections import deque
+import numpy as np
+import pygame as pg
+from settings import *
+
+
+class RingBuffer:
+    def __init__(self, size):
+        self.data = np.zeros(size)
+        self.index = 0
+        self.count = 0
+
+    def push(self, value):
+        self.data[self.index] = value
+        self.index = (self.index + 1) % len(self.data)
+        self.count = min(self.count + 1, len(self.data))
+
+    def values(self):
+        # oldest first
+        if self.count < len(self.data):
+            return self.data[: self.count]
+        return np.roll(self.data, -self.index)
+
+
+class NullSpan:
+    # what span() hands out while profiling is off: entering it costs next to nothing
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+class Span:
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.record(self.name, self.start, time.perf_counter())
+        return False
+
+
+class Profiler:
+    # Times named spans of the frame into ring buffers:
+    #   with game.profiler.span("map draw"):
+    #       ...
+    # and draws an overlay with a frame time graph and p50 / p95 / max per span.
+    # The recorded spans can be exported as Chrome trace events (chrome://tracing,
+    # Perfetto).
+    def __init__(self, size=PROFILER_FRAMES, enabled=PROFILER_ENABLED):
+        self.size = size
+        self.enabled = enabled
+        self.show_overlay = enabled
+        self.spans: dict[str, RingBuffer] = {}
+        self.frames = RingBuffer(size)
+        self.counters: dict[str, int] = {}
+        # raw (name, start, end) for the trace export, roughly the last `size` frames
+        self.events: deque = deque(maxlen=size * 16)
+        self.origin = time.perf_counter()
+        self.last_frame = None
+        self.frame = 0
+        self.font: pg.font.Font | None = None
+        # last line of the overlay, e.g. where the trace export went
+        self.message = ""
+
+    def toggle(self):
+        self.enabled = not self.enabled
+        self.show_overlay = self.enabled
+        self.last_frame = None
+
+    def span(self, name):
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name)
+
+    def record(self, name, start, end):
+        buffer = self.spans.get(name)
+        if buffer is None:
+            self.spans[name] = buffer = RingBuffer(self.size)
+        buffer.push((end - start) * 1000)
+        self.events.append((name, start, end))
+
+    def count(self, name, value):
+        self.counters[name] = value
+
+    def end_frame(self):
+        if not self.enabled:
+            return
+        self.frame += 1
+        now = time.perf_counter()
+        if self.last_frame is not None:
+            self.frames.push((now - self.last_frame) * 1000)
+            self.events.append(("frame", self.last_frame, now))
+        self.last_frame = now
+
+    def get_stats(self, buffer: RingBuffer):
+        values = buffer.values()
+        if len(values) == 0:
+            return 0.0, 0.0, 0.0
+        p50, p95 = np.percentile(values, [50, 95])
+        return float(p50), float(p95), float(values.max())
+
+    def export_chrome_trace(self, filename):
+        trace = [
+            {
+                "name": name,
+                "ph": "X",
+                "ts": (start - self.origin) * 1e6,
+                "dur": (end - start) * 1e6,
+                "pid": 0,
+                "tid": 1 if name == "frame" else 0,
+            }
+            for name, start, end in self.events
+        ]
+        with open(filename, "w") as f:
+            json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, f)
+        self.message = "trace written to {}".format(filename)
+        return filename
+
+    def get_overlay_rect(self, surface: pg.Surface):
+        rows = len(self.spans) + len(self.counters) + 2 + bool(self.message)
+        height = PROFILER_GRAPH_HEIGHT + rows * 16 + 12
+        return pg.Rect(10, surface.get_height() - height - 10, 330, height)
+
+    def draw(self, surface: pg.Surface):
+        if not self.show_overlay:
+            return
+        if self.font is None:
+            self.font = pg.font.Font(None, 18)
+        rect = self.get_overlay_rect(surface)
+        panel = pg.Surface(rect.size, pg.SRCALPHA)
+        panel.fill((0, 0, 0, 190))
+
+        # frame time graph, one column per frame, the line marks 60 fps
+        graph = pg.Rect(6, 6, rect.width - 12, PROFILER_GRAPH_HEIGHT)
+        frames = self.frames.values()[-graph.width :]
+        scale = graph.height / PROFILER_GRAPH_MS
+        for i, ms in enumerate(frames):
+            h = min(graph.height, int(ms * scale))
+            col = GREEN if ms <= 1000 / 60 else YELLOW if ms <= 1000 / 30 else RED
+            x = graph.left + i
+            pg.draw.line(panel, col, (x, graph.bottom), (x, graph.bottom - h))
+        target_y = graph.bottom - int(1000 / 60 * scale)
+        pg.draw.line(panel, LIGHTGREY, (graph.left, target_y), (graph.right, target_y))
+
+        p50, p95, worst = self.get_stats(self.frames)
+        lines = ["{:<14}{:>8}{:>8}{:>8}".format("ms", "p50", "p95", "max")]
+        lines.append("{:<14}{:>8.2f}{:>8.2f}{:>8.2f}".format("frame", p50, p95, worst))
+        for name, buffer in self.spans.items():
+            lines.append("{:<14}{:>8.2f}{:>8.2f}{:>8.2f}".format(name, *self.get_stats(buffer)))
+        for name, value in self.counters.items():
+            lines.append("{:<14}{:>8}".format(name, value))
+        y = graph.bottom + 6
+        for line in lines:
+            # the default font isn't monospaced, so columns are placed by hand
+            parts = [line[:14], line[14:22], line[22:30], line[30:]]
+            for x, part in zip((6, 130, 195, 260), parts):
+                panel.blit(self.font.render(part.strip(), True, WHITE), (x, y))
+            y += 16
+        if self.message:
+            panel.blit(self.font.render(self.message, True, WHITE), (6, y))
+        surface.blit(panel, rect)
@@ -0,0 +1,186 @@
+import numpy as np
+import pygame as pg
+from settings import *
+from base import Zoom
+from imagecache import transform_cache
+from raycast import WallGrid, raycast
+
+
+class BulletEngine:
+    # All live bullets as a struct of arrays instead of one sprite each.
+    # Positions and velocities are in world pixels at sf == 1 (so zooming
+    # doesn't touch them), spawn times in ms of game time (Game.time, not the
+    # wall clock, so replays come out the same) and weapon is an index into
+    # weapon_names, which gives lifetime and image.
+    def __init__(self, zoom: Zoom, wall_grid: WallGrid, images, capacity=256):
+        self.zoom = zoom
+        self.wall_grid = wall_grid
+        self.weapon_names = list(WEAPONS)
+        self.weapon_images = [
+            images[WEAPONS[weapon]["bullet_size"]] for weapon in self.weapon_names
+        ]
+        self.lifetimes = np.array(
+            [WEAPONS[weapon]["bullet_lifetime"] for weapon in self.weapon_names],
+            dtype=np.float64,
+        )
+        self.count = 0
+        self.pos = np.zeros((capacity, 2))
+        self.prev_pos = np.zeros((capacity, 2))
+        self.vel = np.zeros((capacity, 2))
+        self.damage = np.zeros(capacity)
+        self.spawn_time = np.zeros(capacity)
+        self.weapon = np.zeros(capacity, dtype=np.int8)
+
+    def __len__(self):
+        return self.count
+
+    def grow(self, needed):
+        capacity = len(self.pos)
+        while capacity < needed:
+            capacity *= 2
+        for name in ("pos", "prev_pos", "vel", "damage", "spawn_time", "weapon"):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[: self.count] = old[: self.count]
+            setattr(self, name, new)
+
+    def spawn(self, pos, vel, damage, weapon, now):
+        # pos / vel: world pixels (and per second) at sf == 1
+        if self.count == len(self.pos):
+            self.grow(self.count + 1)
+        i = self.count
+        self.pos[i] = pos
+        self.prev_pos[i] = pos
+        self.vel[i] = vel
+        self.damage[i] = damage
+        self.spawn_time[i] = now
+        self.weapon[i] = self.weapon_names.index(weapon)
+        self.count += 1
+
+    def update(self, dt, now, mobs) -> dict:
+        # integrate every bullet, then trace its path for this frame against the
+        # walls and the mobs; returns {mob: [damage, ...]} for the mobs that got hit
+        n = self.count
+        if n == 0:
+            return {}
+        self.prev_pos[:n] = self.pos[:n]
+        start = self.prev_pos[:n]
+        self.pos[:n] += self.vel[:n] * dt
+        end = self.pos[:n]
+
+        expired = now - self.spawn_time[:n] > self.lifetimes[self.weapon[:n]]
+        hit_wall, t_wall = raycast(self.wall_grid, start / TILESIZE, end / TILESIZE)
+
+        hits = {}
+        hit_mob = np.zeros(n, dtype=bool)
+        candidates, pairs = self.get_candidates(mobs, start, end)
+        if candidates:
+            sf = self.zoom.sf
+            rects = np.array([mob.hit_rect for mob in candidates], dtype=np.float64)
+            rects /= sf
+            centers = rects[:, :2] + rects[:, 2:] / 2
+            radii = rects[:, 2:].mean(axis=1) / 2
+            t_mob, index = sweep_circles(start, end, centers, radii, pairs)
+            # a wall in front of the mob stops the bullet first (and a bullet
+            # that misses every mob has t_mob == t_wall == inf)
+            hit_mob = (t_mob <= t_wall) & np.isfinite(t_mob) & ~expired
+            for i in np.flatnonzero(hit_mob):
+                hits.setdefault(candidates[index[i]], []).append(float(self.damage[i]))
+
+        self.remove(expired | hit_wall | hit_mob)
+        return hits
+
+    def get_candidates(self, mobs, start, end):
+        # broad phase: the mobs in the spatial hash cells each bullet's path for
+        # this frame goes through. Returns those mobs (in group order, so ties
+        # go to the same mob as with all of them) and (bullet, mob) index pairs
+        sf = self.zoom.sf
+        # a mob's circle can stick out of its hit_rect on the short side; mob
+        # images are about a tile, so half a cell around the path covers it
+        pad = int(mobs.get_cell_size()) // 2 + 1
+        lo = np.floor(np.minimum(start, end) * sf).astype(int) - pad
+        hi = np.ceil(np.maximum(start, end) * sf).astype(int) + pad
+        found = [
+            mobs.query_rect(pg.Rect(x0, y0, x1 - x0 + 1, y1 - y0 + 1))
+            for x0, y0, x1, y1 in np.hstack([lo, hi]).tolist()
+        ]
+        candidates = sorted(
+            {mob for near in found for mob in near}, key=mobs.order.__getitem__
+        )
+        index = {mob: i for i, mob in enumerate(candidates)}
+        pairs = np.array(
+            [(bullet, index[mob]) for bullet, near in enumerate(found) for mob in near],
+            dtype=np.intp,
+        ).reshape(-1, 2)
+        return candidates, pairs
+
+    def remove(self, dead: np.ndarray):
+        n = self.count
+        keep = np.flatnonzero(~dead)
+        if len(keep) == n:
+            return
+        for array in (
+            self.pos,
+            self.prev_pos,
+            self.vel,
+            self.damage,
+            self.spawn_time,
+            self.weapon,
+        ):
+            array[: len(keep)] = array[keep]
+        self.count = len(keep)
+
+    def clear(self):
+        self.count = 0
+
+    def get_blits(self, camera, alpha=1.0):
+        # alpha interpolates between the last two updates (fixed timestep)
+        n = self.count
+        if n == 0:
+            return []
+        sf = self.zoom.sf
+        image_sf = self.zoom.get_image_sf()
+        images = [transform_cache.get(image, image_sf) for image in self.weapon_images]
+        if image_sf != sf:
+            # mid-zoom, see Zoom.get_image_sf
+            images = [
+                pg.transform.scale(image, transform_cache.get_size(source, sf))
+                for image, source in zip(images, self.weapon_images)
+            ]
+        sizes = np.array([image.get_size() for image in images])
+        weapon = self.weapon[:n]
+        pos = self.prev_pos[:n] + (self.pos[:n] - self.prev_pos[:n]) * alpha
+        dest = pos * sf + camera.camera.topleft - sizes[weapon] // 2
+        return list(zip([images[w] for w in weapon.tolist()], dest.astype(int).tolist()))
+
+    def draw(self, surface: pg.Surface, camera, alpha=1.0):
+        surface.blits(self.get_blits(camera, alpha), doreturn=False)
+
+
+def sweep_circles(start, end, centers, radii, pairs):
+    # Swept test of the segments start -> end (N, 2) against circles (M, 2) / (M,),
+    # only for the (segment, circle) index pairs in pairs (K, 2), see
+    # BulletEngine.get_candidates. Returns, per segment, the fraction along it of
+    # the first circle it touches (inf if none) and the index of that circle.
+    segment, circle = pairs[:, 0], pairs[:, 1]
+    d = end[segment] - start[segment]
+    f = start[segment] - centers[circle]
+    a = np.einsum("kd,kd->k", d, d)
+    b = 2 * np.einsum("kd,kd->k", f, d)
+    c = np.einsum("kd,kd->k", f, f) - radii[circle] ** 2
+    disc = b * b - 4 * a * c
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = (-b - np.sqrt(np.maximum(disc, 0))) / (2 * a)
+    t = np.where(c <= 0, 0.0, t)  # starts inside the circle
+    touching = (c <= 0) | ((disc >= 0) & (a > 0) & (t >= 0) & (t <= 1))
+    t = np.where(touching, t, np.inf)
+    # first touch per segment, the lowest circle index on a tie
+    order = np.lexsort((circle, t, segment))
+    segment, circle, t = segment[order], circle[order], t[order]
+    first = np.ones(len(segment), dtype=bool)
+    first[1:] = segment[1:] != segment[:-1]
+    t_first = np.full(len(start), np.inf)
+    index = np.zeros(len(start), dtype=np.intp)
+    t_first[segment[first]] = t[first]
+    index[segment[first]] = circle[first]
+    return t_first, index
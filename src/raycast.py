@@ -0,0 +1,75 @@
+import math
+import numpy as np
+from settings import *
+
+
+class WallGrid:
+    # Static occupancy grid of the map, one cell per tile, built from the
+    # "wall" objects of the TMX file. version is bumped whenever the walls
+    # change so anything derived from the grid can tell it's out of date.
+    def __init__(self, cols, rows):
+        self.cols = cols
+        self.rows = rows
+        self.solid = np.zeros((rows, cols), dtype=bool)
+        self.version = 0
+
+    def add_wall(self, x, y, width, height, tile_size=TILESIZE):
+        # x, y are grid coordinates, width / height are in pixels (as in the TMX)
+        x0, y0 = int(x), int(y)
+        x1 = x0 + max(1, math.ceil(width / tile_size))
+        y1 = y0 + max(1, math.ceil(height / tile_size))
+        self.solid[max(0, y0) : max(0, y1), max(0, x0) : max(0, x1)] = True
+        self.version += 1
+
+    def is_solid(self, tx, ty):
+        # outside of the map counts as solid
+        if 0 <= tx < self.cols and 0 <= ty < self.rows:
+            return bool(self.solid[ty, tx])
+        return True
+
+    def lookup(self, tx: np.ndarray, ty: np.ndarray) -> np.ndarray:
+        inside = (tx >= 0) & (tx < self.cols) & (ty >= 0) & (ty < self.rows)
+        result = np.ones(tx.shape, dtype=bool)
+        result[inside] = self.solid[ty[inside], tx[inside]]
+        return result
+
+
+def raycast(grid: WallGrid, start, end):
+    # Batched grid traversal (Amanatides & Woo DDA) of the segments start -> end,
+    # given as (N, 2) arrays in tile units. Every ray advances one cell per
+    # iteration, so the loop runs for as many cells as the longest ray crosses.
+    # Returns (hit, t): whether each segment runs into a solid cell and the
+    # fraction of the segment at which it does (inf when it doesn't).
+    start = np.asarray(start, dtype=np.float64).reshape(-1, 2)
+    end = np.asarray(end, dtype=np.float64).reshape(-1, 2)
+    delta = end - start
+    cell = np.floor(start).astype(np.int64)
+    last = np.floor(end).astype(np.int64)
+    step = np.sign(delta).astype(np.int64)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t_delta = np.where(delta != 0, np.abs(1 / delta), np.inf)
+        t_max = np.where(
+            delta != 0, (cell + (step > 0) - start) / delta, np.inf
+        )
+
+    hit = grid.lookup(cell[:, 0], cell[:, 1])
+    t_hit = np.where(hit, 0.0, np.inf)
+    remaining = np.abs(last - cell).sum(axis=1)
+    active = np.flatnonzero(~hit & (remaining > 0))
+
+    while len(active):
+        tm = t_max[active]
+        axis = (tm[:, 1] < tm[:, 0]).astype(np.int64)
+        t = tm[np.arange(len(active)), axis]
+        cell[active, axis] += step[active, axis]
+        t_max[active, axis] += t_delta[active, axis]
+        remaining[active] -= 1
+
+        solid = grid.lookup(cell[active, 0], cell[active, 1])
+        hits = active[solid]
+        hit[hits] = True
+        t_hit[hits] = np.minimum(t[solid], 1.0)
+        active = active[~solid & (remaining[active] > 0)]
+
+    return hit, t_hit
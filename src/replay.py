@@ -0,0 +1,217 @@
+import gzip
+import json
+import random
+import struct
+import zlib
+import pygame as pg
+from inputs import KeyState
+
+# Input log: everything the simulation reads from the outside world, one record
+# per frame, plus the seed of the random module. Played back through
+# ReplayInput the game makes the same moves in the same order, so the same
+# fight can be rerun (headless, see bench.py --replay) and timed on every build.
+#
+# file layout (gzip compressed, little endian):
+#   header: magic, version, seed, tick length, fixed timestep, meta length,
+#           meta (JSON: map, bench options, ...)
+#   frame:  frame time, held keys (bit per RECORDED_KEYS entry), event count,
+#           then per event: type (index into RECORDED_EVENTS), key / button, x, y
+MAGIC = b"ZREC"
+VERSION = 1
+HEADER = struct.Struct("<4sHQd?H")
+FRAME = struct.Struct("<fHB")
+EVENT = struct.Struct("<BIhh")
+
+# the keys the game polls (Player.get_keys, Camera.move_camera)
+RECORDED_KEYS = [pg.K_SPACE, pg.K_w, pg.K_a, pg.K_s, pg.K_d, pg.K_0, pg.K_9]
+# the events Game.events acts on; quitting isn't one of them, a replay quits
+# when it runs out of frames
+RECORDED_EVENTS = [pg.KEYDOWN, pg.KEYUP, pg.MOUSEBUTTONDOWN]
+
+
+def is_recorded(event):
+    if event.type not in RECORDED_EVENTS:
+        return False
+    return not (event.type == pg.KEYDOWN and event.key == pg.K_ESCAPE)
+
+
+def pack_event(event):
+    kind = RECORDED_EVENTS.index(event.type)
+    if event.type == pg.MOUSEBUTTONDOWN:
+        x, y = event.pos
+        return EVENT.pack(kind, event.button, x, y)
+    return EVENT.pack(kind, event.key, 0, 0)
+
+
+def unpack_event(kind, code, x, y):
+    event_type = RECORDED_EVENTS[kind]
+    if event_type == pg.MOUSEBUTTONDOWN:
+        return pg.event.Event(event_type, button=code, pos=(x, y))
+    return pg.event.Event(event_type, key=code)
+
+
+class InputLog:
+    def __init__(self, seed=0, dt=0.0, fixed_timestep=True, meta=None):
+        self.seed = seed
+        self.dt = dt
+        self.fixed_timestep = fixed_timestep
+        self.meta: dict = meta or {}
+        # frame time, held keys mask, packed events
+        self.frames: list[tuple[float, int, bytes]] = []
+
+    def add_frame(self, frame_time, keys_mask, events):
+        self.frames.append((frame_time, keys_mask, events))
+
+    def save(self, filename):
+        meta = json.dumps(self.meta).encode()
+        header = HEADER.pack(
+            MAGIC, VERSION, self.seed, self.dt, self.fixed_timestep, len(meta)
+        )
+        chunks = [header, meta]
+        for frame_time, keys_mask, events in self.frames:
+            chunks.append(FRAME.pack(frame_time, keys_mask, len(events) // EVENT.size))
+            chunks.append(events)
+        with gzip.open(filename, "wb") as f:
+            f.write(b"".join(chunks))
+        return filename
+
+    @classmethod
+    def load(cls, filename):
+        with gzip.open(filename, "rb") as f:
+            data = f.read()
+        magic, version, seed, dt, fixed_timestep, meta_length = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("{} is not an input log this version can read".format(filename))
+        offset = HEADER.size
+        meta = json.loads(data[offset : offset + meta_length])
+        log = cls(seed, dt, fixed_timestep, meta)
+        offset += meta_length
+        while offset < len(data):
+            frame_time, keys_mask, count = FRAME.unpack_from(data, offset)
+            offset += FRAME.size
+            events = data[offset : offset + count * EVENT.size]
+            offset += len(events)
+            log.add_frame(frame_time, keys_mask, events)
+        return log
+
+
+def round_frame_time(frame_time):
+    # frame times are stored as 32 bit floats, the recording run has to use
+    # exactly what the replay will get back
+    return FRAME.unpack(FRAME.pack(frame_time, 0, 0))[0]
+
+
+def start(game, seed):
+    # all the randomness (mob speeds, bullet spread, sounds, ...) comes from the
+    # random module; the moans load in the background and are only picked from
+    # once they're in, so they have to be in before the first tick as well
+    game.finish_loading()
+    game.assets.wait()
+    random.seed(seed)
+
+
+class RecordingInput:
+    # Passes another input (LiveInput, ScriptedInput) through to the game and
+    # writes down what the game got from it, see InputLog
+    def __init__(self, source, log: InputLog, filename=None):
+        self.source = source
+        self.log = log
+        self.filename = filename
+        self.frame_time = 0.0
+        self.keys_mask = 0
+        self.events: list[bytes] = []
+        self.recording = False  # a frame is waiting for advance()
+
+    def get_frame_time(self, frame_time):
+        self.frame_time = round_frame_time(self.source.get_frame_time(frame_time))
+        self.recording = True
+        return self.frame_time
+
+    def get_events(self):
+        events = self.source.get_events()
+        self.events += [pack_event(event) for event in events if is_recorded(event)]
+        # the keys can only change when the queue is pumped, so this is what
+        # every get_pressed() until the next frame sees
+        pressed = self.source.get_pressed()
+        self.keys_mask = 0
+        for bit, key in enumerate(RECORDED_KEYS):
+            if pressed[key]:
+                self.keys_mask |= 1 << bit
+        self.recording = True
+        return events
+
+    def get_pressed(self):
+        return self.source.get_pressed()
+
+    def advance(self):
+        self.end_frame()
+        self.source.advance()
+
+    def end_frame(self):
+        if not self.recording:
+            return
+        self.log.add_frame(self.frame_time, self.keys_mask, b"".join(self.events))
+        self.events = []
+        self.recording = False
+
+    def close(self):
+        # the game quits in the middle of a frame (before it gets to update), the
+        # replay stops right there too, when it runs out of frames
+        if self.filename is not None:
+            print("input log written to", self.log.save(self.filename))
+        self.source.close()
+
+
+class ReplayInput:
+    # Plays an InputLog back, one recorded frame per frame. Once the log runs
+    # out the game gets a QUIT.
+    def __init__(self, log: InputLog):
+        self.log = log
+        self.frame = 0
+
+    def get_current(self):
+        if self.frame < len(self.log.frames):
+            return self.log.frames[self.frame]
+        return None
+
+    def get_frame_time(self, frame_time):
+        current = self.get_current()
+        return frame_time if current is None else current[0]
+
+    def get_events(self):
+        # the real queue still has to be pumped, but nothing in it is used
+        pg.event.pump()
+        current = self.get_current()
+        if current is None:
+            return [pg.event.Event(pg.QUIT)]
+        events = current[2]
+        return [
+            unpack_event(*EVENT.unpack_from(events, offset))
+            for offset in range(0, len(events), EVENT.size)
+        ]
+
+    def get_pressed(self):
+        current = self.get_current()
+        mask = 0 if current is None else current[1]
+        return KeyState(key for bit, key in enumerate(RECORDED_KEYS) if mask >> bit & 1)
+
+    def advance(self):
+        self.frame += 1
+
+    def close(self):
+        ...
+
+
+def get_checksum(game):
+    # a fingerprint of the simulation, for checking that a replay ended up
+    # where the recording did
+    state = [
+        tuple(game.player.start_grid),
+        game.player.health,
+        game.time,
+        len(game.bullets),
+    ]
+    state += [(tuple(mob.start_grid), mob.health) for mob in game.mobs]
+    if game.bullet_engine is not None:
+        state.append(game.bullet_engine.count)
+    return "{:08x}".format(zlib.crc32(repr(state).encode()))
@@ -16,6 +16,11 @@ CYAN = (0, 255, 255)
 WIDTH = 1024   # 16 * 64 or 32 * 32 or 64 * 16
 HEIGHT = 768  # 16 * 48 or 32 * 24 or 64 * 12
 # FPS = 240
+FIXED_TIMESTEP = True  # simulate in fixed ticks and interpolate what's drawn
+TICK_RATE = 60  # simulation ticks per second
+MAX_CATCHUP_STEPS = 5  # most ticks run in one frame before the backlog is dropped
+FPS_CAP = 120  # 0 = uncapped
+VSYNC = False
 TITLE = "Tilemap Demo"
 BGCOLOR = BROWN
 
@@ -24,6 +29,36 @@ TILESIZE = 64
 GRIDWIDTH = WIDTH / TILESIZE
 GRIDHEIGHT = HEIGHT / TILESIZE
 
+# Zoom
+ZOOM_STEP = 0.5  # zoom_factor change per wheel notch (sf = 2 ** zoom_factor)
+ZOOM_SMOOTHING = 0.08  # seconds, time constant of the zoom transition (0 = instant)
+
+# Map rendering
+MAP_CACHE_FOLDER = "cache"  # compiled maps (mapcache.py), next to the .tmx files
+CHUNK_SIZE = 512  # approximate on-screen size of a map chunk in pixels
+CHUNK_CACHE_SIZE = 48  # rendered chunks kept per zoom level
+DEBUG_CHUNK_CACHE_SIZE = 16  # debug overlay chunks kept per zoom level
+DEBUG_CHUNK_LEVELS = 4  # zoom levels of debug overlay chunks kept
+WORLD_SNAPSHOT = True  # restarts rebuild the level from its first spawn (snapshot.py)
+CULL_MARGIN = 64  # screen pixels around the view where sprites still count as visible
+DIRTY_RENDERING = False  # only redraw changed regions while the view is still (toggle: R)
+
+# Image transform cache (shared scaled / rotated sprite images)
+TRANSFORM_CACHE_BYTES = 64 * 1024 * 1024
+ROTATION_STEP = 3  # degrees, rotations are rounded to this before caching
+
+# Asset loading
+ASSET_WORKERS = 4  # threads decoding images and sounds at startup
+
+# Text
+TEXT_CACHE_SIZE = 256  # rendered strings kept (text.py)
+
+# Frame profiler (overlay toggle: F3, export a Chrome trace: F4)
+PROFILER_ENABLED = False
+PROFILER_FRAMES = 300  # frames kept in the ring buffers
+PROFILER_GRAPH_HEIGHT = 60
+PROFILER_GRAPH_MS = 50  # frame time at the top of the graph
+
 # Player settings
 PLAYER_HEALTH = 100
 PLAYER_SPEED = 280
@@ -52,6 +87,8 @@ WEAPONS['shotgun'] = {'bullet_speed': 4000,
                       'bullet_size': 'sm',
                       'bullet_count': 12}
 
+BULLET_ENGINE = True  # simulate bullets as arrays (projectiles.py) instead of sprites
+
 # Mob settings
 MOB_IMG = 'zombie1_hold.png'
 MOB_SPEEDS = [150, 100, 75, 125]
@@ -61,16 +98,30 @@ MOB_DAMAGE = 10
 MOB_KNOCKBACK = 20
 AVOID_RADIUS = 50
 DETECT_RADIUS = 400
+PARALLEL_AI = False  # mob AI in worker processes (parallel.py)
+PARALLEL_AI_WORKERS = 0  # 0: one per core
+PARALLEL_AI_MIN_MOBS = 200  # smaller hordes run the same code in the game process
 
 # Effects
 MUZZLE_FLASHES = ['whitePuff15.png', 'whitePuff16.png', 'whitePuff17.png',
                   'whitePuff18.png']
 SPLAT = 'splat green.png'
+DECAL_LIMIT = 4000  # permanent marks (decals.py) kept on the whole map
+DECAL_CELL_SIZE = 128  # world pixels
+DECAL_CELL_LIMIT = 12  # newest decals kept per cell, bounds what a chunk render paints
+DECAL_MERGE_DIST = 6  # a decal this close to an identical one is dropped
 FLASH_DURATION = 50
 DAMAGE_ALPHA = [i for i in range(0, 255, 55)]
 NIGHT_COLOR = (20, 20, 20)
-LIGHT_RADIUS = (500, 500)
+LIGHT_RADIUS = 250  # player light, world pixels
 LIGHT_MASK = "light_350_soft.png"
+LIGHT_RAYS = 96  # rays per light for its visibility polygon, besides the wall corners
+LIGHT_MASK_CACHE_SIZE = 64  # scaled masks kept, one per (radius, zoom level, color)
+LIGHT_MAX_LEVEL = 1  # lights are composed at most at this zoom, then scaled up
+FLASH_LIGHT_RADIUS = 150
+FLASH_LIGHT_COLOR = (255, 220, 160)
+LAMP_LIGHT_RADIUS = 200  # "lamp" map objects, unless they have a radius property
+LAMP_LIGHT_COLOR = (255, 200, 130)
 
 # Layers
 WALL_LAYER = 1
@@ -88,6 +139,10 @@ BOB_RANGE = 10
 BOB_SPEED = 0.05
 
 # Sounds
+AUDIO_CATEGORIES = {"ui": 2, "player": 2, "weapons": 4, "mobs": 8}  # mixer channels each
+AUDIO_CULL_MARGIN = 400  # world pixels outside the view where sounds are still played
+AUDIO_MIN_VOLUME = 0.2  # volume of a sound at the cull margin
+AUDIO_PAN = 0.6  # how far to the side sounds at the edge of the view are panned
 BG_MUSIC = 'espionage.ogg'
 PLAYER_HIT_SOUNDS = ['pain/8.wav', 'pain/9.wav', 'pain/10.wav', 'pain/11.wav']
 ZOMBIE_MOAN_SOUNDS = ['brains2.wav', 'brains3.wav', 'zombie-roar-1.wav', 'zombie-roar-2.wav',
@@ -0,0 +1,146 @@
+import gc
+import numpy as np
+import pygame as pg
+from settings import *
+from base import Entity
+from decals import Decals
+from imagecache import transform_cache
+from sprites import Player
+
+vec = pg.math.Vector2
+
+# set per copy by restore(), everything else comes from the template
+OWN_ATTRIBUTES = {"_Sprite__g", "_layer", "start_grid", "rect", "hit_rect", "image"}
+
+
+class Template:
+    # one kind of entity (a class, plus e.g. the item type): the state of the
+    # first one spawned, the groups it went into and its layers
+    def __init__(self, sprite: Entity, groups, group_layer):
+        self.cls = type(sprite)
+        self.state = {
+            name: value.copy() if isinstance(value, (vec, pg.Rect)) else value
+            for name, value in vars(sprite).items()
+            if name not in OWN_ATTRIBUTES
+        }
+        # vectors get a copy each, they're changed in place
+        self.vectors = [
+            name for name, value in self.state.items() if isinstance(value, vec)
+        ]
+        self.groups = groups
+        # the constructors set _layer after joining all_sprites, so the layer
+        # it's drawn in isn't always _layer
+        self.group_layer = group_layer
+        self.layer = sprite._layer
+
+
+class WorldSnapshot:
+    # The level right after its first spawn, so a restart (Game.new on the same
+    # map) doesn't go through the map file and one constructor per object again:
+    # - the map, its chunk caches (minus chunks with decals), the walls and the
+    #   wall grid are kept as they are, nothing in the game changes them
+    # - every entity is a row: kind, grid position, health. A kind is a
+    #   Template, copies of it are made with a dict update and added to their
+    #   groups in the same order as the first time, so the restarted level is
+    #   the same as a fresh one (Entity.respawn redoes the random picks)
+    def __init__(self, game, map_name):
+        self.map_name = map_name
+        self.map = game.map
+        self.map_chunks = game.map_chunks
+        self.wall_grid = game.wall_grid
+        self.walls = game.walls
+        self.debug_chunks = game.debug_chunks
+        self.lighting = game.lighting
+        self.lamps = [
+            (light.x, light.y, light.radius, light.color)
+            for light in game.lighting.lights
+        ]
+        self.player_grid = vec(game.player.start_grid)
+
+        self.templates: list[Template] = []
+        found: dict[tuple, int] = {}
+        kinds, grids, health = [], [], []
+        # all_sprites is in spawn order (within a layer)
+        for sprite in game.all_sprites.sprites():
+            if sprite is game.player:
+                continue
+            key = (type(sprite), getattr(sprite, "type", None))
+            kind = found.get(key)
+            if kind is None:
+                groups = [
+                    name
+                    for name in ("all_sprites", "mobs", "items")
+                    if sprite in getattr(game, name)
+                ]
+                layer = game.all_sprites.get_layer_of_sprite(sprite)
+                kind = found[key] = len(self.templates)
+                self.templates.append(Template(sprite, groups, layer))
+            kinds.append(kind)
+            grids.append(tuple(sprite.start_grid))
+            health.append(getattr(sprite, "health", 0))
+        self.kinds = np.array(kinds, dtype=np.uint16)
+        self.grids = np.array(grids, dtype=np.float64).reshape(-1, 2)
+        self.health = np.array(health)
+
+    def restore(self, game):
+        game.map = self.map
+        game.map_chunks = self.map_chunks
+        game.map_chunks.remove_decals()
+        game.decals = Decals(game.map_chunks)
+        game.map_wh = (self.map.width, self.map.height)
+        game.wall_grid = self.wall_grid
+        game.walls = self.walls
+        # the zoom may have moved since the walls were laid out
+        game.walls.update()
+        game.debug_chunks = self.debug_chunks
+        game.lighting = self.lighting
+        game.lighting.clear()
+        for lamp in self.lamps:
+            game.lighting.add(*lamp)
+        game.player = Player(game, vec(self.player_grid), game.zoom)
+        # thousands of new objects that all stay referenced: nothing for the
+        # garbage collector to find while they're made
+        gc.disable()
+        try:
+            self.spawn(game)
+        finally:
+            gc.enable()
+
+    def spawn(self, game):
+        # Entity.entity_update, once per kind instead of once per entity
+        zoom = game.zoom
+        tile_size = zoom.get_tile_size()
+        half = tile_size // 2
+        image_sf = zoom.get_image_sf()
+        kinds = []
+        for template in self.templates:
+            base_image = template.state["base_image"]
+            rot = template.state["rot"]
+            image = transform_cache.get(base_image, image_sf, rot)
+            size = transform_cache.get_size(base_image, zoom.sf, rot)
+            groups = [getattr(game, name) for name in template.groups]
+            kinds.append((template, image, (base_image, image_sf), size, groups))
+
+        rows = zip(self.kinds.tolist(), self.grids.tolist(), self.health.tolist())
+        for kind, (x, y), health in rows:
+            template, image, image_key, size, groups = kinds[kind]
+            sprite = template.cls.__new__(template.cls)
+            state = sprite.__dict__
+            state.update(template.state)
+            for name in template.vectors:
+                state[name] = vec(state[name])
+            sprite.start_grid = vec(x, y)
+            if "health" in state:
+                sprite.health = health
+            sprite.image = image
+            sprite.image_key = image_key
+            sprite.rect = sprite.hit_rect = pg.Rect((0, 0), size)
+            sprite.rect.center = (int(x * tile_size + half), int(y * tile_size + half))
+            sprite.respawn()
+            # Sprite.add without its checks, the groups are all new
+            sprite._layer = template.group_layer
+            pg.sprite.Sprite.__init__(sprite)
+            for group in groups:
+                group.add_internal(sprite)
+                sprite.add_internal(group)
+            sprite._layer = template.layer
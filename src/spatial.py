@@ -0,0 +1,166 @@
+import pygame as pg
+from itertools import count
+from settings import *
+
+
+class SpatialGroup(pg.sprite.Group):
+    # A sprite group that also buckets its sprites' hit_rects into a uniform
+    # grid (one cell per world tile). Collision queries only look at the
+    # sprites in the cells they overlap instead of the whole group.
+    #
+    # Cells are in world space, a zoom scales the rects and the cells together
+    # so nobody changes cells and there's nothing to rebuild.
+    #
+    # Membership is tracked through add_internal / remove_internal, so kill()
+    # keeps the grid up to date; sprites report movement with Shape.moved().
+    def __init__(self, zoom, *sprites):
+        self.zoom = zoom
+        self.cells: dict[tuple[int, int], set] = {}
+        self.sprite_cells: dict = {}
+        self.order: dict = {}
+        self.counter = count()
+        super().__init__(*sprites)
+
+    def get_cell_size(self):
+        # in zoomed pixels, like the rects
+        return TILESIZE * self.zoom.sf
+
+    def get_cell_range(self, rect: pg.Rect):
+        cs = self.get_cell_size()
+        return (
+            int(rect.left // cs),
+            int(rect.top // cs),
+            int(max(rect.left, rect.right - 1) // cs),
+            int(max(rect.top, rect.bottom - 1) // cs),
+        )
+
+    def add_internal(self, sprite, layer=None):
+        super().add_internal(sprite, layer)
+        self.order[sprite] = next(self.counter)
+        self.insert(sprite)
+
+    def remove_internal(self, sprite):
+        super().remove_internal(sprite)
+        self.order.pop(sprite, None)
+        self.discard(sprite)
+
+    def insert(self, sprite):
+        cell_range = self.get_cell_range(sprite.hit_rect)
+        self.sprite_cells[sprite] = cell_range
+        x0, y0, x1, y1 = cell_range
+        for cy in range(y0, y1 + 1):
+            for cx in range(x0, x1 + 1):
+                cell = self.cells.get((cx, cy))
+                if cell is None:
+                    self.cells[(cx, cy)] = cell = set()
+                cell.add(sprite)
+
+    def discard(self, sprite):
+        cell_range = self.sprite_cells.pop(sprite, None)
+        if cell_range is None:
+            return
+        x0, y0, x1, y1 = cell_range
+        for cy in range(y0, y1 + 1):
+            for cx in range(x0, x1 + 1):
+                cell = self.cells.get((cx, cy))
+                if cell is not None:
+                    cell.discard(sprite)
+                    if not cell:
+                        del self.cells[(cx, cy)]
+
+    def move(self, sprite):
+        if self.sprite_cells.get(sprite) != self.get_cell_range(sprite.hit_rect):
+            self.discard(sprite)
+            self.insert(sprite)
+
+    def query_rect(self, rect: pg.Rect) -> list:
+        # broad phase: every sprite whose cells overlap rect, in group order
+        x0, y0, x1, y1 = self.get_cell_range(rect)
+        if (x1 - x0 + 1) * (y1 - y0 + 1) > len(self.cells):
+            found = {s for cell in self.cells.values() for s in cell}
+        else:
+            found = set()
+            for cy in range(y0, y1 + 1):
+                for cx in range(x0, x1 + 1):
+                    cell = self.cells.get((cx, cy))
+                    if cell:
+                        found |= cell
+        if len(found) > 1:
+            return sorted(found, key=self.order.__getitem__)
+        return list(found)
+
+    def query_radius(self, center, radius) -> list:
+        x, y = center
+        bounds = pg.Rect(x - radius, y - radius, radius * 2 + 1, radius * 2 + 1)
+        r2 = radius * radius
+        result = []
+        for sprite in self.query_rect(bounds):
+            rect = sprite.hit_rect
+            # distance from the center to the closest point of the hit_rect
+            dx = x - max(rect.left, min(x, rect.right))
+            dy = y - max(rect.top, min(y, rect.bottom))
+            if dx * dx + dy * dy <= r2:
+                result.append(sprite)
+        return result
+
+    def get_candidates(self, sprite):
+        return self.query_rect(sprite.hit_rect.union(sprite.rect))
+
+    def spritecollide(self, sprite, dokill=False, collided=None) -> list:
+        # same results as pg.sprite.spritecollide(sprite, self, dokill, collided)
+        if collided is None:
+            hits = [s for s in self.get_candidates(sprite) if sprite.rect.colliderect(s.rect)]
+        else:
+            hits = [s for s in self.get_candidates(sprite) if collided(sprite, s)]
+        if dokill:
+            for s in hits:
+                s.kill()
+        return hits
+
+    def spritecollideany(self, sprite, collided=None):
+        for s in self.get_candidates(sprite):
+            if collided is None:
+                if sprite.rect.colliderect(s.rect):
+                    return s
+            elif collided(sprite, s):
+                return s
+        return None
+
+
+def groupcollide(groupa, groupb, dokilla, dokillb, collided=None) -> dict:
+    # same results as pg.sprite.groupcollide; walks the smaller group and
+    # queries the spatial index of the other one
+    crashed = {}
+    if isinstance(groupa, SpatialGroup) and (
+        not isinstance(groupb, SpatialGroup) or len(groupb) < len(groupa)
+    ):
+        if collided is None:
+            swapped = None
+        else:
+            swapped = lambda b, a: collided(a, b)
+        for b in groupb.sprites():
+            hits = groupa.spritecollide(b, False, swapped)
+            if not hits:
+                continue
+            # pygame hands each killed b to the first a (in group order) it hits
+            for a in hits[:1] if dokillb else hits:
+                crashed.setdefault(a, []).append(b)
+            if dokillb:
+                b.kill()
+        # keep pygame's ordering of the result (by a)
+        crashed = {a: crashed[a] for a in sorted(crashed, key=groupa.order.__getitem__)}
+        if dokilla:
+            for a in crashed:
+                a.kill()
+        return crashed
+
+    for a in groupa.sprites():
+        if isinstance(groupb, SpatialGroup):
+            hits = groupb.spritecollide(a, dokillb, collided)
+        else:
+            hits = pg.sprite.spritecollide(a, groupb, dokillb, collided)  # type: ignore
+        if hits:
+            crashed[a] = hits
+            if dokilla:
+                a.kill()
+    return crashed
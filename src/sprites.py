@@ -3,6 +3,7 @@ from random import uniform, choice, randint, random
 from settings import *
 from base import Entity, MotionEntity, Block, sprite_collision
 from tilemap import collide_hit_rect
+from pool import PooledSprite
 import pytweening as tween
 from itertools import chain
 
@@ -37,20 +38,22 @@ def collide_with_walls(sprite, group, dir):
 
 class Player(MotionEntity):
     def __init__(self, game, grid, zoom):
-        super().__init__(grid=grid, image=game.player_img.copy(), zoom=zoom, game=game)
+        super().__init__(grid=grid, image=game.player_img, zoom=zoom, game=game)
         self._layer = PLAYER_LAYER
         pg.sprite.Sprite.__init__(self, game.all_sprites)
 
-        self.last_shot = 0
+        self.last_shot = float("-inf")  # can fire right away
         self.health = PLAYER_HEALTH
         self.weapon = "pistol"
         self.damaged = False
+        self.damage_alpha_value = 255
+        self.flash_image: pg.Surface | None = None
 
     def get_keys(self):
         self.rot_speed = 0
         self.vel = vec(0, 0)
 
-        keys = pg.key.get_pressed()
+        keys = self.game.input.get_pressed()
 
         # if keys[pg.K_LEFT]:
         #     # print("pressed left")
@@ -68,7 +71,7 @@ class Player(MotionEntity):
             self.shoot()
 
     def shoot(self):
-        now = pg.time.get_ticks()
+        now = self.game.time
         if now - self.last_shot > WEAPONS[self.weapon]["rate"]:
             self.last_shot = now
             dir = vec(1, 0).rotate(-self.rot)
@@ -82,19 +85,34 @@ class Player(MotionEntity):
                     WEAPONS[self.weapon]["spread"]
                 )
                 spread = uniform(-_spread, _spread)
-                Bullet(
-                    self.game,
-                    pos,
-                    dir.rotate(spread),
-                    WEAPONS[self.weapon]["damage"],
-                    self.zoom,
-                )
-                snd = choice(self.game.weapon_sounds[self.weapon])
-                if snd.get_num_channels() > 2:
-                    snd.stop()
-                snd.play()
-            print(pos)
-            MuzzleFlash(self.game, pos, self.zoom)
+                if self.game.bullet_engine is not None:
+                    # the engine works in unzoomed world pixels
+                    self.game.bullet_engine.spawn(
+                        pos / self.zoom.sf,
+                        dir.rotate(spread)
+                        * WEAPONS[self.weapon]["bullet_speed"]
+                        * uniform(0.9, 1.1),
+                        WEAPONS[self.weapon]["damage"],
+                        self.weapon,
+                        now,
+                    )
+                else:
+                    self.game.bullet_pool.acquire(
+                        self.game,
+                        pos,
+                        dir.rotate(spread),
+                        WEAPONS[self.weapon]["damage"],
+                        self.zoom,
+                    )
+            # one sound per shot, not per pellet
+            self.game.voices.play(
+                choice(self.game.weapon_sounds[self.weapon]),
+                "weapons",
+                priority=2,
+                pos=self.get_world_center(),
+            )
+            self.game.flash_pool.acquire(self.game, pos, self.zoom)
+            self.game.add_flash_light(pos)
 
     def hit(self):
         self.damaged = True
@@ -105,11 +123,8 @@ class Player(MotionEntity):
         self.get_keys()
         if self.damaged:
             try:
-                self.image.fill(
-                    (255, 255, 255, next(self.damage_alpha)),
-                    special_flags=pg.BLEND_RGBA_MULT,
-                )
-            except:
+                self.damage_alpha_value = next(self.damage_alpha)
+            except StopIteration:
                 self.damaged = False
 
         # self.rot = (self.rot + self.rot_speed * self.game.dt) % 360
@@ -122,49 +137,67 @@ class Player(MotionEntity):
         # collide_with_walls(self, self.game.walls, "y")
         # self.rect.center = self.hit_rect.center
 
+    def draw(self, surface, rect):
+        if not self.damaged:
+            super().draw(surface, rect)
+            return
+        # the flash is applied to a private scratch copy, self.image is shared
+        image = self.get_blit_image(rect)
+        if self.flash_image is None or self.flash_image.get_size() != image.get_size():
+            self.flash_image = pg.Surface(image.get_size(), pg.SRCALPHA)
+        self.flash_image.fill((0, 0, 0, 0))
+        self.flash_image.blit(image, (0, 0))
+        self.flash_image.fill(
+            (255, 255, 255, self.damage_alpha_value),
+            special_flags=pg.BLEND_RGBA_MULT,
+        )
+        surface.blit(self.flash_image, rect)
+
+    def get_draw_state(self):
+        return (self.image, self.damage_alpha_value if self.damaged else None)
+
     def add_health(self, amount):
         self.health += amount
         if self.health > PLAYER_HEALTH:
             self.health = PLAYER_HEALTH
 
 
-class Mob(Entity):
+class Mob(MotionEntity):
     def __init__(self, game, grid, zoom):
-        super().__init__(grid=grid, image=game.mob_img.copy(), zoom=zoom, game=game)
+        super().__init__(grid=grid, image=game.mob_img, zoom=zoom, game=game)
         pg.sprite.Sprite.__init__(self, game.all_sprites, game.mobs)
 
         self._layer = MOB_LAYER
         self.health = MOB_HEALTH
         self.speed = choice(MOB_SPEEDS)
         self.target = game.player
+        # set by Game.los: the target came within DETECT_RADIUS in plain sight
+        self.detected = False
+
+    def respawn(self):
+        self.speed = choice(MOB_SPEEDS)
+        self.target = self.game.player
 
     def avoid_mobs(self):
-        for mob in self.game.mobs:
-            if mob != self:
-                dist = self.get_top_left_coords() - mob.pos
-                if 0 < dist.length() < self.game.zoom.get_linear_update(AVOID_RADIUS):
-                    self.acc += dist.normalize()
+        # self.acc is this mob's separation from its neighbours, computed for the
+        # whole horde at once by Game.crowd (see crowd.py)
+        if self.vel.length_squared() > 0 and self.acc.length_squared() > 0:
+            desired = self.vel.normalize() + self.acc
+            if desired.length_squared() > 0:
+                self.vel = desired.normalize() * self.speed
 
     def update(self):
-        super().update()
-        target_dist = self.target.get_pos() - self.get_pos()
-        if (
-            target_dist.length_squared()
-            < self.game.zoom.get_linear_update(DETECT_RADIUS) ** 2
-        ):
-            if random() < 0.002:
-                choice(self.game.zombie_moan_sounds).play()
-
-            # self.rot = target_dist.angle_to(vec(1, 0))
-            # self.image = pg.transform.rotate(self.game.mob_img, self.rot)
-            # self.rect.center = self.get_coords()
-
-            # self.acc = vec(1, 0).rotate(-self.rot)
-            # self.avoid_mobs()
-            # self.acc.scale_to_length(self.speed)
-            # self.acc += self.vel * -1
-            # self.vel += self.acc * self.game.dt
-            # self.get_coords() += self.vel * self.game.dt + 0.5 * self.acc * self.game.dt**2
+        if self.detected:
+            # the moans load in the background, the list is empty until they're in
+            if random() < 0.002 and self.game.zombie_moan_sounds:
+                sound = choice(self.game.zombie_moan_sounds)
+                self.game.voices.play(sound, "mobs", pos=self.get_world_center())
+
+            if self.game.mob_ai is None:
+                # otherwise already done for the whole horde (parallel.py)
+                self.move_to(self.target, self.speed)
+                self.avoid_mobs()
+                self.move(self.game.dt)
 
             # collisions:
             # self.hit_rect.centerx = self.rect.x
@@ -172,15 +205,17 @@ class Mob(Entity):
             # self.hit_rect.centery = self.rect.y
             # collide_with_walls(self, self.game.walls, "y")
             # self.rect.center = self.hit_rect.center
+        super().update()
 
         if self.health <= 0:
-            choice(self.game.zombie_hit_sounds).play()
-            self.kill()
-            self.game.map_img.blit(
-                self.game.splat, self.get_top_left_coords() - vec(32, 32)
+            x, y = self.get_world_center()
+            self.game.voices.play(
+                choice(self.game.zombie_hit_sounds), "mobs", priority=1, pos=(x, y)
             )
+            self.kill()
+            self.game.add_decal(self.game.splat, x, y, uniform(0, 360))
 
-    def draw_health(self):
+    def draw_health(self, surface, rect):
         if self.health > 60:
             col = GREEN
         elif self.health > 30:
@@ -188,12 +223,18 @@ class Mob(Entity):
         else:
             col = RED
         width = int(self.rect.width * self.health / MOB_HEALTH)
-        self.health_bar = pg.Rect(0, 0, width, 7)
+        self.health_bar = pg.Rect(rect.x, rect.y, width, 7)
         if self.health < MOB_HEALTH:
-            pg.draw.rect(self.image, col, self.health_bar)
+            pg.draw.rect(surface, col, self.health_bar)
+
+    def draw_overlay(self, surface, rect):
+        self.draw_health(surface, rect)
+
+    def get_draw_state(self):
+        return (self.image, self.health)
 
 
-class Bullet(Entity):
+class Bullet(PooledSprite, Entity):
     def __init__(self, game, pos, dir, damage, zoom):
         super().__init__(
             x=pos[0],
@@ -202,29 +243,44 @@ class Bullet(Entity):
             zoom=zoom,
             game=game,
         )
-        pg.sprite.Sprite.__init__(self, game.all_sprites, game.bullets)
         self._layer = BULLET_LAYER
+        pg.sprite.Sprite.__init__(self, game.all_sprites, game.bullets)
         self.game = game
+        self.launch(pos, dir, damage)
+
+    def reset(self, game, pos, dir, damage, zoom):
+        # recycled by game.bullet_pool
+        self.base_image = game.bullet_images[WEAPONS[game.player.weapon]["bullet_size"]]
+        self.entity_update()
+        self.launch(pos, dir, damage)
+
+    def launch(self, pos, dir, damage):
         self.vec_to_center(vec(pos))
+        self.prev_center = self.get_center_coords()
         self.vel = (
             dir
             * self.game.zoom.get_linear_update(
-                WEAPONS[game.player.weapon]["bullet_speed"]
+                WEAPONS[self.game.player.weapon]["bullet_speed"]
             )
             * uniform(0.9, 1.1)
         )
-        self.spawn_time = pg.time.get_ticks()
+        self.spawn_time = self.game.time
         self.damage = damage
 
+    def rescale(self, ratio):
+        self.rescale_center(ratio)
+        self.prev_center = self.get_center_coords()
+        self.vel *= ratio
+
     def update(self):
         # intentional: no super().update()
+        self.prev_center = self.get_center_coords()
         self.vec_to_center(
             vec(self.get_center_coords()) + (vec(self.vel) * self.game.dt)
         )
-        if pg.sprite.spritecollideany(self, self.game.walls):
-            self.kill()
+        # wall hits are raycast for all bullets at once in Game.bullets_hit_walls
         if (
-            pg.time.get_ticks() - self.spawn_time
+            self.game.time - self.spawn_time
             > WEAPONS[self.game.player.weapon]["bullet_lifetime"]
         ):
             self.kill()
@@ -233,17 +289,15 @@ class Bullet(Entity):
 class Obstacle(Block):
     def __init__(self, game, grid, w, h, zoom):
         super().__init__(grid=grid, w=w, h=h, game=game, zoom=zoom)
-        self.groups = game.walls
-        pg.sprite.Sprite.__init__(self, self.groups)
+        pg.sprite.Sprite.__init__(self, game.walls)
 
 
-class MuzzleFlash(Entity):
+class MuzzleFlash(PooledSprite, Entity):
     def __init__(self, game, pos, zoom):
-        size = randint(20, 50)
         super().__init__(
             x=pos[0],
             y=pos[1],
-            image=pg.transform.scale(choice(game.gun_flashes), (size, size)),
+            image=self.get_flash_image(game),
             zoom=zoom,
             game=game,
             relative=True,
@@ -252,11 +306,25 @@ class MuzzleFlash(Entity):
         self._layer = EFFECTS_LAYER
         pg.sprite.Sprite.__init__(self, game.all_sprites)
         self.game = game
-        self.spawn_time = pg.time.get_ticks()
+        self.spawn_time = self.game.time
+
+    def reset(self, game, pos, zoom):
+        # recycled by game.flash_pool
+        self.base_image = self.get_flash_image(game)
+        self.entity_update()
+        self.vec_to_center(vec(pos))
+        self.spawn_time = self.game.time
+
+    def rescale(self, ratio):
+        self.rescale_center(ratio)
+
+    def get_flash_image(self, game):
+        # every size is scaled once up front, see Game.load_data
+        return choice(game.gun_flash_sizes[randint(20, 50)])
 
     def update(self):
         # intentional: no super().update()
-        if pg.time.get_ticks() - self.spawn_time > FLASH_DURATION:
+        if self.game.time - self.spawn_time > FLASH_DURATION:
             self.kill()
 
 
@@ -264,7 +332,7 @@ class Item(Entity):
     def __init__(self, game, grid, type, zoom):
         super().__init__(
             grid=grid,
-            image=game.item_images[type].copy(),
+            image=game.item_images[type],
             zoom=zoom,
             game=game,
         )
@@ -285,6 +353,7 @@ class Item(Entity):
         offset = bob_range * (self.tween(interval) - 0.5)
         self.rect.centery = int(self.rect.y + offset * self.dir)
         self.hit_rect.centery = int(self.rect.y + offset * self.dir)
+        self.moved()
         self.step += BOB_SPEED * self.zoom.sf
         if self.step > bob_range:
             self.step = 0
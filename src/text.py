@@ -0,0 +1,63 @@
+import pygame as pg
+from collections import OrderedDict
+from settings import *
+
+
+class TextRenderer:
+    # Fonts are loaded once per (path, size) and rendered strings are kept in an
+    # LRU keyed by (text, font, color), so HUD and menu text only goes through
+    # the font renderer the first time. Numbers that keep changing (counters)
+    # are glued together from cached per-character glyphs instead of filling
+    # the LRU with one surface per value.
+    def __init__(self, max_surfaces=TEXT_CACHE_SIZE):
+        self.max_surfaces = max_surfaces
+        self.fonts: dict[tuple, pg.font.Font] = {}
+        self.surfaces: OrderedDict[tuple, pg.Surface] = OrderedDict()
+        self.numbers: dict[tuple, tuple] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get_font(self, font_name, size) -> pg.font.Font:
+        key = (font_name, size)
+        font = self.fonts.get(key)
+        if font is None:
+            font = self.fonts[key] = pg.font.Font(font_name, size)
+        return font
+
+    def render(self, text, font_name, size, color) -> pg.Surface:
+        key = (text, font_name, size, tuple(color))
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.surfaces.move_to_end(key)
+            self.hits += 1
+            return surface
+        self.misses += 1
+        surface = self.get_font(font_name, size).render(text, True, color)
+        self.surfaces[key] = surface
+        while len(self.surfaces) > self.max_surfaces:
+            self.surfaces.popitem(last=False)
+        return surface
+
+    def render_number(self, prefix, value, font_name, size, color) -> pg.Surface:
+        # prefix + str(value), built from the cached prefix and digit glyphs; the
+        # result is kept until the value changes
+        key = (prefix, font_name, size, tuple(color))
+        last = self.numbers.get(key)
+        if last is not None and last[0] == value:
+            return last[1]
+        parts = [self.render(prefix, font_name, size, color)] if prefix else []
+        parts += [self.render(char, font_name, size, color) for char in str(value)]
+        width = sum(part.get_width() for part in parts)
+        height = max(part.get_height() for part in parts)
+        surface = pg.Surface((width, height), pg.SRCALPHA)
+        x = 0
+        for part in parts:
+            # glyphs don't overlap, MAX copies their pixels (alpha included) as is
+            surface.blit(part, (x, 0), special_flags=pg.BLEND_RGBA_MAX)
+            x += part.get_width()
+        self.numbers[key] = (value, surface)
+        return surface
+
+    def clear(self):
+        self.surfaces.clear()
+        self.numbers.clear()
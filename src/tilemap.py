@@ -1,7 +1,8 @@
+import numpy as np
 import pygame as pg
-import pytmx
 from settings import *
 from base import Entity, Zoom
+from mapcache import load_map
 
 
 def collide_hit_rect(one, two):
@@ -22,28 +23,22 @@ class Map:
 
 
 class TiledMap:
-    def __init__(self, filename):
+    def __init__(self, filename, use_cache=True):
+        # filename: a .tmx file or a compiled map folder (see mapcache.py)
         self.rect = pg.Rect(0, 0, 0, 0)
-        tm = pytmx.load_pygame(filename, pixelalpha=True)
+        tm = load_map(filename, use_cache)
         self.width = tm.width * tm.tilewidth
         self.height = tm.height * tm.tileheight
         self.tmxdata = tm
 
     def render(self, surface):
         ti = self.tmxdata.get_tile_image_by_gid
-        for layer in self.tmxdata.visible_layers:
-            if isinstance(layer, pytmx.TiledTileLayer):
-                for (
-                    x,
-                    y,
-                    gid,
-                ) in layer.iter_data():
-                    tile = ti(gid)
-                    if tile:
-                        surface.blit(
-                            tile,
-                            (x * self.tmxdata.tilewidth, y * self.tmxdata.tileheight),
-                        )
+        for layer in self.tmxdata.layers:
+            for y, x in zip(*np.nonzero(layer)):
+                surface.blit(
+                    ti(layer[y, x]),
+                    (x * self.tmxdata.tilewidth, y * self.tmxdata.tileheight),
+                )
 
     # TODO: Add a method that allow you to figure out what tile you're on
 
@@ -53,11 +48,6 @@ class TiledMap:
         return temp_surface
 
 
-# TODO: look into the concept of having the entire map loaded, but only adjust what the camera shows
-# this might involve having to rethink how things are rendered (sprites + map)
-# since they're pixel based instead of relatively sized
-
-
 class Camera:
     def __init__(
         self,
@@ -66,7 +56,6 @@ class Camera:
         max_width,
         max_height,
         zoom: Zoom,
-        map_img: pg.Surface,
     ):
         self.camera = pg.Rect(0, 0, width, height)
 
@@ -78,7 +67,6 @@ class Camera:
         self.x = 0
         self.y = 0
         self.zoom: Zoom = zoom
-        self.map_img = map_img
         self.max_width = max_width
         self.max_height = max_height
         self.scaled_rect: pg.Rect | None = None
@@ -97,10 +85,10 @@ class Camera:
 
     def get_map_boundary(self):
         if self.scaled_rect is not None:
-            max_x = (self.map_img.get_width()) * self.zoom.sf
-            max_y = (self.map_img.get_height()) * self.zoom.sf
+            max_x = self.max_width * self.zoom.sf
+            max_y = self.max_height * self.zoom.sf
             return (int(max_x), int(max_y))
-        return (int(self.map_img.get_width()), int(self.map_img.get_height()))
+        return (int(self.max_width), int(self.max_height))
 
     # def get_keys(self):
     #     self.rot_speed = 0
@@ -118,8 +106,8 @@ class Camera:
     def clamp_scroll(self):
         if self.scaled_rect is not None:
             # print(f"scaled_rect: {self.scaled_rect} {self.zoom.sf}")
-            max_x = (self.map_img.get_width() - self.scaled_rect.width) * self.zoom.sf
-            max_y = (self.map_img.get_height() - self.scaled_rect.height) * self.zoom.sf
+            max_x = (self.max_width - self.scaled_rect.width) * self.zoom.sf
+            max_y = (self.max_height - self.scaled_rect.height) * self.zoom.sf
 
             self.x = max(-max_x, self.x)
             self.y = max(-max_y, self.y)
@@ -172,6 +160,7 @@ class Camera:
 
         self.x, self.y = new_topleft
         self.clamp_scroll()
+        self.camera = pg.Rect(self.x, self.y, self.width, self.height)
 
     def zoom_in(self, mouse_vec: pg.math.Vector2, display_rect: pg.Rect):
         self.zoom_by_factor(mouse_vec, display_rect, 2)
@@ -181,9 +170,8 @@ class Camera:
         self.zoom_by_factor(mouse_vec, display_rect, 0.5)
         return True
 
-    def move_camera(self):
+    def move_camera(self, keys):
         cam_move_speed = 2
-        keys = pg.key.get_pressed()
 
         if keys[pg.K_w]:
             self.y += cam_move_speed
@@ -205,6 +193,8 @@ class Camera:
         self.clamp_scroll()
         # print("final topleft:", self.x, self.y)
 
-    def update(self):
-        self.move_camera()
+    def update(self, keys=None):
+        if keys is None:
+            keys = pg.key.get_pressed()
+        self.move_camera(keys)
         self.camera = pg.Rect(self.x, self.y, self.width, self.height)
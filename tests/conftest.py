@@ -0,0 +1,18 @@
+import os
+import sys
+
+# the game's modules import each other by name, as when main.py runs from src/
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import pygame as pg
+import pytest
+
+
+@pytest.fixture
+def screen():
+    # a (headless) display, for anything that converts surfaces
+    pg.display.init()
+    yield pg.display.set_mode((64, 64))
+    pg.display.quit()
@@ -0,0 +1,80 @@
+import numpy as np
+from flowfield import FlowField
+from raycast import WallGrid
+
+MAZE = [
+    ".....",
+    ".###.",
+    "...#.",
+    "##.#.",
+]
+
+
+def make_grid(rows):
+    grid = WallGrid(len(rows[0]), len(rows))
+    for y, row in enumerate(rows):
+        for x, tile in enumerate(row):
+            if tile == "#":
+                grid.add_wall(x, y, 64, 64, 64)
+    return grid
+
+
+def test_distances():
+    grid = make_grid(MAZE)
+    field = FlowField(grid)
+    assert field.update((0, 0))
+    inf = np.inf
+    assert np.array_equal(
+        field.distance,
+        [
+            [0, 1, 2, 3, 4],
+            [1, inf, inf, inf, 5],
+            [2, 3, 4, inf, 6],
+            [inf, inf, 5, inf, 7],
+        ],
+    )
+    assert field.distance_at(-1, 0) == inf
+
+
+def test_follows_the_distances():
+    grid = make_grid(MAZE)
+    field = FlowField(grid)
+    field.update((0, 0))
+    # every open tile's direction leads to the target, one tile closer a step
+    for ty, tx in np.argwhere(np.isfinite(field.distance)):
+        x, y = int(tx), int(ty)
+        while (x, y) != (0, 0):
+            dx, dy = field.direction_at(x, y)
+            assert field.distance_at(x + dx, y + dy) < field.distance_at(x, y)
+            x, y = x + dx, y + dy
+    assert field.direction_at(0, 0) == (0, 0)
+
+
+def test_no_corner_cutting():
+    grid = make_grid(
+        [
+            "...",
+            ".#.",
+            "...",
+        ]
+    )
+    field = FlowField(grid)
+    field.update((0, 0))
+    # diagonally past the wall would cut its corner
+    assert field.direction_at(2, 0) == (-1, 0)
+    assert field.direction_at(0, 2) == (0, -1)
+    assert field.direction_at(1, 2) == (-1, 0)
+    # away from walls diagonal steps are fine
+    field = FlowField(make_grid(["...", "...", "..."]))
+    field.update((2, 2))
+    assert field.direction_at(0, 0) == (1, 1)
+
+
+def test_only_updates_on_change():
+    grid = make_grid(["...", "...", "..."])
+    field = FlowField(grid)
+    assert field.update((1, 1))
+    assert not field.update((1, 1))
+    grid.add_wall(0, 0, 64, 64, 64)
+    assert field.update((1, 1))
+    assert field.distance_at(0, 0) == np.inf
@@ -0,0 +1,16 @@
+import random
+import pygame as pg
+import pytest
+from imagecache import TransformCache
+
+
+@pytest.mark.parametrize("size", [(64, 64), (49, 43), (17, 23), (32, 16)])
+def test_get_size(size):
+    # entity rects are sized with get_size, whether or not the image is made
+    cache = TransformCache()
+    image = pg.Surface(size)
+    rng = random.Random(size[0] * 1000 + size[1])
+    for sf in [0.0625, 0.25, 0.5, 0.7071, 1, 1.3, 2, 4]:
+        for angle in [0, 90, 180, 270, 45] + [rng.uniform(0, 360) for _ in range(20)]:
+            expected = cache.get(image, sf, angle).get_size()
+            assert cache.get_size(image, sf, angle) == expected
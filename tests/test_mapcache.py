@@ -0,0 +1,119 @@
+import json
+import os
+import numpy as np
+import pygame as pg
+import pytest
+import mapcache
+
+TILESET = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "..", "src", "img", "spritesheet_tiles.png")
+)
+
+TMX = """<?xml version="1.0" encoding="UTF-8"?>
+<map version="1.0" orientation="orthogonal" renderorder="right-down" width="3" height="2" tilewidth="64" tileheight="64" nextobjectid="2">
+ <tileset firstgid="1" name="spritesheet_tiles" tilewidth="64" tileheight="64" spacing="10" tilecount="540" columns="27">
+  <image source="{tileset}" width="1988" height="1470"/>
+ </tileset>
+ <layer name="ground" width="3" height="2">
+  <data encoding="csv">
+{data}
+</data>
+ </layer>
+ <objectgroup name="objects">
+  <object id="1" name="player" x="64" y="0" width="64" height="64"/>
+ </objectgroup>
+</map>
+"""
+
+
+def write_tmx(filename, data):
+    with open(filename, "w") as f:
+        f.write(TMX.format(tileset=TILESET, data=data))
+
+
+def get_pixels(compiled):
+    return [pg.image.tobytes(tile, "RGBA") for tile in compiled.tiles[1:]]
+
+
+@pytest.fixture
+def tmx(tmp_path, screen):
+    filename = str(tmp_path / "level.tmx")
+    write_tmx(filename, "1,2,3,\n0,2,1")
+    mapcache.loaded_maps.clear()
+    yield filename
+    mapcache.loaded_maps.clear()
+
+
+def test_compile_then_load(tmx, monkeypatch):
+    compiled = mapcache.load_map(tmx)
+    folder = mapcache.get_cache_folder(tmx)
+    assert os.path.exists(os.path.join(folder, "meta.json"))
+
+    # a fresh cache loads without going near pytmx
+    mapcache.loaded_maps.clear()
+    monkeypatch.setattr(mapcache, "compile_tmx", None)
+    cached = mapcache.load_map(tmx)
+    assert cached is not compiled
+    assert (cached.width, cached.height) == (3, 2)
+    assert (cached.tilewidth, cached.tileheight) == (64, 64)
+    assert np.array_equal(cached.layers, compiled.layers)
+    assert np.array_equal(cached.layers, [[[1, 2, 3], [0, 2, 1]]])
+    assert get_pixels(cached) == get_pixels(compiled)
+    assert [(obj.name, obj.x, obj.y) for obj in cached.objects] == [("player", 64, 0)]
+
+
+def test_touched_but_unchanged(tmx, monkeypatch):
+    mapcache.load_map(tmx)
+    folder = mapcache.get_cache_folder(tmx)
+    mtime = os.stat(tmx).st_mtime_ns + 10**9
+    os.utime(tmx, ns=(mtime, mtime))
+
+    mapcache.loaded_maps.clear()
+    monkeypatch.setattr(mapcache, "compile_tmx", None)
+    mapcache.load_map(tmx)
+    assert mapcache.read_meta(folder)["source"]["mtime"] == mtime
+
+
+def test_rebuilt_when_changed(tmx):
+    old = mapcache.load_map(tmx)
+    mtime = os.stat(tmx).st_mtime_ns + 10**9
+    write_tmx(tmx, "3,3,3,\n0,0,0")
+    os.utime(tmx, ns=(mtime, mtime))
+
+    new = mapcache.load_map(tmx)
+    assert new is not old
+    assert np.array_equal(new.layers, [[[1, 1, 1], [0, 0, 0]]])
+    meta = mapcache.read_meta(mapcache.get_cache_folder(tmx))
+    assert meta["source"]["mtime"] == mtime
+
+
+def test_without_cache(tmx, monkeypatch):
+    cached = mapcache.load_map(tmx)
+    compiled = mapcache.load_map(tmx, use_cache=False)
+    assert compiled is not cached
+    assert np.array_equal(compiled.layers, cached.layers)
+    # still parsed from the .tmx every time, and not kept
+    assert mapcache.load_map(tmx, use_cache=False) is not compiled
+    assert mapcache.loaded_maps[os.path.abspath(tmx)][1] is cached
+    monkeypatch.setattr(mapcache, "compile_tmx", None)
+    with pytest.raises(TypeError):
+        mapcache.load_map(tmx, use_cache=False)
+
+
+def test_load_cache_without_meta(tmp_path):
+    folder = str(tmp_path)
+    with pytest.raises(ValueError) as error:
+        mapcache.load_cache(folder)
+    assert folder in str(error.value)
+    assert "cache version {}".format(mapcache.CACHE_VERSION) in str(error.value)
+
+
+def test_load_cache_other_version(tmx):
+    mapcache.load_map(tmx)
+    folder = mapcache.get_cache_folder(tmx)
+    meta = mapcache.read_meta(folder)
+    meta["version"] = mapcache.CACHE_VERSION + 1
+    with open(os.path.join(folder, "meta.json"), "w") as f:
+        json.dump(meta, f)
+    with pytest.raises(ValueError):
+        mapcache.load_cache(folder)
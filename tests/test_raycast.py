@@ -0,0 +1,62 @@
+import numpy as np
+from raycast import WallGrid, raycast
+
+
+def make_grid():
+    # ..........
+    # ...#......
+    # ...#...##.
+    # ..........
+    grid = WallGrid(10, 4)
+    grid.add_wall(3, 1, 64, 128, 64)
+    grid.add_wall(7, 2, 128, 64, 64)
+    return grid
+
+
+def test_add_wall():
+    grid = make_grid()
+    assert grid.version == 2
+    assert np.array_equal(np.argwhere(grid.solid), [[1, 3], [2, 3], [2, 7], [2, 8]])
+    assert grid.is_solid(3, 2) and not grid.is_solid(4, 2)
+    # outside of the map
+    assert grid.is_solid(-1, 0) and grid.is_solid(10, 0)
+
+
+def test_stops_at_first_wall():
+    grid = make_grid()
+    # along row 2, from either end
+    hit, t = raycast(grid, [(0.5, 2.5), (9.5, 2.5)], [(9.5, 2.5), (0.5, 2.5)])
+    assert hit.tolist() == [True, True]
+    assert np.allclose(t, [2.5 / 9, 0.5 / 9])
+
+
+def test_misses():
+    grid = make_grid()
+    starts = [(0.5, 0.5), (0.5, 3.5), (4.5, 1.5)]
+    ends = [(9.5, 0.5), (9.5, 3.5), (6.5, 2.5)]
+    hit, t = raycast(grid, starts, ends)
+    assert not hit.any()
+    assert np.isinf(t).all()
+
+
+def test_diagonal():
+    grid = make_grid()
+    # through (3, 0) and (4, 1) without touching the wall at (3, 1)...
+    hit, _ = raycast(grid, [(2.5, 0.2)], [(4.8, 1.2)])
+    assert not hit[0]
+    # ...but one crossing into it stops there
+    hit, t = raycast(grid, [(1.5, 0.5)], [(5.5, 2.5)])
+    assert hit[0]
+    assert np.isclose(t[0], 1.5 / 4)
+
+
+def test_starts_inside_a_wall():
+    grid = make_grid()
+    hit, t = raycast(grid, [(3.5, 1.5)], [(0.5, 1.5)])
+    assert hit[0] and t[0] == 0
+
+
+def test_short_ray_in_one_cell():
+    grid = make_grid()
+    hit, t = raycast(grid, [(5.1, 2.1)], [(5.9, 2.9)])
+    assert not hit[0] and np.isinf(t[0])
@@ -0,0 +1,92 @@
+import random
+import pygame as pg
+import pytest
+from base import Zoom
+from spatial import SpatialGroup, groupcollide
+
+
+class Box(pg.sprite.Sprite):
+    def __init__(self, rect):
+        super().__init__()
+        self.rect = self.hit_rect = pg.Rect(rect)
+
+
+def random_rect(rng):
+    x, y = rng.randrange(-50, 1000), rng.randrange(-50, 700)
+    return x, y, rng.randrange(1, 150), rng.randrange(1, 150)
+
+
+def hit_rect_collide(a, b):
+    return a.hit_rect.colliderect(b.hit_rect)
+
+
+@pytest.fixture
+def boxes():
+    rng = random.Random(0)
+    zoom = Zoom()
+    group = SpatialGroup(zoom, *[Box(random_rect(rng)) for _ in range(200)])
+    plain = pg.sprite.Group(*group.sprites())
+    probes = [Box(random_rect(rng)) for _ in range(100)]
+    return rng, zoom, group, plain, probes
+
+
+def check_queries(group, plain, probes):
+    for probe in probes:
+        for collided in (None, hit_rect_collide):
+            expected = pg.sprite.spritecollide(probe, plain, False, collided)
+            assert group.spritecollide(probe, False, collided) == expected
+            expected = pg.sprite.spritecollideany(probe, plain, collided)
+            assert group.spritecollideany(probe, collided) is expected
+
+
+def test_spritecollide(boxes):
+    _, _, group, plain, probes = boxes
+    check_queries(group, plain, probes)
+
+
+def test_spritecollide_after_moving(boxes):
+    rng, _, group, plain, probes = boxes
+    for box in group.sprites()[::3]:
+        box.rect = box.hit_rect = pg.Rect(random_rect(rng))
+        group.move(box)
+    check_queries(group, plain, probes)
+
+
+def zoom_boxes(zoom, factor, group, probes):
+    # what Game.update_zoom does: everything is rescaled and reports its move
+    old_sf = zoom.sf
+    zoom.zoom_factor = factor
+    zoom.calculate_sf()
+    ratio = zoom.sf / old_sf
+    for box in group.sprites() + probes:
+        x, y, w, h = box.rect
+        box.rect = box.hit_rect = pg.Rect(x * ratio, y * ratio, w * ratio, h * ratio)
+        if box in group:
+            group.move(box)
+
+
+@pytest.mark.parametrize("factor", [-2, 0.5, -0.75])
+def test_spritecollide_after_zoom(boxes, factor):
+    _, zoom, group, plain, probes = boxes
+    zoom_boxes(zoom, factor, group, probes)
+    check_queries(group, plain, probes)
+
+
+def test_spritecollide_dokill(boxes):
+    _, _, group, plain, probes = boxes
+    for probe in probes:
+        expected = pg.sprite.spritecollide(probe, plain, False)
+        assert group.spritecollide(probe, True) == expected
+        assert not any(box.alive() for box in expected)
+        assert len(group) == len(plain)
+
+
+def test_groupcollide(boxes):
+    _, zoom, group, plain, probes = boxes
+    others = SpatialGroup(zoom, *probes)
+    for a, b in ((group, others), (others, group), (group, pg.sprite.Group(probes))):
+        expected = pg.sprite.groupcollide(
+            pg.sprite.Group(a.sprites()), pg.sprite.Group(b.sprites()), False, False
+        )
+        # same hits, in the same order
+        assert list(groupcollide(a, b, False, False).items()) == list(expected.items())
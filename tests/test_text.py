@@ -0,0 +1,54 @@
+import os
+import pygame as pg
+import pytest
+from settings import *
+from text import TextRenderer
+
+IMG_FOLDER = os.path.join(os.path.dirname(__file__), "..", "src", "img")
+HUD_FONT = os.path.join(IMG_FOLDER, "Impacted2.0.ttf")
+
+
+@pytest.fixture(autouse=True)
+def fonts():
+    pg.font.init()
+    yield
+    pg.font.quit()
+
+
+def same_pixels(a: pg.Surface, b: pg.Surface):
+    if a.get_size() != b.get_size():
+        return False
+    return pg.image.tobytes(a, "RGBA") == pg.image.tobytes(b, "RGBA")
+
+
+@pytest.mark.parametrize("font_name", [None, HUD_FONT])
+def test_render(font_name):
+    text = TextRenderer()
+    font = pg.font.Font(font_name, 30)
+    for string, color in [("Zombies", WHITE), ("GAME OVER", RED), ("Zombies", RED)]:
+        expected = font.render(string, True, color)
+        assert same_pixels(text.render(string, font_name, 30, color), expected)
+        # the second time it comes from the cache
+        assert same_pixels(text.render(string, font_name, 30, color), expected)
+    assert (text.hits, text.misses) == (3, 3)
+
+
+def test_render_number():
+    # glued together from glyphs: the same as rendering the whole string for a
+    # font without kerning, like the HUD's
+    text = TextRenderer()
+    font = pg.font.Font(HUD_FONT, 30)
+    for value in [0, 7, 42, 42, 305, 1000, 9]:
+        expected = font.render("Zombies: {}".format(value), True, WHITE)
+        surface = text.render_number("Zombies: ", value, HUD_FONT, 30, WHITE)
+        assert same_pixels(surface, expected)
+
+
+def test_lru():
+    text = TextRenderer(max_surfaces=2)
+    first = text.render("a", None, 20, WHITE)
+    text.render("b", None, 20, WHITE)
+    assert text.render("a", None, 20, WHITE) is first
+    text.render("c", None, 20, WHITE)
+    # "b" was the least recently used
+    assert [key[0] for key in text.surfaces] == ["a", "c"]